@@ -1,112 +1,368 @@
-from flask import Flask, render_template, request, redirect, url_for
+"""
+HIRE platform application.
+
+create_app() builds a configured application without touching the
+database, so importing this module, forking workers and running tests
+costs no schema reflection or queries. The schema and the initial data
+are set up explicitly, once per database:
+
+    flask init-db    create missing tables, upgrade existing ones and add
+                     the initial service categories
+    flask seed-db    add the initial service categories only
+
+`python app.py` runs init_db() before starting the development server;
+`flask run` and WSGI servers serve the application built in wsgi.py
+(wsgi:app).
+"""
+
+from flask import Flask, current_app, render_template, request
+from flask.cli import with_appcontext
 from db_setup import db
 import os
-import logging
-from logging.handlers import RotatingFileHandler
 from dotenv import load_dotenv
+import click
+
+import sms_queue
+import geocoding
+import log_setup
+import request_metrics
+from geocoding import DEFAULT_TIMEOUT as GEOCODER_TIMEOUT
+from password_pool import DEFAULT_QUEUE, DEFAULT_WORKERS, RETRY_AFTER_SECONDS, PoolBusy
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Initialize Flask app
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'hire-platform-secret-key')
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URI', 'sqlite:///hire.db')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Service categories of a new database: (name, description)
+INITIAL_CATEGORIES = [
+    ("Plumbing", "All plumbing services including repairs, installations, and maintenance"),
+    ("Electrical", "Electrical repairs, installations, and maintenance services"),
+    ("Cleaning", "Professional home cleaning services including regular cleaning, deep cleaning, and specialized cleaning"),
+    ("Carpentry", "Woodwork, furniture repairs, and custom woodworking services"),
+    ("Painting", "Interior and exterior painting services for homes and businesses"),
+    ("Landscaping", "Garden maintenance, lawn care, and landscaping design services"),
+    ("HVAC", "Heating, ventilation, and air conditioning installation and repairs")
+]
 
-# Add to existing app.py after initializing the app
+def load_config(app):
+    """Read the application settings from the environment"""
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'hire-platform-secret-key')
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URI', 'sqlite:///hire.db')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    
+    # Send queued SMS in a background thread (set SMS_WORKER_ENABLED=False when
+    # running `flask sms-worker` as a separate process instead)
+    app.config['SMS_WORKER_ENABLED'] = os.getenv('SMS_WORKER_ENABLED', 'True').lower() == 'true'
+    
+    # Address geocoding (see geocoding.py)
+    app.config['GEOCODER'] = os.getenv('GEOCODER', 'nominatim')
+    app.config['GEOCODER_TIMEOUT'] = float(os.getenv('GEOCODER_TIMEOUT', GEOCODER_TIMEOUT))
+    # Geocode pending addresses in a background thread of this process. The
+    # geocoder's rate limit is per process, so set this in one process only
+    # (e.g. the development server), or run `flask geocode-worker` instead
+    app.config['GEOCODE_IN_BACKGROUND'] = os.getenv('GEOCODE_IN_BACKGROUND', 'False').lower() == 'true'
+    
+    # Password hashing pool (see password_pool.py)
+    app.config['PASSWORD_POOL_WORKERS'] = int(os.getenv('PASSWORD_POOL_WORKERS', DEFAULT_WORKERS))
+    app.config['PASSWORD_POOL_QUEUE'] = int(os.getenv('PASSWORD_POOL_QUEUE', DEFAULT_QUEUE))
+    if os.getenv('PASSWORD_HASH_ITERATIONS'):
+        app.config['PASSWORD_HASH_ITERATIONS'] = int(os.getenv('PASSWORD_HASH_ITERATIONS'))
+    
+    # Logging pipeline (see log_setup.py)
+    app.config['LOG_FILE'] = os.getenv('LOG_FILE', log_setup.DEFAULT_LOG_FILE)
+    app.config['LOG_MAX_BYTES'] = int(os.getenv('LOG_MAX_BYTES', log_setup.DEFAULT_MAX_BYTES))
+    app.config['LOG_BACKUP_COUNT'] = int(os.getenv('LOG_BACKUP_COUNT', log_setup.DEFAULT_BACKUP_COUNT))
+    app.config['LOG_LEVEL'] = os.getenv('LOG_LEVEL', log_setup.DEFAULT_LEVEL)
+    app.config['LOG_LEVELS'] = os.getenv('LOG_LEVELS', '')
+    app.config['LOG_QUEUE_SIZE'] = int(os.getenv('LOG_QUEUE_SIZE', log_setup.DEFAULT_QUEUE_SIZE))
+    
+    # Request instrumentation and /metrics (see request_metrics.py); the
+    # endpoint is off unless enabled, and then requires METRICS_TOKEN if set
+    app.config['METRICS_ENABLED'] = os.getenv('METRICS_ENABLED', 'False').lower() == 'true'
+    app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN')
+    app.config['METRICS_WINDOW'] = int(os.getenv('METRICS_WINDOW', request_metrics.DEFAULT_WINDOW))
+    app.config['SLOW_REQUEST_MS'] = float(os.getenv('SLOW_REQUEST_MS', request_metrics.DEFAULT_SLOW_REQUEST_MS))
 
-# Initialize SQLAlchemy with the app
-db.init_app(app)
+def configure_logging(app):
+    """
+    Send every logger's records through the queue-based pipeline
+    
+    Must run before app.logger is first used, so Flask sees the pipeline's
+    handler and doesn't add its own stderr handler.
+    """
+    log_setup.configure_logging(app.config)
+    app.logger.info('HIRE Platform startup')
 
-# Add context processor to make environment variables available to templates
-@app.context_processor
-def inject_env_variables():
-    return dict(
-        GOOGLE_MAPS_API_KEY=os.getenv('GOOGLE_MAPS_API_KEY')
+def create_app(config=None):
+    """
+    Create and configure an application
+    
+    No database work is done here: run `flask init-db` (or init_db() in
+    an application context) once to set a database up.
+    
+    Args:
+        config: Settings overriding the environment (optional)
+    
+    Returns:
+        Flask application
+    """
+    app = Flask(__name__)
+    load_config(app)
+    if config:
+        app.config.update(config)
+    
+    # Initialize SQLAlchemy with the app
+    db.init_app(app)
+    configure_logging(app)
+    
+    # Background workers start on their first job, never at startup
+    sms_queue.init_app(app)
+    geocoding.init_app(app)
+    
+    # Timings of every request, reported on /metrics when enabled
+    request_metrics.init_app(app)
+    
+    from routes import (
+        main_bp, customer_bp, provider_bp,
+        service_bp, booking_bp, payment_bp
     )
+    
+    # Register blueprints with their prefixes
+    app.register_blueprint(main_bp)
+    app.register_blueprint(customer_bp, url_prefix='/customer')
+    app.register_blueprint(provider_bp, url_prefix='/provider')
+    app.register_blueprint(service_bp, url_prefix='/services')
+    app.register_blueprint(booking_bp, url_prefix='/booking')
+    app.register_blueprint(payment_bp, url_prefix='/payment')
+    
+    register_error_handlers(app)
+    app.context_processor(inject_env_variables)
+    app.context_processor(utility_processor)
+    
+    for command in (
+        init_db_command, seed_db_command, reconcile_ratings_command,
+        purge_otps_command, sms_worker_command, geocode_worker_command,
+        geocode_backfill_command
+    ):
+        app.cli.add_command(command)
+    
+    return app
 
-# Configure logging
-if not os.path.exists('logs'):
-    os.mkdir('logs')
+def create_schema():
+    """
+    Create missing database tables and add missing columns and indexes
+    
+    Returns:
+        List of "table.column" and index names that were added
+    """
+    from migrations import upgrade_schema
+    import models  # noqa: F401 (defines the tables)
+    
+    current_app.logger.info('Creating database tables')
+    db.create_all()
+    return upgrade_schema()
 
-file_handler = RotatingFileHandler('logs/hire_platform.log', maxBytes=10240, backupCount=10)
-file_handler.setFormatter(logging.Formatter(
-    '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
-))
-file_handler.setLevel(logging.INFO)
+def seed_db():
+    """
+    Add the initial service categories if there are none
+    
+    Returns:
+        Number of categories added
+    """
+    from catalog import get_categories
+    from models import ServiceCategory
+    
+    if get_categories():
+        return 0
+    
+    current_app.logger.info('Adding initial service categories')
+    categories = [
+        ServiceCategory(name=name, description=description)
+        for name, description in INITIAL_CATEGORIES
+    ]
+    db.session.add_all(categories)
+    db.session.commit()
+    current_app.logger.info(f'Added {len(categories)} initial service categories')
+    return len(categories)
 
-app.logger.addHandler(file_handler)
-app.logger.setLevel(logging.INFO)
-app.logger.info('HIRE Platform startup')
+def init_db():
+    """
+    Create database tables and add initial data
+    
+    Returns:
+        (schema changes, categories added) as returned by create_schema()
+        and seed_db()
+    """
+    return create_schema(), seed_db()
 
-# Import models after initializing db
-from models import (
-    Customer, Provider, ServiceCategory, 
-    ProviderCategory, Address, Booking, 
-    Payment, OTPVerification
-)
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """Create or upgrade the schema and add initial data (safe to re-run)"""
+    added, categories = init_db()
+    if added:
+        click.echo(f'Upgraded the schema: {", ".join(added)}')
+    else:
+        click.echo('Database schema is up to date')
+    if categories:
+        click.echo(f'Added {categories} service categories')
+
+@click.command('seed-db')
+@with_appcontext
+def seed_db_command():
+    """Add the initial service categories to an empty database"""
+    added = seed_db()
+    if added:
+        click.echo(f'Added {added} service categories')
+    else:
+        click.echo('Service categories already exist')
+
+@click.command('reconcile-ratings')
+@click.option('--dry-run', is_flag=True, help='Only report drifted providers')
+@with_appcontext
+def reconcile_ratings_command(dry_run):
+    """Recompute provider rating aggregates and repair any drift"""
+    from services import reconcile_provider_ratings
+    
+    drifted = reconcile_provider_ratings(repair=not dry_run)
+    if not drifted:
+        click.echo('Rating aggregates are consistent')
+    elif dry_run:
+        click.echo(f'{len(drifted)} providers have drifted rating aggregates: {drifted}')
+    else:
+        click.echo(f'Repaired rating aggregates for {len(drifted)} providers')
+
+@click.command('purge-otps')
+@click.option('--batch-size', default=1000, show_default=True, help='Records deleted per transaction')
+@with_appcontext
+def purge_otps_command(batch_size):
+    """Delete expired OTP records and the SMS jobs that carried them (run periodically, e.g. hourly from cron)"""
+    from services import purge_expired_otps
+    
+    deleted = purge_expired_otps(batch_size=batch_size)
+    click.echo(f'Deleted {deleted} expired OTP records')
+    
+    deleted = sms_queue.purge_finished_jobs(batch_size=batch_size)
+    click.echo(f'Deleted {deleted} sent or failed SMS jobs')
+
+@click.command('sms-worker')
+@click.option('--once', is_flag=True, help='Send the jobs that are due and exit')
+@with_appcontext
+def sms_worker_command(once):
+    """Run the SMS delivery queue in the foreground"""
+    from sms_transport import get_transport
+    
+    if once:
+        handled = sms_queue.process_due_jobs()
+        click.echo(f'Handled {handled} SMS jobs')
+        transport = get_transport()
+        if transport is not None:
+            click.echo(f'Transport metrics: {transport.metrics.snapshot()}')
+        return
+    
+    worker = sms_queue.DeliveryWorker(current_app._get_current_object())
+    click.echo('SMS delivery worker running (Ctrl+C to stop)')
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        pass
+
+@click.command('geocode-worker')
+@click.option('--once', is_flag=True, help='Geocode the pending addresses and exit')
+@with_appcontext
+def geocode_worker_command(once):
+    """Geocode pending addresses in the foreground"""
+    from geocoding import GeocodeError, GeocodeWorker, fill_pending_addresses
+    
+    if once:
+        done = 0
+        try:
+            while True:
+                geocoded = fill_pending_addresses()
+                if not geocoded:
+                    break
+                done += geocoded
+        except GeocodeError as e:
+            raise click.ClickException(f'{str(e)} ({done} addresses geocoded)')
+        click.echo(f'Geocoded {done} pending addresses')
+        return
+    
+    worker = GeocodeWorker(current_app._get_current_object())
+    click.echo('Geocoding worker running (Ctrl+C to stop)')
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        pass
+
+@click.command('geocode-backfill')
+@click.option('--geocoder', 'geocoder_name', type=click.Choice(['nominatim', 'postal-code']),
+              default='nominatim', show_default=True,
+              help='Geocoding service, or offline postal district centres')
+@click.option('--chunk-size', default=500, show_default=True, help='Addresses per transaction')
+@click.option('--workers', default=4, show_default=True, help='Concurrent geocoder requests')
+@click.option('--rate', default=1.0, show_default=True, help='Maximum geocoder requests per second')
+@click.option('--checkpoint', type=click.Path(dir_okay=False), default=None,
+              help='Checkpoint file [default: instance/geocode_backfill.json]')
+@click.option('--restart', is_flag=True, help='Ignore the checkpoint and start from the first address')
+@with_appcontext
+def geocode_backfill_command(geocoder_name, chunk_size, workers, rate, checkpoint, restart):
+    """Geocode all addresses without exact coordinates (resumable)"""
+    from geocode_backfill import backfill_addresses
+    from geocoding import GeocodeError, NominatimGeocoder, PostalCodeGeocoder
+    
+    if geocoder_name == 'postal-code':
+        geocoder = PostalCodeGeocoder()
+    else:
+        # The pool's --rate limit replaces the geocoder's own spacing
+        geocoder = NominatimGeocoder(timeout=current_app.config['GEOCODER_TIMEOUT'], min_interval=0)
+    
+    checkpoint = checkpoint or os.path.join(current_app.instance_path, 'geocode_backfill.json')
+    if restart and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    os.makedirs(os.path.dirname(os.path.abspath(checkpoint)), exist_ok=True)
+    
+    try:
+        stats = backfill_addresses(
+            geocoder, chunk_size=chunk_size, workers=workers, rate=rate, checkpoint=checkpoint,
+            progress=lambda stats: click.echo(f'{stats.scanned} addresses done (last ID {stats.last_id})')
+        )
+    except GeocodeError as e:
+        raise click.ClickException(f'{str(e)}. Run the command again to resume.')
+    
+    click.echo(
+        f'Backfill complete: {stats.scanned} addresses, {stats.unique} distinct, '
+        f'{stats.cached} answered from cache, {stats.requested} geocoder requests, '
+        f'{stats.exact} exact, {stats.approximate} approximate'
+    )
+
+def register_error_handlers(app):
+    """Register the error pages of an application"""
+    @app.errorhandler(404)
+    def not_found_error(error):
+        app.logger.info(f'404 error: {request.url}')
+        return render_template('errors/404.html'), 404
+    
+    @app.errorhandler(500)
+    def internal_error(error):
+        app.logger.error(f'500 error: {str(error)}')
+        db.session.rollback()  # Roll back session in case of database error
+        return render_template('errors/500.html'), 500
+    
+    @app.errorhandler(403)
+    def forbidden_error(error):
+        app.logger.info(f'403 error: {request.url}')
+        return render_template('errors/403.html'), 403
+    
+    @app.errorhandler(PoolBusy)
+    def service_unavailable_error(error):
+        app.logger.warning(f'503 error: {request.url} ({str(error)})')
+        return render_template('errors/503.html'), 503, {'Retry-After': str(RETRY_AFTER_SECONDS)}
+
+def inject_env_variables():
+    """Make environment variables available to templates"""
+    return dict(
+        GOOGLE_MAPS_API_KEY=os.getenv('GOOGLE_MAPS_API_KEY')
+    )
 
-# Function to initialize database
-def init_db():
-    """Create database tables and add initial data"""
-    app.logger.info('Creating database tables')
-    
-    # Add initial service categories if none exist
-    if ServiceCategory.query.count() == 0:
-        app.logger.info('Adding initial service categories')
-        categories = [
-            ServiceCategory(name="Plumbing", description="All plumbing services including repairs, installations, and maintenance"),
-            ServiceCategory(name="Electrical", description="Electrical repairs, installations, and maintenance services"),
-            ServiceCategory(name="Cleaning", description="Professional home cleaning services including regular cleaning, deep cleaning, and specialized cleaning"),
-            ServiceCategory(name="Carpentry", description="Woodwork, furniture repairs, and custom woodworking services"),
-            ServiceCategory(name="Painting", description="Interior and exterior painting services for homes and businesses"),
-            ServiceCategory(name="Landscaping", description="Garden maintenance, lawn care, and landscaping design services"),
-            ServiceCategory(name="HVAC", description="Heating, ventilation, and air conditioning installation and repairs")
-        ]
-        db.session.add_all(categories)
-        db.session.commit()
-        app.logger.info(f'Added {len(categories)} initial service categories')
-
-# Initialize database
-with app.app_context():
-    db.create_all()
-    init_db()
-
-
-
-# Register blueprints
-from routes import (
-    main_bp, customer_bp, provider_bp, 
-    service_bp, booking_bp, payment_bp
-)
-
-# Register blueprints with their prefixes
-app.register_blueprint(main_bp)
-app.register_blueprint(customer_bp, url_prefix='/customer')
-app.register_blueprint(provider_bp, url_prefix='/provider')
-app.register_blueprint(service_bp, url_prefix='/services')
-app.register_blueprint(booking_bp, url_prefix='/booking')
-app.register_blueprint(payment_bp, url_prefix='/payment')
-
-# Error handlers
-@app.errorhandler(404)
-def not_found_error(error):
-    app.logger.info(f'404 error: {request.url}')
-    return render_template('errors/404.html'), 404
-
-@app.errorhandler(500)
-def internal_error(error):
-    app.logger.error(f'500 error: {str(error)}')
-    db.session.rollback()  # Roll back session in case of database error
-    return render_template('errors/500.html'), 500
-
-@app.errorhandler(403)
-def forbidden_error(error):
-    app.logger.info(f'403 error: {request.url}')
-    return render_template('errors/403.html'), 403
-
-@app.context_processor
 def utility_processor():
     """Add utility functions to Jinja templates"""
     def format_datetime(value, format='%d %b, %Y %H:%M'):
@@ -127,4 +383,11 @@ def utility_processor():
     )
 
 if __name__ == '__main__':
-    app.run(debug=os.getenv('FLASK_DEBUG', 'False').lower() == 'true', host='0.0.0.0', port=int(os.getenv('PORT', 5000)))
\ No newline at end of file
+    # Built here rather than at import: spawned password pool workers
+    # re-import this script, and must not set up an application of their own
+    app = create_app()
+    
+    # The development server sets its database up first
+    with app.app_context():
+        init_db()
+    app.run(debug=os.getenv('FLASK_DEBUG', 'False').lower() == 'true', host='0.0.0.0', port=int(os.getenv('PORT', 5000)))
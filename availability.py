@@ -0,0 +1,404 @@
+"""
+In-memory provider availability engine.
+
+Each provider's booked time slots for a day are kept as a bitmask (bit i
+set = TIME_SLOTS[i] taken), and for every day/slot pair a provider bitset
+answers "who is free at this time". Providers get consecutive bit
+positions in the order the engine first sees them, so the bitsets stay as
+wide as the number of providers rather than the largest provider ID.
+Bookings for a date are loaded from the database in one query the first
+time the date is asked for. After that, the masks are kept up to date
+from booking and provider changes committed in this process, so lookups
+don't touch the database. Bookings made by other processes are not seen
+that way, so a loaded date (and provider availability) is read again
+once it is older than AVAILABILITY_CACHE_TTL seconds (default 10).
+"""
+
+import logging
+import threading
+import time
+from datetime import date as date_type, datetime, timedelta
+
+from flask import current_app
+
+from db_setup import db
+from model_events import on_change
+from models import Booking, Provider
+
+logger = logging.getLogger(__name__)
+
+# Bookable time slots (9 AM to 6 PM in 1-hour increments, lunch excluded)
+TIME_SLOTS = [
+    '09:00-10:00', '10:00-11:00', '11:00-12:00',
+    '13:00-14:00', '14:00-15:00', '15:00-16:00',
+    '16:00-17:00', '17:00-18:00'
+]
+
+ALL_SLOTS_MASK = (1 << len(TIME_SLOTS)) - 1
+
+DEFAULT_TTL = 10
+
+# Booking statuses that hold on to their time slot
+ACTIVE_STATUSES = Booking.ACTIVE_STATUSES
+
+# Slots are matched on their start time, so '10:00' and '10:00-11:00' are
+# the same slot
+_SLOT_INDEX = {slot[:5]: i for i, slot in enumerate(TIME_SLOTS)}
+
+
+def slot_index(time_slot):
+    """
+    Get the bit position of a time slot
+
+    Args:
+        time_slot: Slot string, either 'HH:MM' or 'HH:MM-HH:MM'
+
+    Returns:
+        Index into TIME_SLOTS, or None for an unknown slot
+    """
+    if not time_slot:
+        return None
+    return _SLOT_INDEX.get(time_slot[:5])
+
+
+def canonical_slot(time_slot):
+    """
+    Get the stored form of a time slot
+
+    Args:
+        time_slot: Slot string, either 'HH:MM' or 'HH:MM-HH:MM'
+
+    Returns:
+        The matching 'HH:MM-HH:MM' entry of TIME_SLOTS, or None for an
+        unknown slot
+    """
+    index = slot_index(time_slot)
+    return None if index is None else TIME_SLOTS[index]
+
+
+def slots_from_mask(mask):
+    """List the time slots whose bits are set in a mask"""
+    return [slot for i, slot in enumerate(TIME_SLOTS) if mask & (1 << i)]
+
+
+def _bits(bitset):
+    """Yield the positions of the set bits in an integer"""
+    while bitset:
+        low = bitset & -bitset
+        yield low.bit_length() - 1
+        bitset ^= low
+
+
+def _ttl():
+    return current_app.config.get('AVAILABILITY_CACHE_TTL', DEFAULT_TTL)
+
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date_type):
+        return value
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+class AvailabilityEngine:
+    """Bitmask index of booked slots per provider and day"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        """Forget everything; data is reloaded from the database on demand"""
+        with self._lock:
+            # provider_id -> bit position in the provider bitsets, and back
+            self._provider_bits = {}
+            self._bit_providers = []
+            # date -> monotonic time its bookings were loaded
+            self._loaded_dates = {}
+            # (provider_id, date) -> booked slot mask
+            self._booked = {}
+            # (date, slot index) -> bitset of booked providers
+            self._slot_providers = {}
+            # (provider_id, date, slot index) -> number of active bookings
+            self._slot_counts = {}
+            # booking_id -> (provider_id, date, slot index) for active bookings
+            self._active = {}
+            # bitset of available providers, None until loaded
+            self._available = None
+            self._available_loaded_at = None
+            self._evicted_before = None
+
+    # Loading
+
+    def ensure_loaded(self, start_date, end_date=None):
+        """
+        Make sure all bookings between two dates are in memory
+
+        Dates that are not loaded yet, or were loaded more than the TTL
+        ago, are fetched with a single query.
+
+        Args:
+            start_date: First date of the window
+            end_date: Last date of the window (defaults to start_date)
+        """
+        start_date = _as_date(start_date)
+        end_date = _as_date(end_date) if end_date is not None else start_date
+
+        now = time.monotonic()
+        ttl = _ttl()
+
+        with self._lock:
+            self._available_providers()
+            self._evict_past_dates()
+
+            days = (end_date - start_date).days + 1
+            missing = [start_date + timedelta(days=i) for i in range(days)]
+            missing = [
+                d for d in missing
+                if d not in self._loaded_dates or now - self._loaded_dates[d] >= ttl
+            ]
+            if not missing:
+                return
+
+            # Holding the lock while loading makes commits that land
+            # during the query wait, so none of them is lost
+            rows = db.session.query(
+                Booking.id, Booking.provider_id, Booking.booking_date, Booking.time_slot
+            ).filter(
+                Booking.booking_date >= missing[0],
+                Booking.booking_date <= missing[-1],
+                Booking.is_active()
+            ).all()
+
+            missing = set(missing)
+            self._forget_dates(missing)
+            for booking_id, provider_id, booking_date, time_slot in rows:
+                if booking_date in missing:
+                    self._add(booking_id, provider_id, booking_date, slot_index(time_slot))
+            self._loaded_dates.update(dict.fromkeys(missing, now))
+
+        logger.info(f"Loaded availability for {len(missing)} dates ({len(rows)} active bookings)")
+
+    def _evict_past_dates(self):
+        # Past days are rarely asked for again; drop them once a day so
+        # memory stays bounded by the booking horizon
+        today = datetime.utcnow().date()
+        if self._evicted_before == today:
+            return
+        self._evicted_before = today
+
+        self._forget_dates([d for d in self._loaded_dates if d < today])
+
+    def _forget_dates(self, dates):
+        dates = set(dates)
+        if not dates:
+            return
+        for booking_id, (_, booking_date, _) in list(self._active.items()):
+            if booking_date in dates:
+                self._remove(booking_id)
+        for booking_date in dates:
+            self._loaded_dates.pop(booking_date, None)
+
+    def _provider_bit(self, provider_id):
+        # Bit of a provider in the provider bitsets, assigned on first use
+        bit = self._provider_bits.get(provider_id)
+        if bit is None:
+            bit = self._provider_bits[provider_id] = 1 << len(self._bit_providers)
+            self._bit_providers.append(provider_id)
+        return bit
+
+    def _provider_ids(self, bitset):
+        # Provider IDs of the set bits of a provider bitset
+        return sorted(self._bit_providers[i] for i in _bits(bitset))
+
+    def _available_providers(self):
+        # Bitset of available providers, loaded with one query when needed
+        # and read again once older than the TTL
+        now = time.monotonic()
+        if self._available is None or now - self._available_loaded_at >= _ttl():
+            available = 0
+            for (provider_id,) in db.session.query(Provider.id).filter(Provider.is_available == True):
+                available |= self._provider_bit(provider_id)
+            self._available = available
+            self._available_loaded_at = now
+        return self._available
+
+    # Bookkeeping
+
+    def _add(self, booking_id, provider_id, booking_date, index):
+        if index is None or provider_id is None:
+            return
+        key = (provider_id, booking_date, index)
+        self._active[booking_id] = key
+        count = self._slot_counts.get(key, 0)
+        self._slot_counts[key] = count + 1
+        if count == 0:
+            self._booked[(provider_id, booking_date)] = \
+                self._booked.get((provider_id, booking_date), 0) | (1 << index)
+            self._slot_providers[(booking_date, index)] = \
+                self._slot_providers.get((booking_date, index), 0) | self._provider_bit(provider_id)
+
+    def _remove(self, booking_id):
+        key = self._active.pop(booking_id, None)
+        if key is None:
+            return
+        provider_id, booking_date, index = key
+        count = self._slot_counts.pop(key) - 1
+        if count > 0:
+            self._slot_counts[key] = count
+            return
+
+        mask = self._booked.get((provider_id, booking_date), 0) & ~(1 << index)
+        if mask:
+            self._booked[(provider_id, booking_date)] = mask
+        else:
+            self._booked.pop((provider_id, booking_date), None)
+
+        providers = self._slot_providers.get((booking_date, index), 0) & ~self._provider_bit(provider_id)
+        if providers:
+            self._slot_providers[(booking_date, index)] = providers
+        else:
+            self._slot_providers.pop((booking_date, index), None)
+
+    def apply_booking(self, booking_id, provider_id, booking_date, time_slot, status):
+        """Update the masks for a created, changed or deleted booking"""
+        with self._lock:
+            self._remove(booking_id)
+            if status in ACTIVE_STATUSES and booking_date in self._loaded_dates:
+                self._add(booking_id, provider_id, booking_date, slot_index(time_slot))
+
+    def apply_provider(self, provider_id, is_available):
+        """Update the availability bitset for a created or changed provider"""
+        with self._lock:
+            if self._available is None:
+                return
+            if is_available:
+                self._available |= self._provider_bit(provider_id)
+            else:
+                self._available &= ~self._provider_bit(provider_id)
+
+    def forget_providers(self):
+        """Reload provider availability from the database on next use"""
+        with self._lock:
+            self._available = None
+
+    # Queries
+
+    def is_provider_available(self, provider_id):
+        """Check whether a provider currently accepts bookings"""
+        with self._lock:
+            return bool(self._available_providers() & self._provider_bits.get(provider_id, 0))
+
+    def booked_mask(self, provider_id, booking_date):
+        """Get the booked slot mask of a provider on a date"""
+        booking_date = _as_date(booking_date)
+        self.ensure_loaded(booking_date)
+        return self._booked.get((provider_id, booking_date), 0)
+
+    def free_slots(self, provider_id, booking_date):
+        """
+        Get the free time slots of a provider on a date
+
+        Args:
+            provider_id: ID of the provider
+            booking_date: Date to check
+
+        Returns:
+            List of free time slots, empty if the provider is unavailable
+        """
+        if not self.is_provider_available(provider_id):
+            return []
+        return slots_from_mask(ALL_SLOTS_MASK & ~self.booked_mask(provider_id, booking_date))
+
+    def free_providers(self, booking_date, time_slot):
+        """
+        Get the available providers without a booking at a date and slot
+
+        Args:
+            booking_date: Date to check
+            time_slot: Time slot to check
+
+        Returns:
+            List of provider IDs, in ascending order
+        """
+        index = slot_index(time_slot)
+        if index is None:
+            return []
+
+        booking_date = _as_date(booking_date)
+        self.ensure_loaded(booking_date)
+        with self._lock:
+            free = self._available_providers() & ~self._slot_providers.get((booking_date, index), 0)
+            return self._provider_ids(free)
+
+    def availability_matrix(self, provider_ids, start_date, days):
+        """
+        Get the free slots of many providers over a date window
+
+        All dates in the window are loaded with at most one query.
+
+        Args:
+            provider_ids: IDs of the providers
+            start_date: First date of the window
+            days: Number of days in the window
+
+        Returns:
+            Dict mapping provider ID to a list of (date, free slots) pairs,
+            one per day; unavailable providers have no free slots
+        """
+        start_date = _as_date(start_date)
+        dates = [start_date + timedelta(days=i) for i in range(days)]
+        if not dates:
+            return {provider_id: [] for provider_id in provider_ids}
+
+        self.ensure_loaded(dates[0], dates[-1])
+
+        matrix = {}
+        with self._lock:
+            available = self._available_providers()
+            for provider_id in provider_ids:
+                if not available & self._provider_bits.get(provider_id, 0):
+                    matrix[provider_id] = [(d, []) for d in dates]
+                    continue
+                matrix[provider_id] = [
+                    (d, slots_from_mask(ALL_SLOTS_MASK & ~self._booked.get((provider_id, d), 0)))
+                    for d in dates
+                ]
+        return matrix
+
+
+availability_engine = AvailabilityEngine()
+
+# Booking columns that decide which slot a booking holds
+_SLOT_COLUMNS = {'provider_id', 'booking_date', 'time_slot', 'status'}
+
+
+@on_change(Booking, Provider)
+def update_availability(changes):
+    """Keep the availability masks in step with committed changes"""
+    if changes is None:
+        availability_engine.reset()
+        return
+
+    for change in changes:
+        values = change.values
+        if change.action == 'bulk_update':
+            # Rows touched by Query.update() are unknown; reload what changed
+            if change.model is Booking:
+                if _SLOT_COLUMNS & set(values):
+                    availability_engine.reset()
+                    return
+            elif 'is_available' in values:
+                availability_engine.forget_providers()
+            continue
+
+        if change.model is Booking:
+            status = None if change.action == 'delete' else values['status'] or 'pending'
+            availability_engine.apply_booking(
+                values['id'], values['provider_id'], values['booking_date'],
+                values['time_slot'], status
+            )
+        else:
+            is_available = change.action != 'delete' and values['is_available'] is not False
+            availability_engine.apply_provider(values['id'], is_available)
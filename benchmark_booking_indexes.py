@@ -0,0 +1,239 @@
+"""Script to benchmark the Booking indexes of the HIRE platform.
+
+This script:
+- Builds a scratch SQLite database with a large number of bookings
+  (1,000,000 by default) without the Booking indexes
+- Prints the query plan and latency of each booking hot path
+- Creates the indexes in place with upgrade_schema() and repeats the
+  measurements
+
+Usage:
+    python benchmark_booking_indexes.py [--bookings N] [--repeat N] [--db PATH]
+"""
+
+import argparse
+import logging
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+TIME_SLOTS = [
+    '09:00-10:00', '10:00-11:00', '11:00-12:00',
+    '13:00-14:00', '14:00-15:00', '15:00-16:00',
+    '16:00-17:00', '17:00-18:00'
+]
+
+# Share of bookings per status; only completed bookings carry ratings
+STATUS_WEIGHTS = {'completed': 60, 'cancelled': 15, 'pending': 15, 'confirmed': 10}
+
+
+def generate_bookings(db_path, count, providers, customers, categories):
+    """Insert `count` random bookings straight into the bookings table"""
+    today = datetime.utcnow().date()
+    statuses = list(STATUS_WEIGHTS)
+    weights = list(STATUS_WEIGHTS.values())
+    active_slots = set()
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    batch = []
+    generated = 0
+
+    while generated < count:
+        status = random.choices(statuses, weights)[0]
+        provider_id = random.randint(1, providers)
+        time_slot = random.choice(TIME_SLOTS)
+
+        if status in ('pending', 'confirmed'):
+            # Upcoming, and never two active bookings in one slot
+            booking_date = today + timedelta(days=random.randint(0, 60))
+            key = (provider_id, booking_date, time_slot)
+            if key in active_slots:
+                continue
+            active_slots.add(key)
+        else:
+            booking_date = today - timedelta(days=random.randint(1, 720))
+
+        created_at = datetime.combine(booking_date, datetime.min.time()) - \
+            timedelta(days=random.randint(1, 30), seconds=random.randint(0, 86399))
+        rating = random.randint(1, 5) if status == 'completed' and random.random() < 0.7 else None
+
+        batch.append((
+            random.randint(1, customers), provider_id, random.randint(1, categories), 1,
+            booking_date.isoformat(), time_slot, created_at.isoformat(sep=' '), status, rating
+        ))
+        generated += 1
+
+        if len(batch) == 50000:
+            _insert(cursor, batch)
+            batch = []
+
+    _insert(cursor, batch)
+    conn.commit()
+    conn.close()
+
+
+def _insert(cursor, batch):
+    cursor.executemany(
+        """INSERT INTO bookings
+           (customer_id, provider_id, category_id, address_id, booking_date,
+            time_slot, created_at, status, rating)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        batch
+    )
+
+
+def hot_path_queries(db, Booking, providers, customers):
+    """
+    Get the booking queries to measure
+
+    Returns:
+        List of (name, factory) pairs; each factory builds the query with
+        fresh random arguments
+    """
+    today = datetime.utcnow().date()
+
+    def conflict_check():
+        return Booking.query.filter_by(
+            provider_id=random.randint(1, providers),
+            booking_date=today + timedelta(days=random.randint(0, 60)),
+            time_slot=random.choice(TIME_SLOTS)
+        ).filter(Booking.is_active())
+
+    def availability_window():
+        start = today + timedelta(days=random.randint(0, 46))
+        return db.session.query(
+            Booking.id, Booking.provider_id, Booking.booking_date, Booking.time_slot
+        ).filter(
+            Booking.booking_date >= start,
+            Booking.booking_date <= start + timedelta(days=13),
+            Booking.is_active()
+        )
+
+    def customer_dashboard():
+        return Booking.query.filter_by(
+            customer_id=random.randint(1, customers)
+        ).order_by(Booking.created_at.desc())
+
+    def provider_dashboard():
+        return Booking.query.filter_by(
+            provider_id=random.randint(1, providers)
+        ).order_by(Booking.created_at.desc())
+
+    def rating_aggregate():
+        return db.session.query(
+            db.func.count(Booking.rating), db.func.coalesce(db.func.sum(Booking.rating), 0)
+        ).filter(
+            Booking.provider_id == random.randint(1, providers),
+            Booking.status == 'completed',
+            Booking.rating.isnot(None)
+        )
+
+    return [
+        ('conflict check', conflict_check),
+        ('availability (14 days)', availability_window),
+        ('customer dashboard', customer_dashboard),
+        ('provider dashboard', provider_dashboard),
+        ('rating aggregate', rating_aggregate),
+    ]
+
+
+def measure(db, queries, repeat):
+    """
+    Get the query plan and latency of each query
+
+    Returns:
+        Dict mapping query name to (plan, median ms, p95 ms)
+    """
+    results = {}
+    for name, factory in queries:
+        sql = str(factory().statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+        plan = db.session.execute(db.text(f"EXPLAIN QUERY PLAN {sql}")).fetchall()
+        plan = '; '.join(row[-1] for row in plan)
+
+        timings = []
+        for _ in range(repeat):
+            query = factory()
+            start = time.perf_counter()
+            query.all()
+            timings.append((time.perf_counter() - start) * 1000)
+            db.session.rollback()
+
+        timings.sort()
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        results[name] = (plan, statistics.median(timings), p95)
+    return results
+
+
+def print_results(title, results):
+    print(f"\n{title}")
+    print("-" * len(title))
+    for name, (plan, median, p95) in results.items():
+        print(f"{name:<24} median {median:9.2f} ms   p95 {p95:9.2f} ms")
+        print(f"{'':<24} plan: {plan}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bookings', type=int, default=1000000, help='Number of bookings to generate')
+    parser.add_argument('--providers', type=int, default=2000, help='Number of providers')
+    parser.add_argument('--customers', type=int, default=50000, help='Number of customers')
+    parser.add_argument('--repeat', type=int, default=50, help='Runs per query')
+    parser.add_argument('--db', help='Database file (default: a temporary file)')
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix='hire-bench-'), 'bench.db')
+    if os.path.exists(db_path):
+        os.remove(db_path)
+
+    os.environ['DATABASE_URI'] = f"sqlite:///{os.path.abspath(db_path)}"
+    from app import db, create_schema
+    from wsgi import app
+    from models import Booking
+    from migrations import upgrade_schema
+
+    logging.disable(logging.INFO)
+
+    with app.app_context():
+        create_schema()
+        index_names = [index.name for index in Booking.__table__.indexes]
+        for name in index_names:
+            db.session.execute(db.text(f"DROP INDEX IF EXISTS {name}"))
+        db.session.commit()
+
+        print(f"Generating {args.bookings:,} bookings in {db_path}...")
+        start = time.perf_counter()
+        generate_bookings(db_path, args.bookings, args.providers, args.customers, categories=7)
+        print(f"Generated in {time.perf_counter() - start:.1f} s")
+
+        db.session.execute(db.text("ANALYZE"))
+        db.session.commit()
+
+        queries = hot_path_queries(db, Booking, args.providers, args.customers)
+        before = measure(db, queries, args.repeat)
+        print_results("Without Booking indexes", before)
+
+        start = time.perf_counter()
+        added = upgrade_schema()
+        db.session.execute(db.text("ANALYZE"))
+        db.session.commit()
+        print(f"\nMigrated in place in {time.perf_counter() - start:.1f} s: {', '.join(added)}")
+
+        after = measure(db, queries, args.repeat)
+        print_results("With Booking indexes", after)
+
+        print("\nSpeed-up (median)")
+        print("-----------------")
+        for name in before:
+            print(f"{name:<24} {before[name][1] / max(after[name][1], 0.001):8.1f}x")
+
+    if not args.db:
+        os.remove(db_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""Script to benchmark the provider scoring engine of the HIRE platform.
+
+This script:
+- Generates random providers of one category around Dublin (100,000 by
+  default)
+- Times the previous ranking (sorting the providers by avg_rating) and the
+  scoring engine's top-k selection, in plain Python and, when NumPy is
+  installed, vectorized
+- Checks that both scoring engines return the same providers
+
+Usage:
+    python benchmark_scoring.py [--providers N] [--k N] [--repeat N]
+"""
+
+import argparse
+import logging
+import random
+import statistics
+import time
+from collections import namedtuple
+
+DUBLIN = (53.3498, -6.2603)
+
+# The fields the previous ranking read from Provider objects
+ProviderRow = namedtuple('ProviderRow', 'id avg_rating')
+
+
+def generate_rows(count, seed):
+    """Generate scoring column rows for `count` random providers"""
+    rng = random.Random(seed)
+    rows = []
+    for provider_id in range(1, count + 1):
+        rows.append((
+            provider_id,
+            DUBLIN[0] + rng.uniform(-0.25, 0.25),
+            DUBLIN[1] + rng.uniform(-0.4, 0.4),
+            rng.choice([None, round(rng.uniform(1, 5), 2)]),
+            round(rng.uniform(20, 120), 2),
+            rng.randint(0, 35),
+            rng.random() > 0.1
+        ))
+    return rows
+
+
+def time_runs(func, repeat):
+    """
+    Time repeated calls of func
+
+    Returns:
+        (median ms, p95 ms, last result)
+    """
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    return statistics.median(timings), p95, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--providers', type=int, default=100000, help='Number of providers in the category')
+    parser.add_argument('--k', type=int, default=5, help='Providers to return')
+    parser.add_argument('--radius', type=float, default=25, help='Search radius in km')
+    parser.add_argument('--repeat', type=int, default=20, help='Runs per measurement')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed')
+    args = parser.parse_args()
+
+    from scoring import CategoryColumns, numpy_available
+
+    logging.disable(logging.INFO)
+
+    rows = generate_rows(args.providers, args.seed)
+    providers = [ProviderRow(row[0], row[3]) for row in rows if row[6]]
+    print(f"{args.providers:,} providers, top {args.k} within {args.radius:g} km of Dublin city centre")
+
+    results = {}
+    results['previous sort (rating only)'] = time_runs(lambda: sorted(
+        providers, key=lambda p: p.avg_rating if p.avg_rating is not None else 0, reverse=True
+    )[:args.k], args.repeat)
+
+    engines = [('scoring, plain Python', False)]
+    if numpy_available():
+        engines.append(('scoring, NumPy', True))
+    else:
+        print("NumPy is not installed; only the plain Python engine is measured")
+
+    rankings = {}
+    for name, use_numpy in engines:
+        start = time.perf_counter()
+        columns = CategoryColumns(rows, use_numpy=use_numpy)
+        build_ms = (time.perf_counter() - start) * 1000
+        print(f"{name}: columns built in {build_ms:.1f} ms")
+
+        results[name] = time_runs(
+            lambda: columns.rank(args.k, *DUBLIN, radius_km=args.radius), args.repeat
+        )
+        rankings[name] = [ranked.provider_id for ranked in results[name][2]]
+
+    print()
+    for name, (median, p95, _) in results.items():
+        print(f"{name:<30} median {median:9.2f} ms   p95 {p95:9.2f} ms")
+
+    if len(rankings) == 2:
+        same = len(set(map(tuple, rankings.values()))) == 1
+        print(f"\nEngines agree on the top {args.k}: {'yes' if same else 'NO'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+In-memory service category catalog.
+
+The catalog is a handful of rows that almost never change, so it is read
+once and kept in memory as immutable Category snapshots, with lookups by
+ID and by name. It is reloaded after a change to service_categories is
+committed in this process, and every CATALOG_CACHE_TTL seconds (default
+300) so changes made by other processes are picked up too.
+"""
+
+import logging
+from collections import namedtuple
+
+from flask import current_app
+
+from db_setup import db
+from generation_cache import GenerationCache
+from model_events import on_change
+from models import ServiceCategory
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 300
+
+# Snapshot of one service category (safe to share between requests)
+Category = namedtuple('Category', 'id name description')
+
+# Loaded catalog: categories in ID order plus the two lookup tables
+Catalog = namedtuple('Catalog', 'categories by_id by_name')
+
+_cache = GenerationCache()
+
+
+def _load_catalog():
+    rows = db.session.query(
+        ServiceCategory.id, ServiceCategory.name, ServiceCategory.description
+    ).order_by(ServiceCategory.id).all()
+
+    categories = tuple(Category(*row) for row in rows)
+    logger.info(f"Loaded service catalog ({len(categories)} categories)")
+    return Catalog(
+        categories,
+        {category.id: category for category in categories},
+        {category.name.lower(): category for category in categories}
+    )
+
+
+def _get_catalog():
+    return _cache.get(None, _load_catalog, ttl=current_app.config.get('CATALOG_CACHE_TTL', DEFAULT_TTL))
+
+
+def get_categories():
+    """
+    Get all service categories
+
+    Returns:
+        Tuple of Category in ID order
+    """
+    return _get_catalog().categories
+
+
+def get_category(category_id):
+    """
+    Get a service category by ID
+
+    Args:
+        category_id: ID of the category (int or numeric string)
+
+    Returns:
+        Category, or None if there is no such category
+    """
+    try:
+        category_id = int(category_id)
+    except (TypeError, ValueError):
+        return None
+    return _get_catalog().by_id.get(category_id)
+
+
+def get_category_by_name(name):
+    """
+    Get a service category by name (case-insensitive)
+
+    Args:
+        name: Name of the category
+
+    Returns:
+        Category, or None if there is no such category
+    """
+    if not name:
+        return None
+    return _get_catalog().by_name.get(name.strip().lower())
+
+
+@on_change(ServiceCategory)
+def invalidate_catalog(changes):
+    """Drop the cached catalog after service categories change"""
+    _cache.invalidate()
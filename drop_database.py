@@ -31,7 +31,7 @@ def drop_database():
         print("No database files found to drop.")
     
     print("\nTo recreate the database with fresh data, run:")
-    print("  python -m flask run")
+    print("  flask init-db")
     print("  python generate_dummy_data.py")
 
 if __name__ == "__main__":
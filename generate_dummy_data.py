@@ -2,7 +2,8 @@
 
 This script creates:
 - 5 customer users with verified OTP status
-- 30 service providers with verified OTP status
+- 30 service providers with verified OTP status, each with a few rated,
+  completed past bookings
 - All addresses are in Dublin, Ireland
 """
 
@@ -10,7 +11,7 @@ import os
 import random
 import string
 import sqlite3
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from werkzeug.security import generate_password_hash
 from dotenv import load_dotenv
 
@@ -29,7 +30,7 @@ elif os.path.exists(instance_db_path):
     db_path = instance_db_path
     print(f"Using database in instance folder: {instance_db_path}")
 else:
-    print("Error: No database file found. Please run 'python -m flask run' first to create the database.")
+    print("Error: No database file found. Please run 'flask init-db' first to create the database.")
     print(f"Checked locations: {root_db_path}, {instance_db_path}")
     exit(1)
 
@@ -95,7 +96,7 @@ def generate_dummy_data():
     # Drop existing data from tables
     print("Dropping existing data from tables...")
     tables = [
-        'provider_categories', 'otp_verifications', 'addresses', 
+        'payments', 'bookings', 'provider_categories', 'otp_verifications', 'addresses', 
         'customers', 'providers', 'service_categories'
     ]
     
@@ -131,6 +132,9 @@ def generate_dummy_data():
         first_names = ['Emma', 'Jack', 'Sophie', 'James', 'Olivia', 'Daniel', 'Emily', 'Sean', 'Ava', 'Conor']
         last_names = ['Murphy', 'Kelly', 'O\'Sullivan', 'Walsh', 'Smith', 'O\'Brien', 'Byrne', 'Ryan', 'O\'Connor', 'Doyle']
         
+        # (customer ID, address ID) of every customer, for the past bookings
+        customer_addresses = []
+        
         # Generate 5 customers
         for i in range(5):
             # Generate customer details
@@ -159,18 +163,10 @@ def generate_dummy_data():
                 (customer_id, address['address_line'], address['city'], address['state'], 
                  address['postal_code'], address['latitude'], address['longitude'])
             )
+            customer_addresses.append((customer_id, cursor.lastrowid))
             
-            # Add OTP verification record (already verified)
-            otp_code = ''.join(random.choices('0123456789', k=6))
-            cursor.execute(
-                """INSERT INTO otp_verifications 
-                   (user_id, user_type, otp_code, created_at, expires_at, is_used) 
-                   VALUES (?, ?, ?, ?, ?, ?)""",
-                (customer_id, 'customer', otp_code, 
-                 datetime.utcnow() - timedelta(days=1),  # Created yesterday 
-                 datetime.utcnow() - timedelta(hours=23),  # Expired 1 hour after creation
-                 True)  # OTP has been used (verified)
-            )
+            # Users are created verified; no OTP record is needed (an
+            # already used, expired code would only be purged again)
         
         # Generate provider data
         print("Generating 30 service providers with verified OTP status...")
@@ -195,14 +191,22 @@ def generate_dummy_data():
             verification_document = f"ID_{first_name}_{last_name}_{random.randint(1000, 9999)}.pdf"
             experience_years = random.randint(1, 20)
             
+            # Ratings of the provider's past bookings (inserted below), which
+            # the rating aggregates summarize
+            ratings = [random.choice([3, 4, 4, 5, 5]) for _ in range(random.randint(3, 12))]
+            rating_sum = sum(ratings)
+            rating_count = len(ratings)
+            avg_rating = round(rating_sum / rating_count, 2)
+            
             # Insert provider
             cursor.execute(
                 """INSERT INTO providers 
                    (email, phone, password_hash, first_name, last_name, verification_document, 
-                    experience_years, is_available, avg_rating, is_verified, created_at) 
-                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                    experience_years, is_available, avg_rating, rating_sum, rating_count, 
+                    is_verified, created_at) 
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
                 (email, phone, password_hash, first_name, last_name, verification_document, 
-                 experience_years, True, random.uniform(3.5, 5.0), True, datetime.utcnow())
+                 experience_years, True, avg_rating, rating_sum, rating_count, True, datetime.utcnow())
             )
             
             provider_id = cursor.lastrowid
@@ -217,17 +221,8 @@ def generate_dummy_data():
                  address['postal_code'], address['latitude'], address['longitude'])
             )
             
-            # Add OTP verification record (already verified)
-            otp_code = ''.join(random.choices('0123456789', k=6))
-            cursor.execute(
-                """INSERT INTO otp_verifications 
-                   (user_id, user_type, otp_code, created_at, expires_at, is_used) 
-                   VALUES (?, ?, ?, ?, ?, ?)""",
-                (provider_id, 'provider', otp_code, 
-                 datetime.utcnow() - timedelta(days=1),  # Created yesterday 
-                 datetime.utcnow() - timedelta(hours=23),  # Expired 1 hour after creation
-                 True)  # OTP has been used (verified)
-            )
+            # Users are created verified; no OTP record is needed (an
+            # already used, expired code would only be purged again)
             
             # Assign 1-3 service categories to each provider
             num_categories = random.randint(1, 3)
@@ -254,12 +249,28 @@ def generate_dummy_data():
                        VALUES (?, ?, ?)""",
                     (provider_id, category_id, price_rate)
                 )
+            
+            # One completed, rated booking a week for the past few weeks
+            for weeks_ago, rating in enumerate(ratings, start=1):
+                customer_id, address_id = random.choice(customer_addresses)
+                booking_date = date.today() - timedelta(weeks=weeks_ago)
+                hour = random.choice([9, 10, 11, 13, 14, 15, 16, 17])
+                cursor.execute(
+                    """INSERT INTO bookings 
+                       (customer_id, provider_id, category_id, address_id, booking_date, time_slot, 
+                        created_at, status, rating) 
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                    (customer_id, provider_id, random.choice(selected_categories)[1], address_id,
+                     booking_date.isoformat(), f"{hour:02d}:00-{hour + 1:02d}:00",
+                     datetime.combine(booking_date - timedelta(days=2), datetime.min.time()),
+                     'completed', rating)
+                )
         
         # Commit all changes
         conn.commit()
         print("Successfully generated dummy data!")
         print("- 5 customers with verified OTP status")
-        print("- 30 service providers with verified OTP status")
+        print("- 30 service providers with verified OTP status and rated past bookings")
         print("- All addresses in Dublin, Ireland")
         
         # Print credentials for easy access
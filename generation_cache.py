@@ -0,0 +1,72 @@
+"""
+Invalidation-safe in-process cache.
+
+The caches derived from the database (catalog, provider map, scoring
+columns, search pages, leaderboard) all share this shape:
+a value is built on first use, kept until a committed change drops it
+(see model_events.py), and optionally expires after a TTL so changes made
+by other processes are picked up too.
+
+Building happens outside the lock, so a change can be committed while a
+value is being built from the old rows. Every invalidation bumps a
+generation counter, and a value is only stored if the generation is the
+same as when its build started.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class GenerationCache:
+    """Values built on demand, dropped by invalidate() or when they expire"""
+
+    def __init__(self):
+        # key -> (value, monotonic time it was built), least recently used first
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, build, ttl=None, max_size=None):
+        """
+        Get a cached value, building and storing it if needed
+
+        Args:
+            key: Hashable key of the value
+            build: Function returning the value (called without arguments)
+            ttl: Seconds a value is served after it was built (None keeps it
+                until invalidated)
+            max_size: Maximum number of values kept, least recently used
+                dropped first (None for no limit, 0 disables caching)
+
+        Returns:
+            The cached or newly built value
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (ttl is None or now - entry[1] < ttl):
+                self._entries.move_to_end(key)
+                return entry[0]
+            generation = self._generation
+
+        value = build()
+
+        with self._lock:
+            # Don't cache a value that was invalidated while it was built
+            if generation == self._generation and max_size != 0:
+                self._entries[key] = (value, now)
+                self._entries.move_to_end(key)
+                while max_size is not None and len(self._entries) > max_size:
+                    self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self):
+        """Drop every value, including the ones being built right now"""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
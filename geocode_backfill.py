@@ -0,0 +1,247 @@
+"""
+Bulk geocoding backfill for addresses without exact coordinates.
+
+Addresses saved before geocoding was tracked may have no coordinates at
+all, and pending addresses may be waiting on the background geocoder.
+backfill_addresses() works through both in ID order, one chunk at a time:
+
+- the chunk is read as plain rows (no ORM objects);
+- addresses are deduplicated by their normalized cache key, and keys
+  already in geocode_cache are answered in one query;
+- the remaining keys are geocoded by a pool of worker threads, with
+  requests rate limited across the pool;
+- answers are written back with one bulk insert into the cache (skipping
+  keys the background geocoder cached in the meantime) and one bulk
+  update of the addresses, and the chunk is committed.
+
+After each commit the ID of the last address done is saved to a JSON
+checkpoint file, so an interrupted run (Ctrl+C, or the geocoding service
+failing) carries on from there when started again.
+"""
+
+import json
+import logging
+import os
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+
+from db_setup import db
+from geocoding import GeocodeError, RateLimiter, cache_key, lookup_postal_code
+from model_events import record_bulk_change
+from models import Address, GeocodeCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 500
+DEFAULT_WORKERS = 4
+DEFAULT_RATE = 1.0
+
+# Progress of a run: addresses read, distinct addresses among them,
+# answers taken from the cache, geocoder requests, addresses given exact
+# and approximate coordinates, and the ID of the last address done
+BackfillStats = namedtuple(
+    'BackfillStats', 'scanned unique cached requested exact approximate last_id'
+)
+
+
+def load_checkpoint(path):
+    """
+    Read a checkpoint file
+
+    Returns:
+        Saved BackfillStats, or None if there is no checkpoint
+    """
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return BackfillStats(**json.load(f))
+
+
+def save_checkpoint(path, stats):
+    """Write a checkpoint file atomically"""
+    if not path:
+        return
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(stats._asdict(), f)
+    os.replace(temp_path, path)
+
+
+def _read_chunk(after_id, chunk_size):
+    return db.session.query(
+        Address.id, Address.address_line, Address.city, Address.state, Address.postal_code
+    ).filter(
+        Address.id > after_id,
+        or_(Address.latitude.is_(None), Address.geocode_status == 'pending')
+    ).order_by(Address.id).limit(chunk_size).all()
+
+
+def _full_address(row):
+    return f"{row.address_line}, {row.city}, {row.state} {row.postal_code}"
+
+
+def _geocode_all(geocoder, queries, workers, limiter):
+    """
+    Geocode queries concurrently
+
+    Returns:
+        (results, error): dict mapping each answered query to its Point
+        or None, and the first GeocodeError raised (None if all succeeded)
+    """
+    def geocode(query):
+        limiter.wait()
+        return geocoder.geocode(query)
+
+    results = {}
+    error = None
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {query: executor.submit(geocode, query) for query in queries}
+        for query, future in futures.items():
+            try:
+                results[query] = future.result()
+            except GeocodeError as e:
+                error = error or e
+    return results, error
+
+
+def _insert_cache_entries(entries):
+    """
+    Add geocode_cache rows, leaving keys that are already cached alone
+
+    The background geocoder can cache a key while the chunk is being
+    geocoded. Keys cached by then are skipped; if one is cached between
+    that check and the insert, the insert is dropped (the entries are
+    only a cache) and the rest of the chunk is still written.
+
+    Returns:
+        Number of rows added
+    """
+    existing = {key for (key,) in db.session.query(GeocodeCache.query_key).filter(
+        GeocodeCache.query_key.in_([entry['query_key'] for entry in entries])
+    )}
+    entries = [entry for entry in entries if entry['query_key'] not in existing]
+    if not entries:
+        return 0
+
+    try:
+        with db.session.begin_nested():
+            db.session.bulk_insert_mappings(GeocodeCache, entries)
+    except IntegrityError as e:
+        logger.warning(f"Skipped caching {len(entries)} geocoder answers cached concurrently: {str(e.orig)}")
+        return 0
+    return len(entries)
+
+
+def _backfill_chunk(rows, geocoder, workers, limiter):
+    """
+    Geocode one chunk and write the results back
+
+    Returns:
+        (unique, cached, requested, exact, approximate) counts
+
+    Raises:
+        GeocodeError: If the geocoder failed; the answers received are
+            still written, but the caller must not move past the chunk
+    """
+    exact_geocoder = getattr(geocoder, 'exact', True)
+    by_key = {}
+    for row in rows:
+        by_key.setdefault(cache_key(row.address_line, row.city, row.postal_code), []).append(row)
+
+    answers = {}
+    if exact_geocoder:
+        for key, latitude, longitude in db.session.query(
+            GeocodeCache.query_key, GeocodeCache.latitude, GeocodeCache.longitude
+        ).filter(GeocodeCache.query_key.in_(list(by_key))):
+            answers[key] = (latitude, longitude) if latitude is not None else None
+    cached = len(answers)
+
+    queries = {_full_address(group[0]): key for key, group in by_key.items() if key not in answers}
+    results, error = _geocode_all(geocoder, list(queries), workers, limiter)
+
+    new_entries = []
+    for query, point in results.items():
+        key = queries[query]
+        answers[key] = tuple(point) if point is not None else None
+        if exact_geocoder:
+            new_entries.append({
+                'query_key': key,
+                'latitude': point.latitude if point is not None else None,
+                'longitude': point.longitude if point is not None else None
+            })
+
+    updates = []
+    exact = approximate = 0
+    for key, answer in answers.items():
+        for row in by_key[key]:
+            if answer is not None and exact_geocoder:
+                status = 'exact'
+                latitude, longitude = answer
+                exact += 1
+            else:
+                status = 'approximate'
+                latitude, longitude = answer or lookup_postal_code(row.postal_code, row.city) or (None, None)
+                approximate += 1
+            updates.append({
+                'id': row.id, 'latitude': latitude, 'longitude': longitude, 'geocode_status': status
+            })
+
+    if new_entries:
+        _insert_cache_entries(new_entries)
+    if updates:
+        db.session.bulk_update_mappings(Address, updates)
+        record_bulk_change(db.session, Address, ['latitude', 'longitude', 'geocode_status'])
+    db.session.commit()
+
+    if error is not None:
+        raise error
+    return len(by_key), cached, len(queries), exact, approximate
+
+
+def backfill_addresses(geocoder, chunk_size=DEFAULT_CHUNK_SIZE, workers=DEFAULT_WORKERS,
+                       rate=DEFAULT_RATE, checkpoint=None, progress=None):
+    """
+    Geocode every address without exact coordinates
+
+    Args:
+        geocoder: Geocoder with a geocode(query) method; one with
+            exact = False (e.g. PostalCodeGeocoder) only gives approximate
+            coordinates and doesn't fill the cache
+        chunk_size: Addresses read and written per transaction
+        workers: Concurrent geocoder requests
+        rate: Maximum geocoder requests per second (0 for no limit)
+        checkpoint: Path of the checkpoint file (optional); an existing
+            checkpoint is resumed
+        progress: Function called with the BackfillStats after each chunk
+
+    Returns:
+        Final BackfillStats
+
+    Raises:
+        GeocodeError: If the geocoder failed; run again to resume
+    """
+    stats = load_checkpoint(checkpoint) or BackfillStats(0, 0, 0, 0, 0, 0, 0)
+    if stats.last_id:
+        logger.info(f"Resuming geocoding backfill after address {stats.last_id}")
+
+    limiter = RateLimiter(rate)
+    while True:
+        rows = _read_chunk(stats.last_id, chunk_size)
+        if not rows:
+            break
+
+        unique, cached, requested, exact, approximate = _backfill_chunk(rows, geocoder, workers, limiter)
+        stats = BackfillStats(
+            stats.scanned + len(rows), stats.unique + unique, stats.cached + cached,
+            stats.requested + requested, stats.exact + exact,
+            stats.approximate + approximate, rows[-1].id
+        )
+        save_checkpoint(checkpoint, stats)
+        logger.info(f"Geocoding backfill: {stats}")
+        if progress is not None:
+            progress(stats)
+
+    return stats
@@ -0,0 +1,449 @@
+"""
+Address geocoding with a persistent cache and an offline fallback.
+
+Saving an address never waits on the geocoding service. The address is
+stored at once with the best coordinates available without a network
+call: an earlier answer from the geocode_cache table, or else the centre
+of its postal district from a bundled table of Dublin postal districts
+and Eircode routing keys, in which case it is marked 'pending'. A
+worker then geocodes pending addresses through the configured geocoder,
+one request at a time and with a strict timeout, and stores every answer
+in the cache so an address is never looked up twice.
+
+Nominatim allows one request per second, and the rate limiter only
+spaces the requests of one process. Exactly one process should therefore
+run the worker: a `flask geocode-worker` process, or a single application
+process with GEOCODE_IN_BACKGROUND set.
+
+Configuration:
+    GEOCODER: 'nominatim' (default) or 'offline' (postal district
+        coordinates only; addresses stay pending)
+    GEOCODER_TIMEOUT: Seconds to wait for the geocoding service (default 3)
+    GEOCODE_IN_BACKGROUND: Geocode pending addresses in a background
+        thread of this process (default False; off while TESTING). Set it
+        in one process only, and not alongside `flask geocode-worker`
+"""
+
+import logging
+import re
+import threading
+import time
+from collections import namedtuple
+
+from flask import current_app
+
+from db_setup import db
+from model_events import on_change
+from models import Address, GeocodeCache
+
+logger = logging.getLogger(__name__)
+
+NOMINATIM_URL = 'https://nominatim.openstreetmap.org/search'
+USER_AGENT = 'HIRE Platform/1.0'
+DEFAULT_TIMEOUT = 3
+
+# Nominatim's usage policy allows at most one request per second
+MIN_REQUEST_INTERVAL = 1.0
+
+# Addresses geocoded per batch, and how long the worker waits after the
+# geocoding service fails before trying again
+BATCH_SIZE = 20
+RETRY_SECONDS = 60
+
+# How often an idle worker checks for addresses saved by other processes
+POLL_INTERVAL_SECONDS = 30
+
+Point = namedtuple('Point', 'latitude longitude')
+
+# Approximate centres of the Dublin postal districts (also the Eircode
+# routing keys D01-D24 and D6W) and the routing keys of the surrounding
+# County Dublin towns
+POSTAL_DISTRICTS = {
+    'D01': Point(53.3520, -6.2600), 'D02': Point(53.3385, -6.2530),
+    'D03': Point(53.3640, -6.2270), 'D04': Point(53.3280, -6.2290),
+    'D05': Point(53.3850, -6.1960), 'D06': Point(53.3200, -6.2650),
+    'D6W': Point(53.3110, -6.2970), 'D07': Point(53.3550, -6.2850),
+    'D08': Point(53.3400, -6.2900), 'D09': Point(53.3790, -6.2500),
+    'D10': Point(53.3400, -6.3450), 'D11': Point(53.3900, -6.3000),
+    'D12': Point(53.3200, -6.3200), 'D13': Point(53.3900, -6.1500),
+    'D14': Point(53.2950, -6.2550), 'D15': Point(53.3900, -6.3900),
+    'D16': Point(53.2780, -6.2650), 'D17': Point(53.4000, -6.2100),
+    'D18': Point(53.2650, -6.1800), 'D20': Point(53.3550, -6.3900),
+    'D22': Point(53.3250, -6.3900), 'D24': Point(53.2880, -6.3700),
+    'A94': Point(53.3010, -6.1770),  # Blackrock
+    'A96': Point(53.2880, -6.1340),  # Dun Laoghaire
+    'A98': Point(53.2020, -6.0980),  # Bray
+    'K32': Point(53.6130, -6.1810),  # Balbriggan
+    'K34': Point(53.5800, -6.1080),  # Skerries
+    'K36': Point(53.4500, -6.1540),  # Malahide
+    'K45': Point(53.5260, -6.1660),  # Lusk
+    'K56': Point(53.5220, -6.0930),  # Rush
+    'K67': Point(53.4590, -6.2180),  # Swords
+    'K78': Point(53.3570, -6.4490),  # Lucan
+    'W23': Point(53.3800, -6.5400),  # Celbridge / Leixlip
+}
+
+DUBLIN_CENTRE = Point(53.3498, -6.2603)
+
+# "Dublin 6W", "D6W", "dublin 8", "D08"
+_DISTRICT_PATTERN = re.compile(r'^(?:DUBLIN|CO\.?DUBLIN|D)?(\d{1,2})(W?)$')
+_EIRCODE_PATTERN = re.compile(r'^([A-Z]\d[\dW])[\dA-Z]{4}$')
+
+
+class GeocodeError(Exception):
+    """The geocoding service failed (as opposed to finding no match)"""
+
+
+def normalize_text(value):
+    """Lowercase and collapse whitespace and punctuation"""
+    return ' '.join(re.sub(r'[^\w]+', ' ', value or '').lower().split())
+
+
+def normalize_postal_code(postal_code):
+    """Uppercase a postal code and remove its spaces"""
+    return re.sub(r'\s+', '', postal_code or '').upper()
+
+
+def cache_key(address_line, city, postal_code):
+    """Build the geocode_cache key of an address"""
+    key = f"{normalize_text(address_line)}, {normalize_text(city)}|{normalize_postal_code(postal_code)}"
+    return key[:255]
+
+
+def lookup_postal_code(postal_code, city=None):
+    """
+    Resolve a postal code to the centre of its district, offline
+
+    Args:
+        postal_code: Eircode ("D02 X285"), routing key ("D02") or Dublin
+            postal district ("Dublin 2", "D6W")
+        city: City, used when the postal code is not recognised
+
+    Returns:
+        Point, or None if the area is unknown
+    """
+    code = normalize_postal_code(postal_code)
+
+    match = _EIRCODE_PATTERN.match(code)
+    if match and match.group(1) in POSTAL_DISTRICTS:
+        return POSTAL_DISTRICTS[match.group(1)]
+    if code[:3] in POSTAL_DISTRICTS and len(code) == 3:
+        return POSTAL_DISTRICTS[code]
+
+    match = _DISTRICT_PATTERN.match(code)
+    if match:
+        district = 'D6W' if match.group(2) else f"D{int(match.group(1)):02d}"
+        if district in POSTAL_DISTRICTS:
+            return POSTAL_DISTRICTS[district]
+
+    if normalize_text(city) == 'dublin':
+        return DUBLIN_CENTRE
+    return None
+
+
+class RateLimiter:
+    """
+    Spaces calls at least 1/rate seconds apart, across the threads of one
+    process
+
+    Args:
+        rate: Maximum calls per second (0 for no limit)
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """Block until the caller may make its call"""
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class NominatimGeocoder:
+    """
+    Geocoder backed by OpenStreetMap Nominatim
+
+    Args:
+        timeout: Seconds to wait for a response
+        min_interval: Minimum seconds between requests
+        url: Search endpoint (e.g. of a self-hosted Nominatim)
+    """
+
+    # Answers are precise enough to cache as exact coordinates
+    exact = True
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, min_interval=MIN_REQUEST_INTERVAL, url=NOMINATIM_URL):
+        import requests
+
+        self.url = url
+        self.timeout = timeout
+        self._limiter = RateLimiter(1.0 / min_interval if min_interval else 0)
+        self._session = requests.Session()
+        self._session.headers['User-Agent'] = USER_AGENT
+
+    def geocode(self, query):
+        """
+        Geocode a free-form address
+
+        Args:
+            query: Address text
+
+        Returns:
+            Point, or None if there is no match
+
+        Raises:
+            GeocodeError: If the service failed or timed out
+        """
+        import requests
+
+        self._limiter.wait()
+        try:
+            response = self._session.get(self.url, params={
+                'q': query,
+                'format': 'json',
+                'limit': 1,
+                'countrycodes': 'ie'
+            }, timeout=self.timeout)
+            response.raise_for_status()
+            data = response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise GeocodeError(f"Nominatim request failed: {str(e)}")
+
+        if not data:
+            return None
+        return Point(float(data[0]['lat']), float(data[0]['lon']))
+
+
+class PostalCodeGeocoder:
+    """
+    Offline geocoder that resolves the postal code at the end of an
+    address to the centre of its district (see lookup_postal_code)
+    """
+
+    # District centres only; never cached as exact coordinates
+    exact = False
+
+    def geocode(self, query):
+        """Geocode the postal code ending an address text, or None"""
+        words = query.replace(',', ' ').split()
+        for size in (2, 1):
+            point = lookup_postal_code(' '.join(words[-size:]))
+            if point is not None:
+                return point
+        return None
+
+
+_geocoder = None
+_geocoder_config = None
+_geocoder_lock = threading.Lock()
+
+
+def get_geocoder():
+    """
+    Get the shared geocoder configured by GEOCODER and GEOCODER_TIMEOUT
+
+    Returns:
+        Geocoder with a geocode(query) method, or None when offline
+    """
+    global _geocoder, _geocoder_config
+
+    config = (
+        current_app.config.get('GEOCODER', 'nominatim'),
+        current_app.config.get('GEOCODER_TIMEOUT', DEFAULT_TIMEOUT)
+    )
+
+    with _geocoder_lock:
+        if config != _geocoder_config:
+            name, timeout = config
+            _geocoder = None if name == 'offline' else NominatimGeocoder(timeout)
+            _geocoder_config = config
+        return _geocoder
+
+
+def _cached(key):
+    return GeocodeCache.query.filter_by(query_key=key).first()
+
+
+def locate_address(address):
+    """
+    Give a new address coordinates without calling the geocoding service
+
+    Uses a cached geocoder answer when there is one; otherwise the centre
+    of the postal district, leaving the address 'pending' for the
+    background geocoder.
+
+    Args:
+        address: Address (not yet committed)
+    """
+    entry = _cached(cache_key(address.address_line, address.city, address.postal_code))
+    if entry is not None and entry.latitude is not None:
+        address.latitude, address.longitude = entry.latitude, entry.longitude
+        address.geocode_status = 'exact'
+        return
+
+    point = lookup_postal_code(address.postal_code, address.city)
+    if point is not None:
+        address.latitude, address.longitude = point
+
+    # A cached miss won't improve on a second try
+    address.geocode_status = 'approximate' if entry is not None else 'pending'
+
+
+def geocode_address(address, geocoder=None):
+    """
+    Geocode an address through the cache and the geocoder
+
+    Args:
+        address: Address to update
+        geocoder: Geocoder to use (defaults to get_geocoder())
+
+    Returns:
+        True if exact coordinates were found
+
+    Raises:
+        GeocodeError: If the geocoding service failed; the address is
+            left unchanged
+    """
+    key = cache_key(address.address_line, address.city, address.postal_code)
+    entry = _cached(key)
+
+    if entry is None:
+        geocoder = geocoder or get_geocoder()
+        if geocoder is None:
+            raise GeocodeError("No geocoder configured")
+        point = geocoder.geocode(address.get_full_address())
+        entry = GeocodeCache(query_key=key)
+        if point is not None:
+            entry.latitude, entry.longitude = point
+        db.session.add(entry)
+
+    if entry.latitude is not None:
+        address.latitude, address.longitude = entry.latitude, entry.longitude
+        address.geocode_status = 'exact'
+        return True
+
+    point = lookup_postal_code(address.postal_code, address.city)
+    if point is not None:
+        address.latitude, address.longitude = point
+    address.geocode_status = 'approximate'
+    return False
+
+
+def fill_pending_addresses(geocoder=None, limit=BATCH_SIZE):
+    """
+    Geocode a batch of pending addresses
+
+    Args:
+        geocoder: Geocoder to use (defaults to get_geocoder())
+        limit: Maximum number of addresses to geocode
+
+    Returns:
+        Number of addresses geocoded (0 when offline)
+
+    Raises:
+        GeocodeError: If the geocoding service failed; the addresses done
+            before the failure are saved
+    """
+    geocoder = geocoder or get_geocoder()
+    if geocoder is None:
+        return 0
+
+    addresses = Address.query.filter_by(
+        geocode_status='pending'
+    ).order_by(Address.id).limit(limit).all()
+
+    done = 0
+    try:
+        for address in addresses:
+            geocode_address(address, geocoder)
+            done += 1
+    finally:
+        db.session.commit()
+
+    if done:
+        logger.info(f"Geocoded {done} pending addresses")
+    return done
+
+
+class GeocodeWorker:
+    """Daemon thread that geocodes pending addresses for one application"""
+
+    def __init__(self, app):
+        self.app = app
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        config = self.app.config
+        return config.get('GEOCODE_IN_BACKGROUND', False) and config.get('GEOCODER') != 'offline' \
+            and not config.get('TESTING')
+
+    def notify(self):
+        """Wake the worker (starting it on first use) to look for new addresses"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.run, name='geocoder', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def run(self):
+        """Worker loop: geocode pending addresses, then sleep until woken or polling"""
+        with self.app.app_context():
+            while True:
+                self._wakeup.clear()
+                timeout = POLL_INTERVAL_SECONDS
+                try:
+                    while fill_pending_addresses():
+                        pass
+                except GeocodeError as e:
+                    logger.warning(f"Geocoding failed, retrying in {RETRY_SECONDS} s: {str(e)}")
+                    timeout = RETRY_SECONDS
+                except Exception as e:
+                    logger.error(f"Geocoding worker error: {str(e)}")
+                    db.session.rollback()
+                    timeout = RETRY_SECONDS
+                finally:
+                    db.session.remove()
+
+                self._wakeup.wait(timeout)
+
+
+_worker = None
+
+
+def init_app(app):
+    """
+    Set up background geocoding for an application
+
+    With GEOCODE_IN_BACKGROUND set, the worker thread starts on the first
+    pending address. Otherwise pending addresses are left for a separate
+    `flask geocode-worker` process, so only one process calls the
+    geocoding service.
+    """
+    global _worker
+
+    _worker = GeocodeWorker(app)
+    app.extensions['geocoding'] = _worker
+    return _worker
+
+
+@on_change(Address)
+def wake_worker(changes):
+    """Wake the geocoding worker when addresses need geocoding"""
+    if _worker is None or not changes:
+        return
+    if any(change.values.get('geocode_status') == 'pending' for change in changes
+           if change.action != 'delete'):
+        _worker.notify()
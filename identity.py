@@ -0,0 +1,136 @@
+"""
+Cached identity of the logged-in user.
+
+Many pages only need to know who is logged in: their role and name. An
+Identity is a small snapshot of those fields, kept in a process-wide
+cache for IDENTITY_CACHE_TTL seconds (default 30; 0 disables the cache)
+so such pages render without touching the database. Changes committed in
+this process evict the affected entries at once; changes made by other
+processes are picked up when the entry expires.
+"""
+
+import threading
+import time
+from collections import namedtuple
+
+from flask import current_app
+
+from db_setup import db
+from model_events import changed_columns, on_change
+from models import Customer, Provider
+
+DEFAULT_TTL = 30
+
+# Bound on cached identities, so the cache cannot grow without limit
+MAX_ENTRIES = 10000
+
+_MODELS = {'customer': Customer, 'provider': Provider}
+
+
+class Identity(namedtuple('Identity', 'id user_type first_name last_name is_verified')):
+    """Snapshot of a user's identity"""
+
+    __slots__ = ()
+
+    def get_full_name(self):
+        """Return user's full name"""
+        return f"{self.first_name} {self.last_name}"
+
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def identity_of(user):
+    """Build the Identity of a loaded Customer or Provider"""
+    user_type = 'customer' if isinstance(user, Customer) else 'provider'
+    return Identity(user.id, user_type, user.first_name, user.last_name, bool(user.is_verified))
+
+
+def _ttl():
+    return current_app.config.get('IDENTITY_CACHE_TTL', DEFAULT_TTL)
+
+
+def get_identity(user_type, user_id):
+    """
+    Get the identity of a user, from the cache when possible
+
+    Args:
+        user_type: 'customer' or 'provider'
+        user_id: ID of the user
+
+    Returns:
+        Identity, or None if the user does not exist
+    """
+    model = _MODELS.get(user_type)
+    if model is None:
+        return None
+
+    ttl = _ttl()
+    key = (user_type, user_id)
+    now = time.monotonic()
+
+    if ttl > 0:
+        with _lock:
+            entry = _cache.get(key)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+
+    row = db.session.query(
+        model.id, model.first_name, model.last_name, model.is_verified
+    ).filter(model.id == user_id).first()
+    if row is None:
+        return None
+
+    identity = Identity(row.id, user_type, row.first_name, row.last_name, bool(row.is_verified))
+    if ttl > 0:
+        remember(identity, now + ttl)
+    return identity
+
+
+def remember(identity, expires_at=None):
+    """Store an identity in the cache"""
+    if expires_at is None:
+        ttl = _ttl()
+        if ttl <= 0:
+            return
+        expires_at = time.monotonic() + ttl
+
+    with _lock:
+        if len(_cache) >= MAX_ENTRIES:
+            now = time.monotonic()
+            for key in [k for k, (expiry, _) in _cache.items() if expiry <= now]:
+                del _cache[key]
+            if len(_cache) >= MAX_ENTRIES:
+                _cache.clear()
+        _cache[(identity.user_type, identity.id)] = (expires_at, identity)
+
+
+def forget_identities():
+    """Empty the identity cache"""
+    with _lock:
+        _cache.clear()
+
+
+# Columns copied into an Identity
+_IDENTITY_COLUMNS = {'first_name', 'last_name', 'is_verified'}
+
+
+@on_change(Customer, Provider)
+def invalidate_identities(changes):
+    """Evict the identities of renamed, re-verified or deleted users"""
+    if changes is None:
+        forget_identities()
+        return
+
+    with _lock:
+        for change in changes:
+            columns = changed_columns(change)
+            if columns is not None and not columns & _IDENTITY_COLUMNS:
+                continue
+            if change.action == 'bulk_update':
+                _cache.clear()
+                return
+
+            user_type = 'customer' if change.model is Customer else 'provider'
+            _cache.pop((user_type, change.values['id']), None)
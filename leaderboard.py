@@ -0,0 +1,148 @@
+"""
+Materialized top-rated providers leaderboard.
+
+The home page shows the best rated providers on every view, so the
+rankings are computed ahead of time and kept in memory: the top
+LEADERBOARD_SIZE verified providers overall and within each service
+category, as immutable Leader snapshots.
+
+The leaderboard is rebuilt (two indexed queries) on the first read after
+a committed change that can reorder it: a new rating, a provider being
+verified, renamed or removed, or a provider adding or dropping a service.
+Changes made by other processes are picked up by a scheduled refresh
+every LEADERBOARD_REFRESH_SECONDS (default 300).
+"""
+
+import logging
+from collections import namedtuple
+
+from flask import current_app
+
+from db_setup import db
+from generation_cache import GenerationCache
+from model_events import changed_columns, on_change
+from models import Provider, ProviderCategory
+
+logger = logging.getLogger(__name__)
+
+# Providers kept per ranking; longer lists can't be served from memory
+LEADERBOARD_SIZE = 20
+
+DEFAULT_REFRESH_SECONDS = 300
+
+
+class Leader(namedtuple('Leader', 'id first_name last_name avg_rating rating_count experience_years')):
+    """Snapshot of a ranked provider"""
+
+    __slots__ = ()
+
+    def get_full_name(self):
+        """Return provider's full name"""
+        return f"{self.first_name} {self.last_name}"
+
+
+# Built leaderboard: overall ranking and rankings by category ID
+Leaderboard = namedtuple('Leaderboard', 'overall by_category')
+
+_COLUMNS = (
+    Provider.id, Provider.first_name, Provider.last_name,
+    Provider.avg_rating, Provider.rating_count, Provider.experience_years
+)
+
+# Best rating first, then the rating backed by the most reviews
+_RANKING = (Provider.avg_rating.desc(), Provider.rating_count.desc(), Provider.id)
+
+_cache = GenerationCache()
+
+
+def _ranked():
+    return (Provider.is_verified == True, Provider.avg_rating.isnot(None))
+
+
+def _build_leaderboard():
+    overall = db.session.query(*_COLUMNS).filter(
+        *_ranked()
+    ).order_by(*_RANKING).limit(LEADERBOARD_SIZE).all()
+
+    # Rank providers within each category in the database and keep only
+    # the top of each
+    position = db.func.row_number().over(
+        partition_by=ProviderCategory.category_id, order_by=_RANKING
+    ).label('position')
+    ranked = db.session.query(
+        ProviderCategory.category_id, *_COLUMNS, position
+    ).join(
+        Provider, Provider.id == ProviderCategory.provider_id
+    ).filter(*_ranked()).subquery()
+
+    rows = db.session.query(ranked).filter(
+        ranked.c.position <= LEADERBOARD_SIZE
+    ).order_by(ranked.c.category_id, ranked.c.position).all()
+
+    by_category = {}
+    for row in rows:
+        by_category.setdefault(row.category_id, []).append(Leader(*row[1:-1]))
+
+    logger.info(f"Built provider leaderboard ({len(overall)} providers, {len(by_category)} categories)")
+    return Leaderboard(
+        tuple(Leader(*row) for row in overall),
+        {category_id: tuple(leaders) for category_id, leaders in by_category.items()}
+    )
+
+
+def _get_leaderboard():
+    refresh = current_app.config.get('LEADERBOARD_REFRESH_SECONDS', DEFAULT_REFRESH_SECONDS)
+    return _cache.get(None, _build_leaderboard, ttl=refresh)
+
+
+def get_top_providers(limit=5, category_id=None):
+    """
+    Get the top-rated verified providers
+
+    Args:
+        limit: Maximum number of providers to return (at most LEADERBOARD_SIZE)
+        category_id: Only rank providers offering this category (optional)
+
+    Returns:
+        Tuple of Leader, best rated first
+    """
+    leaderboard = _get_leaderboard()
+    if category_id is None:
+        return leaderboard.overall[:limit]
+    return leaderboard.by_category.get(category_id, ())[:limit]
+
+
+def refresh_leaderboard():
+    """Rebuild the leaderboard now"""
+    invalidate_leaderboard(None)
+    return _get_leaderboard()
+
+
+# Provider columns that decide or are shown in a ranking
+_RANKING_COLUMNS = {
+    'first_name', 'last_name', 'experience_years',
+    'avg_rating', 'rating_count', 'is_verified'
+}
+
+
+@on_change(Provider, ProviderCategory)
+def invalidate_leaderboard(changes):
+    """Drop the leaderboard after a change that can reorder it"""
+    if changes is not None:
+        relevant = False
+        for change in changes:
+            columns = changed_columns(change)
+            if change.model is ProviderCategory:
+                # A price change doesn't move anyone
+                relevant = columns is None or 'category_id' in columns or 'provider_id' in columns
+            elif columns is None:
+                # Unrated or unverified providers can't be on the board
+                relevant = bool(change.values.get('is_verified')) and change.values.get('avg_rating') is not None
+            else:
+                relevant = bool(columns & _RANKING_COLUMNS)
+            if relevant:
+                break
+        if not relevant:
+            return
+
+    _cache.invalidate()
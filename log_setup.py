@@ -0,0 +1,217 @@
+"""
+Queue-based logging pipeline.
+
+Log calls never touch the disk on the calling thread. The root logger's
+only handler is a QueueHandler, which formats the record and puts it on
+a bounded in-memory queue. A QueueListener thread takes records off the
+queue and writes them to the rotating log file and to stderr. When the
+writer falls behind and the queue is full, new records are dropped and
+counted instead of blocking the request.
+
+Settings (read by create_app from the environment):
+
+    LOG_FILE          log file (default logs/hire_platform.log)
+    LOG_MAX_BYTES     size at which the file is rotated (default 10 MB)
+    LOG_BACKUP_COUNT  rotated files kept (default 10)
+    LOG_LEVEL         level of the root logger (default INFO)
+    LOG_LEVELS        per-module levels, e.g. "services=WARNING,sqlalchemy.engine=INFO"
+    LOG_QUEUE_SIZE    records held for the writer before dropping (default 10000)
+"""
+
+import atexit
+import logging
+import os
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+DEFAULT_LOG_FILE = os.path.join('logs', 'hire_platform.log')
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_BACKUP_COUNT = 10
+DEFAULT_LEVEL = 'INFO'
+DEFAULT_QUEUE_SIZE = 10000
+
+# How long shutdown waits for room on a full queue
+STOP_TIMEOUT_SECONDS = 5
+
+LOG_FORMAT = '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
+CONSOLE_FORMAT = '[%(asctime)s] %(levelname)s in %(module)s: %(message)s'
+
+
+def parse_levels(spec):
+    """
+    Parse per-module log levels
+
+    Args:
+        spec: Comma-separated "logger=LEVEL" pairs (may be empty)
+
+    Returns:
+        Dict mapping logger name to level number
+
+    Raises:
+        ValueError: If a pair or level is invalid
+    """
+    levels = {}
+    for pair in (spec or '').split(','):
+        if not pair.strip():
+            continue
+        name, sep, level = pair.partition('=')
+        level_number = logging.getLevelName(level.strip().upper())
+        if not sep or not name.strip() or not isinstance(level_number, int):
+            raise ValueError(f"Invalid log level setting: {pair.strip()}")
+        levels[name.strip()] = level_number
+    return levels
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops records when the queue is full instead of blocking"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _Listener(QueueListener):
+    # Wait (briefly) for room for the stop sentinel instead of losing it
+    # to a full queue and waiting for the writer forever
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel, timeout=STOP_TIMEOUT_SECONDS)
+
+
+class LogPipeline:
+    """
+    Queue handler and background writer
+
+    Args:
+        handlers: Handlers the writer thread passes records to
+        queue_size: Records held for the writer before dropping
+    """
+
+    def __init__(self, handlers, queue_size=DEFAULT_QUEUE_SIZE):
+        self.handlers = list(handlers)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.handler = DroppingQueueHandler(self.queue)
+        self.listener = _Listener(self.queue, *self.handlers, respect_handler_level=True)
+        self._lock = threading.Lock()
+        self._running = False
+
+    def start(self):
+        """Start the writer thread"""
+        with self._lock:
+            if not self._running:
+                self.listener.start()
+                self._running = True
+
+    def stop(self):
+        """Write out the queued records, stop the writer and close the handlers"""
+        with self._lock:
+            if self._running:
+                self._running = False
+                try:
+                    self.listener.stop()
+                except queue.Full:
+                    logging.getLogger(__name__).warning("Log writer stuck, queued records lost")
+        for handler in self.handlers:
+            handler.close()
+
+    def restart_after_fork(self):
+        """Give a forked child its own queue and writer (threads don't survive fork)"""
+        self.queue = queue.Queue(maxsize=self.queue.maxsize)
+        self.handler.queue = self.queue
+        self.listener.queue = self.queue
+        self._lock = threading.Lock()
+        self._running = False
+        self.start()
+
+    def stats(self):
+        """
+        Get the pipeline's counters
+
+        Returns:
+            Dict with records waiting for the writer and records dropped
+        """
+        return {'queued': self.queue.qsize(), 'dropped': self.handler.dropped}
+
+
+_pipeline = None
+
+
+def get_pipeline():
+    """Get the running pipeline (None before configure_logging)"""
+    return _pipeline
+
+
+def configure_logging(config):
+    """
+    Route all logging through a new pipeline, replacing any previous one
+
+    Args:
+        config: Mapping with the LOG_* settings (missing ones use defaults)
+
+    Returns:
+        LogPipeline
+
+    Raises:
+        ValueError: If LOG_LEVEL or LOG_LEVELS is invalid
+    """
+    global _pipeline
+
+    level = logging.getLevelName(str(config.get('LOG_LEVEL', DEFAULT_LEVEL)).upper())
+    if not isinstance(level, int):
+        raise ValueError(f"Invalid log level: {config.get('LOG_LEVEL')}")
+    levels = parse_levels(config.get('LOG_LEVELS'))
+
+    log_file = config.get('LOG_FILE', DEFAULT_LOG_FILE)
+    log_dir = os.path.dirname(log_file)
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+
+    file_handler = RotatingFileHandler(
+        log_file,
+        maxBytes=config.get('LOG_MAX_BYTES', DEFAULT_MAX_BYTES),
+        backupCount=config.get('LOG_BACKUP_COUNT', DEFAULT_BACKUP_COUNT),
+        delay=True
+    )
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+
+    pipeline = LogPipeline(
+        [file_handler, console_handler], config.get('LOG_QUEUE_SIZE', DEFAULT_QUEUE_SIZE)
+    )
+
+    root = logging.getLogger()
+    old_pipeline = _pipeline
+    if old_pipeline is not None:
+        root.removeHandler(old_pipeline.handler)
+    root.addHandler(pipeline.handler)
+    root.setLevel(level)
+    for name, module_level in levels.items():
+        logging.getLogger(name).setLevel(module_level)
+
+    pipeline.start()
+    _pipeline = pipeline
+    if old_pipeline is not None:
+        old_pipeline.stop()
+    return pipeline
+
+
+def _stop_pipeline():
+    if _pipeline is not None:
+        _pipeline.stop()
+
+
+def _restart_pipeline():
+    if _pipeline is not None:
+        _pipeline.restart_after_fork()
+
+
+atexit.register(_stop_pipeline)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_pipeline)
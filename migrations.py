@@ -0,0 +1,133 @@
+"""
+In-place schema upgrades for existing databases.
+
+db.create_all() creates missing tables but never alters existing ones.
+upgrade_schema() adds the columns and indexes introduced after a table
+was first created, so a database from an older release keeps working
+without being dropped and regenerated.
+"""
+
+import logging
+
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
+
+from db_setup import db
+
+logger = logging.getLogger(__name__)
+
+# Columns added to existing tables: (table, column, DDL type and constraints)
+ADDED_COLUMNS = [
+    ('providers', 'rating_sum', 'INTEGER NOT NULL DEFAULT 0'),
+    ('providers', 'rating_count', 'INTEGER NOT NULL DEFAULT 0'),
+    ('addresses', 'geocode_status', 'VARCHAR(12)'),
+]
+
+
+def _normalize_booking_time_slots(connection):
+    # Older bookings stored the bare start time ('10:00'); store the full
+    # slot so the unique index compares like with like
+    from availability import TIME_SLOTS
+
+    for slot in TIME_SLOTS:
+        connection.execute(
+            text("UPDATE bookings SET time_slot = :slot WHERE time_slot = :start"),
+            {'slot': slot, 'start': slot[:5]}
+        )
+
+
+def _backfill_rating_aggregates(connection):
+    # New rating aggregates start from the ratings already given, so the
+    # next rating is added to the provider's history instead of replacing
+    # it; providers without rated bookings keep their avg_rating
+    rated = (
+        "FROM bookings WHERE bookings.provider_id = providers.id "
+        "AND bookings.status = 'completed' AND bookings.rating IS NOT NULL"
+    )
+    connection.execute(text(
+        f"UPDATE providers SET "
+        f"rating_count = (SELECT COUNT(bookings.rating) {rated}), "
+        f"rating_sum = (SELECT COALESCE(SUM(bookings.rating), 0) {rated})"
+    ))
+    connection.execute(text(
+        "UPDATE providers SET avg_rating = ROUND(CAST(rating_sum AS FLOAT) / rating_count, 2) "
+        "WHERE rating_count > 0"
+    ))
+
+
+# Data fixes run once, in the same transaction that first adds a column
+COLUMN_DATA_MIGRATIONS = {
+    'providers.rating_sum': _backfill_rating_aggregates,
+    'providers.rating_count': _backfill_rating_aggregates,
+}
+
+# Data fixes run once, in the same transaction that first creates an index
+INDEX_DATA_MIGRATIONS = {
+    'uq_booking_active_slot': _normalize_booking_time_slots,
+}
+
+
+def upgrade_schema():
+    """
+    Add any missing columns and indexes to existing tables
+
+    An index that existing rows violate (e.g. a unique index over duplicate
+    data) is skipped with an error in the log; the next startup tries again
+    once the data is fixed.
+
+    Returns:
+        List of "table.column" and index names that were added
+    """
+    inspector = inspect(db.engine)
+    tables = set(inspector.get_table_names())
+    columns = {}
+    added = []
+
+    with db.engine.begin() as connection:
+        # Inspect through the transaction's own connection: checking out
+        # another one can roll this transaction back (e.g. with SQLite's
+        # single shared in-memory connection)
+        inspector = inspect(connection)
+        for table, column, ddl in ADDED_COLUMNS:
+            if table not in tables:
+                continue
+            if table not in columns:
+                columns[table] = {c['name'] for c in inspector.get_columns(table)}
+            if column in columns[table]:
+                continue
+
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+            columns[table].add(column)
+            added.append(f"{table}.{column}")
+
+        # After all columns are added, as a fix can read several of them
+        migrations = []
+        for name in added:
+            migration = COLUMN_DATA_MIGRATIONS.get(name)
+            if migration is not None and migration not in migrations:
+                migrations.append(migration)
+        for migration in migrations:
+            migration(connection)
+
+    # Indexes declared on the models but missing from the database, each in
+    # its own transaction so one failure does not block the others
+    for table in db.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        existing = {index['name'] for index in inspect(db.engine).get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            try:
+                with db.engine.begin() as connection:
+                    if index.name in INDEX_DATA_MIGRATIONS:
+                        INDEX_DATA_MIGRATIONS[index.name](connection)
+                    index.create(connection)
+            except IntegrityError as e:
+                logger.error(f"Could not create index {index.name}, fix the conflicting rows: {str(e.orig)}")
+                continue
+            added.append(index.name)
+
+    if added:
+        logger.info(f"Added to schema: {', '.join(added)}")
+    return added
@@ -0,0 +1,198 @@
+"""
+Commit-time change notifications for in-process caches.
+
+A cache registers a callback for the models it is derived from. The
+callback runs after a successful commit that inserted, updated or deleted
+rows of those models, and also when their tables are created or dropped,
+so a freshly created schema never sees stale entries.
+"""
+
+import logging
+import threading
+from collections import namedtuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+
+logger = logging.getLogger(__name__)
+
+# One ORM row change captured at flush time.
+#   model:    the mapped class (e.g. Booking)
+#   action:   'insert', 'update', 'delete', or 'bulk_update' for
+#             Query.update() statements, which can touch any number of rows
+#   values:   column values of the row after the change; for bulk updates
+#             the SET clause (column name -> value or SQL expression)
+#   previous: old values of the columns changed by an update (None if the
+#             old value was never loaded)
+ModelChange = namedtuple('ModelChange', 'model action values previous')
+
+_listeners = []
+_watched_models = set()
+_lock = threading.Lock()
+
+_PENDING_KEY = 'model_events_pending'
+
+
+def on_change(*models):
+    """
+    Register a callback for committed changes to the given models
+
+    The callback is called with a list of ModelChange tuples after each
+    commit touching one of the models, or with None when one of their
+    tables is created or dropped (the cache should then reset itself).
+    Callbacks run outside the transaction and must not issue SQL.
+
+    Args:
+        *models: Model classes the cache depends on
+
+    Returns:
+        Decorator registering the callback
+    """
+    def decorator(callback):
+        with _lock:
+            _listeners.append((frozenset(models), callback))
+            for model in models:
+                _watch(model)
+        return callback
+    return decorator
+
+
+def changed_columns(change):
+    """
+    Get the names of the columns a change touched
+
+    Args:
+        change: ModelChange
+
+    Returns:
+        Set of column names, or None for inserts and deletes (all columns)
+    """
+    if change.action == 'update':
+        return set(change.previous)
+    if change.action == 'bulk_update':
+        return set(change.values)
+    return None
+
+
+def record_bulk_change(session, model, columns):
+    """
+    Report a write that bypasses the ORM events
+
+    Session.bulk_update_mappings() and Core statements don't go through
+    the flush, so their changes are not captured. The change is reported
+    to listeners as a bulk update of the given columns when the session
+    commits (and dropped if it rolls back).
+
+    Args:
+        session: Session the write ran in
+        model: Model class of the written rows
+        columns: Names of the columns written
+    """
+    if model not in _watched_models:
+        return
+    session.info.setdefault(_PENDING_KEY, []).append(
+        ModelChange(model, 'bulk_update', dict.fromkeys(columns), {})
+    )
+
+
+def _watch(model):
+    """Attach flush and DDL listeners to a model (once per model)"""
+    if model in _watched_models:
+        return
+    _watched_models.add(model)
+
+    for action in ('insert', 'update', 'delete'):
+        event.listen(model, f'after_{action}', _make_recorder(model, action))
+
+    event.listen(model.__table__, 'after_create', _make_reset(model))
+    event.listen(model.__table__, 'after_drop', _make_reset(model))
+
+
+def _make_recorder(model, action):
+    def record(mapper, connection, target):
+        session = object_session(target)
+        if session is None:
+            return
+
+        state = inspect(target)
+        values = {}
+        previous = {}
+        for attr in mapper.column_attrs:
+            values[attr.key] = state.dict.get(attr.key)
+            if action == 'update':
+                history = state.attrs[attr.key].history
+                if history.deleted:
+                    previous[attr.key] = history.deleted[0]
+                elif history.added:
+                    # Set while expired, so the old value was never loaded
+                    previous[attr.key] = None
+
+        session.info.setdefault(_PENDING_KEY, []).append(
+            ModelChange(model, action, values, previous)
+        )
+    return record
+
+
+def _make_reset(model):
+    def reset(target, connection, **kw):
+        _dispatch({model}, None)
+    return reset
+
+
+def _dispatch(models, changes):
+    """Call every listener interested in one of the changed models"""
+    for watched, callback in list(_listeners):
+        if not watched & models:
+            continue
+
+        if changes is None:
+            payload = None
+        else:
+            payload = [change for change in changes if change.model in watched]
+
+        try:
+            callback(payload)
+        except Exception as e:
+            # A broken cache must never fail the commit that triggered it
+            logger.error(f"Cache listener {callback.__name__} failed: {str(e)}")
+
+
+@event.listens_for(Session, 'before_flush')
+def _load_watched(session, flush_context, instances):
+    # Objects expired by an earlier commit may be modified without their
+    # other columns being reloaded; load them now so the change snapshot
+    # taken during the flush is complete
+    for obj in list(session.dirty) + list(session.deleted):
+        if type(obj) not in _watched_models:
+            continue
+        state = inspect(obj)
+        unloaded = state.unloaded & set(state.mapper.column_attrs.keys())
+        if unloaded:
+            getattr(obj, next(iter(unloaded)))
+
+
+@event.listens_for(Session, 'after_bulk_update')
+def _record_bulk_update(update_context):
+    model = update_context.mapper.class_
+    if model not in _watched_models:
+        return
+
+    values = {}
+    for key, value in update_context.values.items():
+        values[getattr(key, 'key', key)] = value
+
+    update_context.session.info.setdefault(_PENDING_KEY, []).append(
+        ModelChange(model, 'bulk_update', values, {})
+    )
+
+
+@event.listens_for(Session, 'after_commit')
+def _after_commit(session):
+    changes = session.info.pop(_PENDING_KEY, None)
+    if changes:
+        _dispatch({change.model for change in changes}, changes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _after_rollback(session):
+    session.info.pop(_PENDING_KEY, None)
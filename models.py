@@ -44,12 +44,22 @@ class Provider(db.Model):
     is_verified = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Running rating aggregates, updated in O(1) per new rating
+    # (avg_rating = rating_sum / rating_count)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
     # Relationships
     addresses = db.relationship('Address', backref='provider', lazy=True, 
                               foreign_keys='Address.provider_id')
     services = db.relationship('ProviderCategory', backref='provider', lazy=True)
     bookings = db.relationship('Booking', backref='provider', lazy=True)
     
+    __table_args__ = (
+        # Top-rated rankings (leaderboard)
+        db.Index('ix_provider_top_rated', 'is_verified', 'avg_rating', 'rating_count'),
+    )
+    
     def get_full_name(self):
         """Return provider's full name"""
         return f"{self.first_name} {self.last_name}"
@@ -101,9 +111,24 @@ class Address(db.Model):
     latitude = db.Column(db.Float, nullable=True)
     longitude = db.Column(db.Float, nullable=True)
     
+    # Where the coordinates came from (see geocoding.py):
+    #   pending:     not geocoded yet; may hold approximate postal code
+    #                coordinates until the background geocoder runs
+    #   exact:       geocoded from the full address
+    #   approximate: the geocoder found nothing; postal code coordinates
+    #   manual:      entered by the user
+    # NULL for addresses saved before geocoding was tracked
+    GEOCODE_STATUS_CHOICES = ['pending', 'exact', 'approximate', 'manual']
+    geocode_status = db.Column(db.String(12), nullable=True)
+    
     # Relationships
     bookings = db.relationship('Booking', backref='address', lazy=True)
     
+    __table_args__ = (
+        # Background geocoder's work queue
+        db.Index('ix_address_geocode_status', 'geocode_status'),
+    )
+    
     def get_full_address(self):
         """Return the full formatted address"""
         return f"{self.address_line}, {self.city}, {self.state} {self.postal_code}"
@@ -114,6 +139,9 @@ class Address(db.Model):
         else:
             return f"<Address (Provider {self.provider_id}): {self.get_full_address()}>"
 
+# Condition of the partial indexes on active bookings (see Booking.is_active)
+_ACTIVE_CONDITION = db.text("status IN ('pending', 'confirmed')")
+
 class Booking(db.Model):
     """Booking model with state machine"""
     __tablename__ = 'bookings'
@@ -136,6 +164,9 @@ class Booking(db.Model):
     STATUS_CHOICES = ['pending', 'confirmed', 'completed', 'cancelled']
     status = db.Column(db.String(20), default='pending', nullable=False)
     
+    # Statuses that hold on to their time slot
+    ACTIVE_STATUSES = ('pending', 'confirmed')
+    
     # Rating (1-5 stars, only filled after service completion)
     rating = db.Column(db.Integer, nullable=True)
     rating_comment = db.Column(db.Text, nullable=True)
@@ -144,6 +175,33 @@ class Booking(db.Model):
     payment = db.relationship('Payment', backref='booking', lazy=True, uselist=False)
     category = db.relationship('ServiceCategory')
     
+    __table_args__ = (
+        # One active booking per provider and slot, enforced by the database
+        # so concurrent requests cannot double-book. Also serves conflict
+        # checks (all three columns) and availability loads (date ranges)
+        db.Index('uq_booking_active_slot', 'booking_date', 'provider_id', 'time_slot', unique=True,
+                 sqlite_where=_ACTIVE_CONDITION, postgresql_where=_ACTIVE_CONDITION),
+        # Dashboards, newest first
+        db.Index('ix_booking_customer_created', 'customer_id', 'created_at'),
+        db.Index('ix_booking_provider_created', 'provider_id', 'created_at'),
+        # Rating aggregates of a provider's completed bookings
+        db.Index('ix_booking_provider_rating', 'provider_id', 'status', 'rating'),
+    )
+    
+    @classmethod
+    def is_active(cls):
+        """
+        Filter on bookings that hold their time slot
+        
+        The statuses are rendered as literals rather than bound parameters:
+        SQLite only uses a partial index when the query repeats the index
+        condition as written.
+        """
+        return cls.status.in_(db.bindparam(
+            'active_statuses', list(cls.ACTIVE_STATUSES),
+            expanding=True, literal_execute=True, unique=True
+        ))
+    
     def __repr__(self):
         return f"<Booking {self.id} status={self.status}>"
 
@@ -185,5 +243,57 @@ class OTPVerification(db.Model):
     expires_at = db.Column(db.DateTime, nullable=False)
     is_used = db.Column(db.Boolean, default=False)
     
+    __table_args__ = (
+        # Latest unused code of a user (verify_otp)
+        db.Index('ix_otp_user_active', 'user_id', 'user_type', 'is_used', 'created_at'),
+        # Expired codes (purge_expired_otps)
+        db.Index('ix_otp_expires_at', 'expires_at'),
+    )
+    
+    def __repr__(self):
+        return f"<OTPVerification for {self.user_type} {self.user_id}>"
+
+class SMSJob(db.Model):
+    """Outgoing SMS waiting for (or done with) background delivery"""
+    __tablename__ = 'sms_jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    phone = db.Column(db.String(20), nullable=False)
+    body = db.Column(db.String(320), nullable=False)
+    
+    # Delivery status: pending -> sent, or pending -> failed after retries
+    STATUS_CHOICES = ['pending', 'sent', 'failed']
+    status = db.Column(db.String(10), default='pending', nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    last_error = db.Column(db.String(255), nullable=True)
+    
+    # Scheduling: due time of the next attempt, and the lease held by the
+    # worker currently sending it (so two workers never send the same job)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    locked_until = db.Column(db.DateTime, nullable=True)
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (
+        # Finished jobs past their retention (purge_finished_jobs)
+        db.Index('ix_sms_job_status_created', 'status', 'created_at'),
+    )
+    
+    def __repr__(self):
+        return f"<SMSJob {self.id} status={self.status}>"
+
+class GeocodeCache(db.Model):
+    """Cached geocoder answer for a normalized address"""
+    __tablename__ = 'geocode_cache'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    # Normalized "address line, city|postal code" (see geocoding.cache_key)
+    query_key = db.Column(db.String(255), unique=True, nullable=False)
+    # NULL when the geocoder found no match
+    latitude = db.Column(db.Float, nullable=True)
+    longitude = db.Column(db.Float, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
     def __repr__(self):
-        return f"<OTPVerification for {self.user_type} {self.user_id}>"
\ No newline at end of file
+        return f"<GeocodeCache {self.query_key}>"
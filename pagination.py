@@ -0,0 +1,101 @@
+"""
+Keyset (cursor) pagination helpers.
+
+Instead of OFFSET, a page is requested with the sort key of the last row
+already shown; the next page is the rows that sort after it. With an
+index on the sort columns every page costs the same, however deep the
+reader pages. The sort key must be unique, so it always ends with the
+primary key.
+
+Cursors are the sort key values as URL-safe base64 of a JSON list, opaque
+to clients.
+"""
+
+import base64
+import binascii
+import json
+from collections import namedtuple
+
+from sqlalchemy import and_, or_
+
+# One page of results: the rows, and the cursor of the next page (None on
+# the last page)
+Page = namedtuple('Page', 'items next_cursor')
+
+
+def encode_cursor(values):
+    """
+    Encode sort key values as an opaque cursor
+
+    Args:
+        values: List of JSON-serializable values (convert dates to strings)
+
+    Returns:
+        Cursor string
+    """
+    raw = json.dumps(list(values), separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, length):
+    """
+    Decode a cursor produced by encode_cursor
+
+    Args:
+        cursor: Cursor string
+        length: Expected number of values
+
+    Returns:
+        List of values
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {str(e)}")
+
+    if not isinstance(values, list) or len(values) != length:
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def after_key(keys):
+    """
+    Build the filter for rows that sort after a given sort key
+
+    Args:
+        keys: List of (column, value, descending) for each sort column,
+            most significant first
+
+    Returns:
+        SQL expression
+    """
+    clauses = []
+    for i, (column, value, descending) in enumerate(keys):
+        beyond = column < value if descending else column > value
+        equal = [c == v for c, v, _ in keys[:i]]
+        clauses.append(and_(*equal, beyond) if equal else beyond)
+    return or_(*clauses)
+
+
+def fetch_page(query, key_of, per_page):
+    """
+    Run a sorted, filtered query and split off the next cursor
+
+    Args:
+        query: Query already filtered to rows after the cursor and sorted
+        key_of: Function returning the cursor values of a row
+        per_page: Page size
+
+    Returns:
+        Page
+    """
+    rows = query.limit(per_page + 1).all()
+    if len(rows) <= per_page:
+        return Page(rows, None)
+
+    rows = rows[:per_page]
+    return Page(rows, encode_cursor(key_of(rows[-1])))
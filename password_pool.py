@@ -0,0 +1,225 @@
+"""
+Bounded process pool for password hashing and verification.
+
+Password hashes use a deliberately slow key derivation function. Run on
+the request thread, a burst of logins would hold every worker thread and
+stall all other traffic, so hashing and checking are handed to a small
+pool of worker processes instead.
+
+The pool admits at most PASSWORD_POOL_WORKERS + PASSWORD_POOL_QUEUE
+operations at once. Beyond that, calls fail immediately with PoolBusy
+(shown to the user as a 503) instead of queueing behind the storm.
+PASSWORD_HASH_ITERATIONS sets the PBKDF2 cost of new hashes; existing
+hashes keep the cost they were created with.
+
+Workers are started with spawn rather than fork: forking a process that
+already runs threads (request handlers, the log writer) can leave a lock
+held in the child, and would run the at-fork hooks in every worker.
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+logger = logging.getLogger(__name__)
+
+# Defaults for PASSWORD_POOL_WORKERS and PASSWORD_POOL_QUEUE
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+DEFAULT_QUEUE = 16
+
+# Seconds a rejected client is asked to wait before retrying
+RETRY_AFTER_SECONDS = 2
+
+
+class PoolBusy(Exception):
+    """The password pool is saturated"""
+
+
+class PoolMetrics:
+    """Thread-safe counters and timings of one pool"""
+
+    def __init__(self, workers):
+        self._lock = threading.Lock()
+        self.workers = workers
+        self.completed = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def admit(self, limit):
+        with self._lock:
+            if self.in_flight >= limit:
+                self.rejected += 1
+                return False
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            return True
+
+    def finished(self, seconds):
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+
+    def snapshot(self):
+        """
+        Get the current metrics
+
+        Returns:
+            Dict with operations in flight and waiting for a worker (queue
+            depth), the peak in flight, completed and rejected counts, and
+            the average and maximum latency in milliseconds
+        """
+        with self._lock:
+            return {
+                'in_flight': self.in_flight,
+                'queued': max(0, self.in_flight - self.workers),
+                'max_in_flight': self.max_in_flight,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'avg_ms': round(self.total_seconds * 1000 / self.completed, 2) if self.completed else 0.0,
+                'max_ms': round(self.max_seconds * 1000, 2)
+            }
+
+
+class PasswordPool:
+    """
+    Process pool with admission control
+
+    Args:
+        workers: Number of worker processes (0 runs calls on the calling
+            thread, still bounded by max_queue)
+        max_queue: Operations allowed to wait for a busy worker
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, max_queue=DEFAULT_QUEUE):
+        self.workers = workers
+        self.limit = max(workers, 1) + max_queue
+        self.metrics = PoolMetrics(workers)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    def call(self, fn, *args):
+        """
+        Run a function in the pool and wait for its result
+
+        Args:
+            fn: Picklable module-level function
+            *args: Its arguments
+
+        Returns:
+            The function's return value (its exception is re-raised)
+
+        Raises:
+            PoolBusy: If the pool is saturated
+        """
+        if not self.metrics.admit(self.limit):
+            logger.warning(f"Password pool saturated, rejecting {fn.__name__}")
+            raise PoolBusy(f"Password pool saturated ({self.limit} operations in flight)")
+
+        start = time.perf_counter()
+        try:
+            if self.workers == 0:
+                return fn(*args)
+            return self._get_executor().submit(fn, *args).result()
+        finally:
+            self.metrics.finished(time.perf_counter() - start)
+
+    def close(self):
+        """Shut the worker processes down"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+
+_pool = None
+_pool_config = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    Get the shared pool configured by PASSWORD_POOL_WORKERS and
+    PASSWORD_POOL_QUEUE, created on first use and reused by every caller
+    until the configuration changes
+
+    Returns:
+        PasswordPool
+    """
+    global _pool, _pool_config
+
+    config = (
+        current_app.config.get('PASSWORD_POOL_WORKERS', DEFAULT_WORKERS),
+        current_app.config.get('PASSWORD_POOL_QUEUE', DEFAULT_QUEUE)
+    )
+
+    old_pool = None
+    with _pool_lock:
+        if config != _pool_config:
+            old_pool = _pool
+            _pool = PasswordPool(*config)
+            _pool_config = config
+        pool = _pool
+
+    if old_pool is not None:
+        # Waits for the operations still running in the old pool
+        old_pool.close()
+    return pool
+
+
+def _hash_method():
+    iterations = current_app.config.get('PASSWORD_HASH_ITERATIONS')
+    if not iterations:
+        return 'pbkdf2:sha256'
+    return f'pbkdf2:sha256:{int(iterations)}'
+
+
+def hash_password(password):
+    """
+    Hash a password in the pool
+
+    Args:
+        password: Plain-text password
+
+    Returns:
+        Password hash to store
+
+    Raises:
+        PoolBusy: If the pool is saturated
+    """
+    return get_pool().call(generate_password_hash, password, _hash_method())
+
+
+def check_password(password_hash, password):
+    """
+    Check a password against its stored hash in the pool
+
+    Args:
+        password_hash: Stored password hash
+        password: Plain-text password
+
+    Returns:
+        True if the password matches
+
+    Raises:
+        PoolBusy: If the pool is saturated
+    """
+    return get_pool().call(check_password_hash, password_hash, password)
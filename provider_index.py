@@ -0,0 +1,175 @@
+"""
+In-process spatial index of provider locations.
+
+Locations are bucketed into a lat/lng grid sized for their density. A
+radius query only reads the grid cells overlapping the circle instead of
+every location; the scoring engine (scoring.py) keeps one grid per
+category so a radius search only scores the providers near the customer.
+"""
+
+import math
+from collections import defaultdict
+
+EARTH_RADIUS_KM = 6371.0
+
+# Roughly 2.2 km x 1.3 km cells at Dublin's latitude; dense categories
+# get smaller cells (see GridIndex.build)
+DEFAULT_CELL_SIZE_DEG = 0.02
+MIN_CELL_SIZE_DEG = 0.001
+TARGET_POINTS_PER_CELL = 4
+
+# Widens bounding boxes by ~0.1 m so rounding never drops a point at the edge
+BOX_MARGIN_DEG = 1e-6
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """
+    Great-circle distance between two points
+
+    Args:
+        lat1, lng1: Coordinates of the first point (degrees)
+        lat2, lng2: Coordinates of the second point (degrees)
+
+    Returns:
+        Distance in kilometres
+    """
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GridIndex:
+    """Grid-bucketed point index answering radius queries"""
+
+    def __init__(self, cell_size_deg=DEFAULT_CELL_SIZE_DEG):
+        self.cell_size_deg = cell_size_deg
+        self.cells = defaultdict(list)
+        self.size = 0
+        # Lowest and highest occupied cell rows and columns
+        self.bounds = None
+
+    @classmethod
+    def build(cls, points):
+        """
+        Build an index sized for the density of the given points
+
+        Args:
+            points: Iterable of (key, lat, lng) tuples
+
+        Returns:
+            GridIndex with a cell size giving a few points per cell
+        """
+        points = list(points)
+        cell_size = DEFAULT_CELL_SIZE_DEG
+        if len(points) > TARGET_POINTS_PER_CELL:
+            lats = [lat for _, lat, _ in points]
+            lngs = [lng for _, _, lng in points]
+            area = (max(lats) - min(lats)) * (max(lngs) - min(lngs))
+            if area > 0:
+                cell_size = math.sqrt(area * TARGET_POINTS_PER_CELL / len(points))
+                cell_size = min(max(cell_size, MIN_CELL_SIZE_DEG), DEFAULT_CELL_SIZE_DEG)
+
+        index = cls(cell_size)
+        for key, lat, lng in points:
+            index.add(key, lat, lng)
+        return index
+
+    def _cell(self, lat, lng):
+        return (math.floor(lat / self.cell_size_deg), math.floor(lng / self.cell_size_deg))
+
+    def add(self, key, lat, lng):
+        """Add a point; the same key may be added at several locations"""
+        i, j = self._cell(lat, lng)
+        self.cells[(i, j)].append((key, lat, lng))
+        self.size += 1
+        if self.bounds is None:
+            self.bounds = (i, i, j, j)
+        else:
+            low_i, high_i, low_j, high_j = self.bounds
+            self.bounds = (min(low_i, i), max(high_i, i), min(low_j, j), max(high_j, j))
+
+    def candidates(self, lat, lng, radius_km, limit=None):
+        """
+        Find the keys of the points that may lie within a radius
+
+        Only the cells overlapping the circle's bounding box are read. The
+        result includes every point within radius_km and possibly some just
+        outside it, so callers still check the exact distance.
+
+        Args:
+            lat, lng: Centre of the circle (degrees)
+            radius_km: Radius of the circle
+            limit: Give up if more than this many points would be returned
+                (optional)
+
+        Returns:
+            List of keys, once per location added, or None if the box holds
+            every point or more than limit of them
+        """
+        if self.size == 0:
+            return []
+
+        d_lat, d_lng = bounding_degrees(lat, radius_km)
+        low_i, high_i = self._cell_range(lat, d_lat)
+        if d_lng is None or lng - d_lng < -180 or lng + d_lng > 180:
+            # The box spans a pole or the antimeridian; only latitude narrows it down
+            low_j, high_j = -math.inf, math.inf
+        else:
+            low_j, high_j = self._cell_range(lng, d_lng)
+
+        min_i, max_i, min_j, max_j = self.bounds
+        low_i, high_i = max(low_i, min_i), min(high_i, max_i)
+        low_j, high_j = max(low_j, min_j), min(high_j, max_j)
+        if low_i > high_i or low_j > high_j:
+            return []
+        if (low_i, high_i, low_j, high_j) == self.bounds:
+            return None
+
+        # Points expected in the box if they were spread evenly, so a box
+        # over the limit is given up on before its cells are read
+        share = ((high_i - low_i + 1) * (high_j - low_j + 1)
+                 / ((max_i - min_i + 1) * (max_j - min_j + 1)))
+        if limit is not None and share * self.size > limit:
+            return None
+
+        if (high_i - low_i + 1) * (high_j - low_j + 1) <= len(self.cells):
+            cells = [self.cells[cell] for cell in
+                     ((i, j) for i in range(low_i, high_i + 1) for j in range(low_j, high_j + 1))
+                     if cell in self.cells]
+        else:
+            # A large box has more cells than are occupied; scan those instead
+            cells = [points for (i, j), points in self.cells.items()
+                     if low_i <= i <= high_i and low_j <= j <= high_j]
+
+        if limit is not None and sum(map(len, cells)) > limit:
+            return None
+        return [key for points in cells for key, _, _ in points]
+
+    def _cell_range(self, center, half_width):
+        return (math.floor((center - half_width) / self.cell_size_deg),
+                math.floor((center + half_width) / self.cell_size_deg))
+
+
+def bounding_degrees(lat, radius_km):
+    """
+    Half-height and half-width of the box around every point within a
+    radius of a location
+
+    Args:
+        lat: Latitude of the location (degrees)
+        radius_km: Radius in kilometres
+
+    Returns:
+        (d_lat, d_lng) in degrees, slightly widened against rounding; d_lng
+        is None if the circle reaches a pole (every longitude is in range)
+    """
+    angle = radius_km / EARTH_RADIUS_KM
+    cos_lat = math.cos(math.radians(lat))
+    d_lat = math.degrees(angle) + BOX_MARGIN_DEG
+    if angle >= math.pi / 2 or math.sin(angle) >= cos_lat:
+        return d_lat, None
+    return d_lat, math.degrees(math.asin(math.sin(angle) / cos_lat)) + BOX_MARGIN_DEG
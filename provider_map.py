@@ -0,0 +1,211 @@
+"""
+Provider map feed served by /get-providers.
+
+The feed is built from one joined query (plus one selectin load for the
+provider categories) and kept serialized in memory together with its
+ETag. It is rebuilt after a provider, address or provider category change
+is committed in this process, and every PROVIDER_MAP_TTL seconds (default
+60) so changes made by other processes are picked up too. A map refresh
+that sends If-None-Match is a 304 as long as the data hasn't changed.
+
+Maps can also ask for a single viewport: only providers inside the
+bounding box are returned, and below CLUSTER_MAX_ZOOM nearby providers
+are merged into grid-cell clusters (count plus centroid) so the payload
+stays small however many providers there are.
+"""
+
+import hashlib
+import json
+import logging
+import math
+from collections import namedtuple
+
+from flask import current_app
+from sqlalchemy.orm import selectinload
+
+from db_setup import db
+from generation_cache import GenerationCache
+from model_events import on_change
+from models import Provider, ProviderCategory, Address
+
+logger = logging.getLogger(__name__)
+
+# Serialized map payload and its entity tag
+ProviderFeed = namedtuple('ProviderFeed', 'providers body etag')
+
+# Visible map area: south-west and north-east corners in degrees
+Viewport = namedtuple('Viewport', 'south west north east')
+
+DEFAULT_TTL = 60
+
+# Zoom level from which individual providers are always returned
+CLUSTER_MAX_ZOOM = 13
+
+# Zoom levels of Web Mercator map tiles
+MIN_ZOOM = 0
+MAX_ZOOM = 22
+
+# Approximate on-screen size of a cluster cell in pixels
+CLUSTER_CELL_PX = 64
+
+_cache = GenerationCache()
+
+
+def build_provider_feed():
+    """
+    Build the map payload for all verified, available providers
+
+    Each provider is placed at its first address that has coordinates.
+
+    Returns:
+        ProviderFeed with the provider dicts, the JSON body and its ETag
+    """
+    rows = db.session.query(
+        Provider, Address.latitude, Address.longitude
+    ).join(
+        Address, Address.provider_id == Provider.id
+    ).filter(
+        Provider.is_verified == True,
+        Provider.is_available == True,
+        Address.latitude.isnot(None),
+        Address.longitude.isnot(None)
+    ).options(
+        selectinload(Provider.services)
+    ).order_by(Provider.id, Address.id).all()
+
+    providers = []
+    seen = set()
+    for provider, lat, lng in rows:
+        if provider.id in seen:
+            continue
+        seen.add(provider.id)
+        providers.append({
+            'id': provider.id,
+            'name': provider.get_full_name(),
+            'rating': provider.avg_rating,
+            'categories': [pc.category_id for pc in provider.services],
+            'lat': lat,
+            'lng': lng
+        })
+
+    body = json.dumps({'providers': providers}, separators=(',', ':'))
+    etag = hashlib.sha1(body.encode('utf-8')).hexdigest()
+
+    logger.info(f"Built provider map feed with {len(providers)} providers")
+    return ProviderFeed(providers, body, etag)
+
+
+def get_provider_feed():
+    """
+    Get the cached provider map feed, building it if needed
+
+    Returns:
+        ProviderFeed
+    """
+    return _cache.get(None, build_provider_feed, ttl=current_app.config.get('PROVIDER_MAP_TTL', DEFAULT_TTL))
+
+
+@on_change(Provider, Address, ProviderCategory)
+def invalidate_feed(changes):
+    """Drop the cached feed after provider map data changes"""
+    _cache.invalidate()
+
+
+def parse_viewport(bounds):
+    """
+    Parse a "south,west,north,east" bounding box string
+
+    Args:
+        bounds: Bounding box string as sent by the map client
+
+    Returns:
+        Viewport tuple
+
+    Raises:
+        ValueError: If the string is not four valid coordinates
+    """
+    parts = [float(part) for part in bounds.split(',')]
+    if len(parts) != 4:
+        raise ValueError("bounds must be south,west,north,east")
+
+    viewport = Viewport(*parts)
+    if not (-90 <= viewport.south <= viewport.north <= 90):
+        raise ValueError("invalid latitude range")
+    if not (-180 <= viewport.west <= 180 and -180 <= viewport.east <= 180):
+        raise ValueError("invalid longitude range")
+    return viewport
+
+
+def parse_zoom(zoom):
+    """
+    Parse a map zoom level
+
+    Args:
+        zoom: Zoom level as sent by the map client (None for the default)
+
+    Returns:
+        Zoom level between MIN_ZOOM and MAX_ZOOM
+
+    Raises:
+        ValueError: If the value is not an integer in that range
+    """
+    if zoom is None:
+        return CLUSTER_MAX_ZOOM
+    zoom = int(zoom)
+    if not MIN_ZOOM <= zoom <= MAX_ZOOM:
+        raise ValueError(f"zoom must be between {MIN_ZOOM} and {MAX_ZOOM}")
+    return zoom
+
+
+def _in_viewport(viewport, lat, lng):
+    if not viewport.south <= lat <= viewport.north:
+        return False
+    if viewport.west <= viewport.east:
+        return viewport.west <= lng <= viewport.east
+    # Viewport crossing the antimeridian
+    return lng >= viewport.west or lng <= viewport.east
+
+
+def cluster_cell_size(zoom):
+    """Size in degrees of a cluster cell at a Web Mercator zoom level"""
+    return CLUSTER_CELL_PX * 360.0 / (256 * 2 ** zoom)
+
+
+def query_provider_map(viewport, zoom):
+    """
+    Get the providers and clusters visible in a map viewport
+
+    Args:
+        viewport: Viewport to return providers for
+        zoom: Map zoom level (0 = whole world)
+
+    Returns:
+        Dict with 'providers' (individual pins) and 'clusters' (dicts with
+        'lat', 'lng' and 'count'); clusters are only used below
+        CLUSTER_MAX_ZOOM and only for cells holding more than one provider
+    """
+    feed = get_provider_feed()
+    visible = [p for p in feed.providers if _in_viewport(viewport, p['lat'], p['lng'])]
+
+    if zoom >= CLUSTER_MAX_ZOOM:
+        return {'providers': visible, 'clusters': []}
+
+    cell_size = cluster_cell_size(zoom)
+    cells = {}
+    for provider in visible:
+        cell = (math.floor(provider['lat'] / cell_size), math.floor(provider['lng'] / cell_size))
+        cells.setdefault(cell, []).append(provider)
+
+    providers = []
+    clusters = []
+    for members in cells.values():
+        if len(members) == 1:
+            providers.append(members[0])
+            continue
+        clusters.append({
+            'lat': sum(p['lat'] for p in members) / len(members),
+            'lng': sum(p['lng'] for p in members) / len(members),
+            'count': len(members)
+        })
+
+    return {'providers': providers, 'clusters': clusters}
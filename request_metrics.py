@@ -0,0 +1,278 @@
+"""
+Per-request performance instrumentation.
+
+For every request this records the wall time, the number and total time
+of the SQL statements it ran (SQLAlchemy's before/after_cursor_execute
+events) and the time spent rendering templates. Samples are kept per
+endpoint in a rolling window of the last METRICS_WINDOW requests
+(default 1000), from which the /metrics endpoint reports
+percentiles, along with the password pool, SMS transport and logging
+pipeline counters.
+
+A request slower than SLOW_REQUEST_MS (default 500) is logged with its
+statements, identical statements collapsed into one line with a count,
+so an N+1 pattern shows up as one statement run once per row.
+
+/metrics is only added when METRICS_ENABLED is set. If METRICS_TOKEN is
+set too, it only answers requests carrying "Authorization: Bearer <token>".
+"""
+
+import hmac
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WINDOW = 1000
+DEFAULT_SLOW_REQUEST_MS = 500
+
+PERCENTILES = (50, 90, 99)
+
+# Statements kept per request for the slow request log; the rest are only counted
+MAX_RECORDED_STATEMENTS = 200
+
+
+def percentile(sorted_values, p):
+    """
+    Nearest-rank percentile
+
+    Args:
+        sorted_values: Non-empty list of numbers in ascending order
+        p: Percentile (0-100)
+
+    Returns:
+        The smallest value with at least p% of the values at or below it
+    """
+    rank = max(1, math.ceil(len(sorted_values) * p / 100))
+    return sorted_values[rank - 1]
+
+
+class RequestTiming:
+    """Timings of one request, collected while it runs"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.query_count = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        # statement -> [times run, total seconds], in order of first run
+        self.statements = OrderedDict()
+        self.status = None
+
+    def add_query(self, statement, seconds):
+        self.query_count += 1
+        self.sql_seconds += seconds
+        entry = self.statements.get(statement)
+        if entry is not None:
+            entry[0] += 1
+            entry[1] += seconds
+        elif len(self.statements) < MAX_RECORDED_STATEMENTS:
+            self.statements[statement] = [1, seconds]
+
+
+class RequestMetrics:
+    """
+    Rolling per-endpoint samples of finished requests
+
+    Args:
+        window: Requests kept per endpoint
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._counts = {}
+
+    def record(self, endpoint, wall_ms, query_count, sql_ms, template_ms, failed=False, slow=False):
+        with self._lock:
+            samples = self._samples.get(endpoint)
+            if samples is None:
+                samples = self._samples[endpoint] = deque(maxlen=self.window)
+                self._counts[endpoint] = {'count': 0, 'errors': 0, 'slow': 0}
+            samples.append((wall_ms, query_count, sql_ms, template_ms))
+            counts = self._counts[endpoint]
+            counts['count'] += 1
+            counts['errors'] += failed
+            counts['slow'] += slow
+
+    def snapshot(self):
+        """
+        Get the current metrics
+
+        Returns:
+            Dict mapping each endpoint to its request, error (5xx) and slow
+            request counts since startup, and the percentiles and maximum
+            of wall_ms, sql_queries, sql_ms and template_ms over its window
+        """
+        with self._lock:
+            copies = {endpoint: (list(samples), dict(self._counts[endpoint]))
+                      for endpoint, samples in self._samples.items()}
+
+        endpoints = {}
+        for endpoint, (samples, counts) in sorted(copies.items()):
+            for name, values in zip(('wall_ms', 'sql_queries', 'sql_ms', 'template_ms'), zip(*samples)):
+                values = sorted(values)
+                counts[name] = {f'p{p}': round(percentile(values, p), 2) for p in PERCENTILES}
+                counts[name]['max'] = round(values[-1], 2)
+            endpoints[endpoint] = counts
+        return endpoints
+
+    def reset(self):
+        """Forget every sample"""
+        with self._lock:
+            self._samples.clear()
+            self._counts.clear()
+
+
+def _current_timing():
+    if not has_request_context():
+        return None
+    return g.get('_request_timing')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the statement's execution context, so a statement that raises
+    # leaves nothing behind on the connection
+    if context is not None:
+        context._query_start_time = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, '_query_start_time', None)
+    if start is None:
+        return
+    seconds = time.perf_counter() - start
+    timing = _current_timing()
+    if timing is not None:
+        timing.add_query(statement, seconds)
+
+
+_listening = False
+_listen_lock = threading.Lock()
+
+
+def _listen_to_engines():
+    # Engines are created lazily, one per application, so listen on the class
+    global _listening
+    with _listen_lock:
+        if not _listening:
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            _listening = True
+
+
+def _timed_template_class(template_class):
+    class TimedTemplate(template_class):
+        """Template that adds its render time to the current request's timings"""
+
+        def render(self, *args, **kwargs):
+            timing = _current_timing()
+            if timing is None:
+                return super().render(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return super().render(*args, **kwargs)
+            finally:
+                timing.template_seconds += time.perf_counter() - start
+
+    return TimedTemplate
+
+
+def _start_request():
+    g._request_timing = RequestTiming()
+
+
+def _note_status(response):
+    timing = g.get('_request_timing')
+    if timing is not None:
+        timing.status = response.status_code
+    return response
+
+
+def _format_slow_request(timing, wall_ms):
+    lines = [
+        f"Slow request {request.method} {request.path} ({request.endpoint}): "
+        f"{wall_ms:.0f} ms, {timing.query_count} queries in {timing.sql_seconds * 1000:.0f} ms, "
+        f"templates {timing.template_seconds * 1000:.0f} ms"
+    ]
+    for statement, (count, seconds) in timing.statements.items():
+        lines.append(f"  {count}x {seconds * 1000:.1f} ms: {' '.join(statement.split())}")
+    unrecorded = timing.query_count - sum(count for count, _ in timing.statements.values())
+    if unrecorded:
+        lines.append(f"  ... {unrecorded} more")
+    return '\n'.join(lines)
+
+
+def _finish_request(exc):
+    # Runs when the request context is torn down, after a streamed body is sent
+    timing = g.pop('_request_timing', None)
+    if timing is None:
+        return
+
+    wall_ms = (time.perf_counter() - timing.start) * 1000
+    slow = wall_ms >= current_app.config.get('SLOW_REQUEST_MS', DEFAULT_SLOW_REQUEST_MS)
+    failed = exc is not None or (timing.status or 500) >= 500
+    get_metrics().record(
+        request.endpoint or '<unmatched>', wall_ms, timing.query_count,
+        timing.sql_seconds * 1000, timing.template_seconds * 1000, failed, slow
+    )
+    if slow:
+        logger.warning(_format_slow_request(timing, wall_ms))
+
+
+def metrics_view():
+    """Report the request metrics and worker counters as JSON"""
+    from log_setup import get_pipeline
+    from password_pool import get_pool
+    from sms_transport import get_transport
+
+    token = current_app.config.get('METRICS_TOKEN')
+    if token and not hmac.compare_digest(
+        request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode()
+    ):
+        return {'error': 'Not found'}, 404
+
+    transport = get_transport()
+    pipeline = get_pipeline()
+    return {
+        'window': get_metrics().window,
+        'endpoints': get_metrics().snapshot(),
+        'password_pool': get_pool().metrics.snapshot(),
+        'sms_transport': transport.metrics.snapshot() if transport is not None else None,
+        'logging': pipeline.stats() if pipeline is not None else None
+    }
+
+
+def get_metrics():
+    """Get the request metrics of the current application"""
+    return current_app.extensions['request_metrics']
+
+
+def init_app(app):
+    """
+    Instrument every request of an application, and add /metrics if
+    METRICS_ENABLED is set
+
+    Returns:
+        RequestMetrics
+    """
+    _listen_to_engines()
+    app.jinja_env.template_class = _timed_template_class(app.jinja_env.template_class)
+
+    metrics = RequestMetrics(app.config.get('METRICS_WINDOW', DEFAULT_WINDOW))
+    app.extensions['request_metrics'] = metrics
+
+    app.before_request(_start_request)
+    app.after_request(_note_status)
+    app.teardown_request(_finish_request)
+    if app.config.get('METRICS_ENABLED'):
+        app.add_url_rule('/metrics', 'metrics', metrics_view)
+    return metrics
@@ -1,19 +1,29 @@
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, current_app, jsonify, g, abort, stream_with_context
 import os
+import json
 from datetime import datetime, timedelta
 import random
-import requests
+from sqlalchemy.orm import joinedload
 
 from db_setup import db
 from models import (
-    Customer, Provider, ServiceCategory, ProviderCategory, 
+    Customer, Provider, ProviderCategory, 
     Address, Booking, Payment, OTPVerification
 )
 from services import (
     find_matching_providers, verify_otp, 
-    generate_otp, update_provider_rating
+    generate_otp, record_provider_rating, next_available_dates, book_time_slot,
+    get_booking_page, find_top_rated_providers
+)
+from availability import TIME_SLOTS
+from password_pool import hash_password, check_password
+from geocoding import locate_address
+from search import find_providers, iter_providers, DEFAULT_SORT, SORTS
+from identity import get_identity, identity_of, remember
+from catalog import get_categories, get_category
+from provider_map import (
+    get_provider_feed, parse_viewport, parse_zoom, query_provider_map
 )
 
 # Create blueprints for different sections of the application
@@ -26,33 +36,91 @@ payment_bp = Blueprint('payment', __name__, url_prefix='/payment')
 
 # Helper functions
 def get_current_user():
-    """Get the current logged-in user"""
+    """Get the current logged-in user (loaded once per request)"""
     user_id = session.get('user_id')
     user_type = session.get('user_type')
     
     if not user_id or not user_type:
         return None
     
+    cached = g.get('current_user')
+    if cached is not None and cached[:2] == (user_type, user_id):
+        return cached[2]
+    
+    user = None
     if user_type == 'customer':
-        return Customer.query.get(user_id)
+        user = Customer.query.get(user_id)
     elif user_type == 'provider':
-        return Provider.query.get(user_id)
+        user = Provider.query.get(user_id)
+    
+    g.current_user = (user_type, user_id, user)
+    if user is not None:
+        remember(identity_of(user))
+    return user
+
+@main_bp.before_app_request
+def reset_current_user():
+    """Start every request without a cached user (g can outlive a request)"""
+    g.pop('current_user', None)
+
+def get_current_identity():
+    """
+    Get the role and name of the logged-in user
+    
+    For pages that do not need the full user: answered from the loaded
+    user if this request has one, else from the identity cache.
+    """
+    user_id = session.get('user_id')
+    user_type = session.get('user_type')
+    
+    if not user_id or not user_type:
+        return None
+    
+    cached = g.get('current_user')
+    if cached is not None and cached[:2] == (user_type, user_id):
+        return identity_of(cached[2]) if cached[2] is not None else None
     
-    return None
+    return get_identity(user_type, user_id)
+
+def get_search_options():
+    """
+    Read the filters and sort of a provider listing from the query string,
+    ignoring values that don't parse
+    """
+    sort = request.args.get('sort', DEFAULT_SORT)
+    return {
+        'min_rating': request.args.get('min_rating', type=float),
+        'max_price': request.args.get('max_price', type=float),
+        'sort': sort if sort in SORTS else DEFAULT_SORT
+    }
+
+def get_search_location(user, address_id):
+    """
+    Get the coordinates to search from: the chosen address when it is one
+    of the logged-in customer's own
+    
+    Returns:
+        (lat, lng), both None without a usable address
+    """
+    if address_id and user is not None and user.user_type == 'customer':
+        address = Address.query.filter_by(id=address_id, customer_id=user.id).first()
+        if address is not None:
+            return address.latitude, address.longitude
+    return None, None
 
 # Main routes
 @main_bp.route('/')
 def index():
     """Home page"""
-    categories = ServiceCategory.query.all()
-    top_providers = Provider.query.filter(Provider.avg_rating.isnot(None)).order_by(Provider.avg_rating.desc()).limit(5).all()
-    return render_template('index.html', categories=categories, top_providers=top_providers, user=get_current_user())
+    categories = get_categories()
+    top_providers = find_top_rated_providers(5)
+    return render_template('index.html', categories=categories, top_providers=top_providers, user=get_current_identity())
 
 @main_bp.route('/terms')
 def terms():
     """Terms and conditions page"""
     current_date = datetime.now().strftime('%Y-%m-%d')
-    return render_template('terms.html', user=get_current_user(), current_date=current_date)
+    return render_template('terms.html', user=get_current_identity(), current_date=current_date)
 
 @main_bp.route('/verify-otp', methods=['GET', 'POST'])
 def verify_otp_route():
@@ -119,23 +187,33 @@ def logout():
 
 @main_bp.route('/get-providers', methods=['GET'])
 def get_providers():
-    """Fetch all providers with their locations for the map"""
-    providers = Provider.query.filter_by(is_verified=True, is_available=True).all()
-    
-    provider_data = []
-    for provider in providers:
-        address = Address.query.filter_by(provider_id=provider.id).first()
-        if address and address.latitude and address.longitude:
-            provider_data.append({
-                'id': provider.id,
-                'name': provider.get_full_name(),
-                'rating': provider.avg_rating,
-                'categories': [pc.category_id for pc in ProviderCategory.query.filter_by(provider_id=provider.id).all()],
-                'lat': address.latitude,
-                'lng': address.longitude
-            })
-    
-    return {'providers': provider_data}
+    """
+    Fetch providers with their locations for the map
+    
+    Without query arguments every provider is returned. With
+    bounds=south,west,north,east (and optionally zoom) only the providers
+    inside that viewport are returned, clustered at low zoom levels.
+    """
+    bounds = request.args.get('bounds')
+    
+    if not bounds:
+        feed = get_provider_feed()
+        
+        # Serve the cached JSON and let the browser revalidate with If-None-Match
+        response = current_app.response_class(feed.body, mimetype='application/json')
+        response.set_etag(feed.etag)
+    else:
+        try:
+            viewport = parse_viewport(bounds)
+            zoom = parse_zoom(request.args.get('zoom'))
+        except ValueError:
+            return {'error': 'Invalid bounds or zoom'}, 400
+        
+        response = jsonify(query_provider_map(viewport, zoom))
+        response.add_etag()
+    
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 @main_bp.route('/search', methods=['GET'])
 def search_providers():
@@ -147,24 +225,64 @@ def search_providers():
         flash('Please select a service category', 'warning')
         return redirect(url_for('service.service_list'))
     
-    category = ServiceCategory.query.get_or_404(category_id)
-    
-    # Find providers for this category
-    provider_categories = ProviderCategory.query.filter_by(category_id=category_id).all()
-    providers = [pc.provider for pc in provider_categories if pc.provider.is_verified and pc.provider.is_available]
-    
-    # If address is provided, sort providers by rating
-    if address_id:
-        # Sort providers by rating (highest first)
-        providers.sort(key=lambda p: p.avg_rating if p.avg_rating is not None else 0, reverse=True)
+    category = get_category(category_id)
+    if category is None:
+        abort(404)
+    
+    user = get_current_identity()
+    
+    # One page of the category's providers, counting distance from the
+    # chosen address when it is one of the customer's own
+    lat, lng = get_search_location(user, address_id)
+    options = get_search_options()
+    try:
+        page = find_providers(category.id, lat, lng, cursor=request.args.get('cursor'), **options)
+    except ValueError:
+        args = request.args.to_dict()
+        args.pop('cursor', None)
+        return redirect(url_for('main.search_providers', **args))
+    
+    # Next free slot for every provider on the page over the booking window (one query)
+    availability = next_available_dates(
+        [provider.id for provider in page.results], datetime.now().date() + timedelta(days=1)
+    )
     
     return render_template(
         'search_results.html',
         category=category,
-        providers=providers,
-        user=get_current_user()
+        providers=page.results,
+        page=page,
+        options=options,
+        availability=availability,
+        user=user
     )
 
+@main_bp.route('/search/stream', methods=['GET'])
+def stream_search_results():
+    """
+    Stream every provider matching a search as JSON
+    
+    Takes the same parameters as the search page. Providers are read and
+    sent in batches, so the response is never built in memory:
+    {"category": {...}, "providers": [{...}, ...]}
+    """
+    category = get_category(request.args.get('category_id'))
+    if category is None:
+        return {'error': 'Unknown service category'}, 404
+    
+    lat, lng = get_search_location(get_current_identity(), request.args.get('address_id'))
+    results = iter_providers(category.id, lat, lng, **get_search_options())
+    
+    def generate():
+        yield f'{{"category": {json.dumps({"id": category.id, "name": category.name})}, "providers": ['
+        separator = ''
+        for result in results:
+            yield separator + json.dumps(result.to_dict())
+            separator = ', '
+        yield ']}'
+    
+    return current_app.response_class(stream_with_context(generate()), mimetype='application/json')
+
 # Customer routes
 @customer_bp.route('/register', methods=['GET', 'POST'])
 def register():
@@ -198,12 +316,12 @@ def register():
             phone=phone,
             first_name=first_name,
             last_name=last_name,
-            password_hash=generate_password_hash(password)
+            password_hash=hash_password(password)
         )
         db.session.add(customer)
         db.session.commit()
         
-        # Generate and send OTP via Twilio API
+        # Generate OTP and queue the SMS (sent in the background after commit)
         otp_code, error = generate_otp(phone)
         if error:
                 if otp_code:
@@ -256,7 +374,7 @@ def login():
             
         # Handle password verification with try-except to catch HMAC errors
         try:
-            password_valid = check_password_hash(customer.password_hash, password)
+            password_valid = check_password(customer.password_hash, password)
             if not password_valid:
                 flash('Invalid email or password', 'danger')
                 return render_template('customer/login.html')
@@ -296,10 +414,18 @@ def dashboard():
         flash('Please log in as a customer', 'warning')
         return redirect(url_for('customer.login'))
     
-    # Get customer's bookings
-    bookings = Booking.query.filter_by(customer_id=customer.id).order_by(Booking.created_at.desc()).all()
+    # Get one page of the customer's bookings
+    try:
+        page = get_booking_page(customer, request.args.get('cursor'))
+    except ValueError:
+        return redirect(url_for('customer.dashboard'))
     
-    return render_template('customer/dashboard.html', customer=customer, bookings=bookings)
+    return render_template(
+        'customer/dashboard.html',
+        customer=customer,
+        bookings=page.items,
+        next_cursor=page.next_cursor
+    )
 
 @customer_bp.route('/address/add', methods=['GET', 'POST'])
 def add_address():
@@ -334,38 +460,16 @@ def add_address():
         # Use coordinates from the form if available
         if latitude and longitude:
             try:
-                address.latitude = float(latitude)
-                address.longitude = float(longitude)
+                address.latitude, address.longitude = float(latitude), float(longitude)
+                address.geocode_status = 'manual'
             except ValueError:
-                # If conversion fails, try geocoding as fallback
+                # If conversion fails, fall back to geocoding
                 pass
         
-        # If coordinates weren't provided or conversion failed, try geocoding
-        if not (hasattr(address, 'latitude') and hasattr(address, 'longitude')):
-            # Try to geocode the address
-            full_address = f"{address_line}, {city}, {state} {postal_code}"
-            
-            try:
-                # Call the geocoding API
-                params = {
-                    'q': full_address,
-                    'format': 'json',
-                    'limit': 1
-                }
-                headers = {
-                    'User-Agent': 'HIRE Platform/1.0'
-                }
-                
-                response = requests.get('https://nominatim.openstreetmap.org/search', params=params, headers=headers)
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    if data:
-                        address.latitude = float(data[0]['lat'])
-                        address.longitude = float(data[0]['lon'])
-            except Exception as e:
-                # Just log the error and continue (geocoding is not critical)
-                print(f"Geocoding error: {e}")
+        # Otherwise use cached or approximate coordinates for now; the
+        # background geocoder fills in exact ones after the commit
+        if address.geocode_status is None:
+            locate_address(address)
         
         db.session.add(address)
         db.session.commit()
@@ -403,7 +507,7 @@ def register():
             phone=phone,
             first_name=first_name,
             last_name=last_name,
-            password_hash=generate_password_hash(password),
+            password_hash=hash_password(password),
             experience_years=experience_years,
             verification_document='verification_placeholder.pdf'  
             # This is a scalable option to verify each provider with an identity document before being able to access the application : Fraud prevention method
@@ -411,7 +515,7 @@ def register():
         db.session.add(provider)
         db.session.commit()
         
-        # Generate and send OTP via Twilio API
+        # Generate OTP and queue the SMS (sent in the background after commit)
         otp_code, error = generate_otp(phone)
         
         if error:
@@ -458,7 +562,7 @@ def login():
             
         # Handle password verification with try-except to catch HMAC errors
         try:
-            password_valid = check_password_hash(provider.password_hash, password)
+            password_valid = check_password(provider.password_hash, password)
             if not password_valid:
                 flash('Invalid email or password', 'danger')
                 return render_template('provider/login.html')
@@ -498,13 +602,24 @@ def dashboard():
         flash('Please log in as a provider', 'warning')
         return redirect(url_for('provider.login'))
     
-    # Get provider's bookings
-    bookings = Booking.query.filter_by(provider_id=provider.id).order_by(Booking.created_at.desc()).all()
+    # Get one page of the provider's bookings
+    try:
+        page = get_booking_page(provider, request.args.get('cursor'))
+    except ValueError:
+        return redirect(url_for('provider.dashboard'))
     
     # Get provider's services
-    services = ProviderCategory.query.filter_by(provider_id=provider.id).all()
+    services = ProviderCategory.query.filter_by(provider_id=provider.id).options(
+        joinedload(ProviderCategory.category)
+    ).all()
     
-    return render_template('provider/dashboard.html', provider=provider, bookings=bookings, services=services)
+    return render_template(
+        'provider/dashboard.html',
+        provider=provider,
+        bookings=page.items,
+        next_cursor=page.next_cursor,
+        services=services
+    )
 
 @provider_bp.route('/services/add', methods=['GET', 'POST'])
 def add_service():
@@ -523,6 +638,10 @@ def add_service():
             flash('All fields are required', 'danger')
             return redirect(url_for('provider.add_service'))
         
+        if get_category(category_id) is None:
+            flash('Please select a valid service category', 'danger')
+            return redirect(url_for('provider.add_service'))
+        
         # Check if provider already offers this service
         existing = ProviderCategory.query.filter_by(provider_id=provider.id, category_id=category_id).first()
         if existing:
@@ -545,26 +664,35 @@ def add_service():
     existing_categories = ProviderCategory.query.filter_by(provider_id=provider.id).with_entities(ProviderCategory.category_id).all()
     existing_category_ids = [ec.category_id for ec in existing_categories]
     
-    available_categories = ServiceCategory.query.filter(~ServiceCategory.id.in_(existing_category_ids)).all()
+    available_categories = [c for c in get_categories() if c.id not in existing_category_ids]
     
     return render_template('provider/add_service.html', categories=available_categories)
 
 # Service routes
 @service_bp.route('/')
 def service_list():
-    categories = ServiceCategory.query.all()
-    return render_template('services/list.html', categories=categories, user=get_current_user())
+    categories = get_categories()
+    return render_template('services/list.html', categories=categories, user=get_current_identity())
 
 @service_bp.route('/<int:category_id>')
 def service_detail(category_id):
     """Show details of a specific service category"""
-    category = ServiceCategory.query.get_or_404(category_id)
-    
-    # Get providers for this category
-    provider_categories = ProviderCategory.query.filter_by(category_id=category_id).all()
-    providers = [pc.provider for pc in provider_categories if pc.provider.is_verified and pc.provider.is_available]
+    category = get_category(category_id)
+    if category is None:
+        abort(404)
+    
+    # One page of this category's providers, with their prices
+    try:
+        page = find_providers(category.id, cursor=request.args.get('cursor'))
+    except ValueError:
+        return redirect(url_for('service.service_detail', category_id=category.id))
+    
+    # Next free slot for every provider on the page over the booking window (one query)
+    availability = next_available_dates(
+        [provider.id for provider in page.results], datetime.now().date() + timedelta(days=1)
+    )
     
-    return render_template('services/detail.html', category=category, providers=providers, user=get_current_user())
+    return render_template('services/detail.html', category=category, providers=page.results, page=page, availability=availability, user=get_current_user())
 
 # Booking routes
 @booking_bp.route('/create/<int:provider_id>', methods=['GET', 'POST'])
@@ -588,18 +716,19 @@ def create_booking(provider_id):
             flash('All fields are required', 'danger')
             return redirect(url_for('booking.create_booking', provider_id=provider_id))
         
-        # Create new booking
-        booking = Booking(
-            customer_id=customer.id,
-            provider_id=provider_id,
-            category_id=category_id,
-            address_id=address_id,
-            booking_date=datetime.strptime(booking_date, '%Y-%m-%d').date(),
-            time_slot=time_slot,
-            status='pending'
-        )
-        db.session.add(booking)
-        db.session.commit()
+        # Create new booking; the database rejects a slot that is already taken
+        booking, errors = book_time_slot({
+            'customer_id': customer.id,
+            'provider_id': provider_id,
+            'category_id': category_id,
+            'address_id': address_id,
+            'booking_date': booking_date,
+            'time_slot': time_slot
+        })
+        if errors:
+            for error in errors.values():
+                flash(error, 'danger')
+            return redirect(url_for('booking.create_booking', provider_id=provider_id))
         
         flash('Booking created successfully', 'success')
         return redirect(url_for('payment.process', booking_id=booking.id))
@@ -615,12 +744,7 @@ def create_booking(provider_id):
         flash('Please add an address first', 'warning')
         return redirect(url_for('customer.add_address'))
     
-    # Get available time slots (simplified)
-    time_slots = [
-        '09:00', '10:00', '11:00',
-        '13:00', '14:00', '15:00',
-        '16:00', '17:00'
-    ]
+    time_slots = TIME_SLOTS
     
     return render_template(
         'booking/create.html',
@@ -746,13 +870,23 @@ def rate_booking(booking_id):
         flash('Please provide a rating', 'danger')
         return redirect(url_for('booking.booking_detail', booking_id=booking_id))
     
-    # Update booking with rating
-    booking.rating = int(rating)
-    booking.rating_comment = comment
+    # Update booking with rating; the rating IS NULL guard makes sure a
+    # booking is only counted once even if two requests race
+    rated = Booking.query.filter(
+        Booking.id == booking_id,
+        Booking.rating.is_(None)
+    ).update({
+        Booking.rating: int(rating),
+        Booking.rating_comment: comment
+    }, synchronize_session=False)
+    
+    if not rated:
+        db.session.rollback()
+        flash('This booking cannot be rated', 'warning')
+        return redirect(url_for('booking.booking_detail', booking_id=booking_id))
     
-    # Update provider's average rating using simplified approach
-    from services import update_provider_rating
-    update_provider_rating(booking.provider_id)
+    # Add the rating to the provider's running aggregates in the same transaction
+    record_provider_rating(booking.provider_id, int(rating))
     
     db.session.commit()
     
@@ -0,0 +1,371 @@
+"""
+Provider scoring engine.
+
+Providers are ranked by a weighted score of four signals, each scaled to
+0-1:
+
+    distance:   1 at the customer's door, 0 at the search radius
+    rating:     avg_rating / 5 (unrated providers count as RATING_PRIOR)
+    price:      cheapest price_rate among the candidates / own price_rate
+    experience: experience_years, capped at EXPERIENCE_CAP_YEARS
+
+The inputs of every verified provider in a category are kept in memory as
+column arrays (ID, lat, lng, rating, price, experience, availability
+flag), along with a grid index of their locations (see
+provider_index.py). They are built with one query, dropped when a change
+to providers, addresses or provider categories is committed in this
+process, and rebuilt after SCORING_CACHE_TTL seconds (default 30) so
+changes made by other processes are picked up too. A ranking within a radius only reads the
+providers in the grid cells around the customer, unless those are a large
+share of the category; the candidates are scored in one pass and the top
+k selected with a partial sort.
+
+NumPy is imported on the first ranking rather than with this module, and
+vectorizes the pass (np.argpartition for the top k). Without it the same
+scores are computed in plain Python, with heapq for the top k.
+"""
+
+import heapq
+import importlib
+import logging
+import math
+from collections import namedtuple
+
+from flask import current_app
+
+from db_setup import db
+from generation_cache import GenerationCache
+from model_events import changed_columns, on_change
+from models import Address, Provider, ProviderCategory
+from provider_index import EARTH_RADIUS_KM, GridIndex, haversine_km
+
+logger = logging.getLogger(__name__)
+
+# Relative weight of each signal
+Weights = namedtuple('Weights', 'distance rating price experience')
+DEFAULT_WEIGHTS = Weights(distance=0.4, rating=0.35, price=0.15, experience=0.1)
+
+MAX_RATING = 5.0
+RATING_PRIOR = 3.0
+EXPERIENCE_CAP_YEARS = 20
+
+# Distance at which the distance score reaches 0 when no radius is given
+DISTANCE_SCALE_KM = 25
+
+DEFAULT_TTL = 30
+
+# Prices below this count as this, so free services don't divide by zero
+PRICE_FLOOR = 1.0
+
+# Largest share of a category's rows a radius search gathers from the
+# grid index; past it, every row is scanned instead. The NumPy pass over
+# every row is cheap enough that gathering only pays off for small areas
+PREFILTER_MAX_SHARE = 0.5
+NUMPY_PREFILTER_MAX_SHARE = 0.05
+
+# One ranked provider; distance_km is None without a customer location or
+# provider address
+Ranked = namedtuple('Ranked', 'provider_id score distance_km')
+
+
+_numpy = None
+_numpy_checked = False
+
+
+def load_numpy():
+    """
+    Import NumPy on first use
+
+    Returns:
+        The numpy module, or None if it is not installed
+    """
+    global _numpy, _numpy_checked
+    if not _numpy_checked:
+        try:
+            _numpy = importlib.import_module('numpy')
+        except ImportError:
+            _numpy = None
+        _numpy_checked = True
+    return _numpy
+
+
+def numpy_available():
+    """Check whether NumPy is installed"""
+    return load_numpy() is not None
+
+
+class CategoryColumns:
+    """
+    Scoring inputs of one category's providers, stored column-wise
+
+    Args:
+        rows: Sequence of (provider_id, lat, lng, rating, price,
+            experience_years, is_available) tuples; lat, lng and rating
+            may be None
+        use_numpy: Store NumPy arrays (defaults to whether NumPy is
+            installed)
+    """
+
+    def __init__(self, rows, use_numpy=None):
+        self.use_numpy = numpy_available() if use_numpy is None else use_numpy
+        self.size = len(rows)
+
+        ids, lats, lngs, ratings, prices, experience, available = (
+            zip(*rows) if rows else ((),) * 7
+        )
+        # Row positions by location, so a radius search only reads nearby rows
+        self.grid = GridIndex.build(
+            (i, lat, lng) for i, (lat, lng) in enumerate(zip(lats, lngs))
+            if lat is not None and lng is not None
+        )
+        prices = [max(price or 0.0, PRICE_FLOOR) for price in prices]
+        experience = [min(years or 0, EXPERIENCE_CAP_YEARS) for years in experience]
+        available = [bool(flag) for flag in available]
+
+        if self.use_numpy:
+            np = load_numpy()
+            nan = float('nan')
+            self.ids = np.array(ids, dtype=np.int64)
+            self.lat = np.array([nan if v is None else v for v in lats], dtype=np.float64)
+            self.lng = np.array([nan if v is None else v for v in lngs], dtype=np.float64)
+            self.rating = np.array([nan if v is None else v for v in ratings], dtype=np.float64)
+            self.price = np.array(prices, dtype=np.float64)
+            self.experience = np.array(experience, dtype=np.float64)
+            self.available = np.array(available, dtype=bool)
+        else:
+            self.ids = list(ids)
+            self.lat = list(lats)
+            self.lng = list(lngs)
+            self.rating = list(ratings)
+            self.price = prices
+            self.experience = experience
+            self.available = available
+
+    def rank(self, k=None, lat=None, lng=None, radius_km=None, weights=DEFAULT_WEIGHTS,
+             min_rating=None, max_price=None):
+        """
+        Rank the available providers
+
+        Args:
+            k: Maximum number of providers to return (all if None)
+            lat, lng: Customer location (optional; without it distance
+                doesn't count)
+            radius_km: Only keep providers within this distance of the
+                customer; providers without an address are then dropped
+            weights: Weights of the signals
+            min_rating: Only keep providers rated at least this (optional)
+            max_price: Only keep providers charging at most this (optional)
+
+        Returns:
+            List of Ranked, best first (ties by provider ID)
+        """
+        if k is not None and k <= 0:
+            return []
+        located = lat is not None and lng is not None
+        # Rows that may be within the radius (None scans every row)
+        rows = None
+        if located and radius_km is not None:
+            share = NUMPY_PREFILTER_MAX_SHARE if self.use_numpy else PREFILTER_MAX_SHARE
+            limit = int(self.size * share)
+            rows = self.grid.candidates(lat, lng, radius_km, limit)
+        rank = self._rank_numpy if self.use_numpy else self._rank_python
+        return rank(rows, k, lat, lng, located, radius_km, weights, min_rating, max_price)
+
+    def _rank_numpy(self, rows, k, lat, lng, located, radius_km, weights, min_rating, max_price):
+        np = load_numpy()
+        # A full slice keeps the column reads below views instead of copies
+        rows = slice(None) if rows is None else np.array(rows, dtype=np.intp)
+        mask = self.available[rows].copy()
+        if min_rating is not None:
+            mask &= self.rating[rows] >= min_rating  # NaN (unrated) compares False
+        if max_price is not None:
+            mask &= self.price[rows] <= max(max_price, PRICE_FLOOR)
+        distance = None
+
+        if located:
+            phi1 = math.radians(lat)
+            phi2 = np.radians(self.lat[rows])
+            d_phi = phi2 - phi1
+            d_lambda = np.radians(self.lng[rows] - lng)
+            a = np.sin(d_phi / 2) ** 2 + math.cos(phi1) * np.cos(phi2) * np.sin(d_lambda / 2) ** 2
+            distance = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+            if radius_km is not None:
+                mask &= distance <= radius_km  # NaN (no address) compares False
+            distance = distance[mask]
+
+        candidates = np.flatnonzero(mask)
+        if not isinstance(rows, slice):
+            candidates = rows[candidates]
+        if candidates.size == 0:
+            return []
+
+        price = self.price[candidates]
+        rating = np.nan_to_num(self.rating[candidates], nan=RATING_PRIOR)
+        score = (
+            weights.rating * rating / MAX_RATING
+            + weights.price * price.min() / price
+            + weights.experience * self.experience[candidates] / EXPERIENCE_CAP_YEARS
+        )
+        if located:
+            scale = radius_km or DISTANCE_SCALE_KM
+            closeness = np.clip(1 - distance / scale, 0, 1)
+            score += weights.distance * np.nan_to_num(closeness, nan=0.0)
+
+        if k is not None and k < candidates.size:
+            top = np.argpartition(-score, k - 1)[:k]
+        else:
+            top = np.arange(candidates.size)
+        top = top[np.lexsort((self.ids[candidates[top]], -score[top]))]
+
+        return [
+            Ranked(
+                int(self.ids[candidates[i]]),
+                float(score[i]),
+                None if distance is None or np.isnan(distance[i]) else float(distance[i])
+            )
+            for i in top
+        ]
+
+    def _rank_python(self, rows, k, lat, lng, located, radius_km, weights, min_rating, max_price):
+        candidates = []
+        for i in range(self.size) if rows is None else rows:
+            if not self.available[i]:
+                continue
+            if min_rating is not None and (self.rating[i] is None or self.rating[i] < min_rating):
+                continue
+            if max_price is not None and self.price[i] > max(max_price, PRICE_FLOOR):
+                continue
+            distance = None
+            if located and self.lat[i] is not None and self.lng[i] is not None:
+                distance = haversine_km(lat, lng, self.lat[i], self.lng[i])
+            if radius_km is not None and located and (distance is None or distance > radius_km):
+                continue
+            candidates.append((i, distance))
+
+        if not candidates:
+            return []
+
+        cheapest = min(self.price[i] for i, _ in candidates)
+        scale = radius_km or DISTANCE_SCALE_KM
+        scored = []
+        for i, distance in candidates:
+            rating = RATING_PRIOR if self.rating[i] is None else self.rating[i]
+            score = (
+                weights.rating * rating / MAX_RATING
+                + weights.price * cheapest / self.price[i]
+                + weights.experience * self.experience[i] / EXPERIENCE_CAP_YEARS
+            )
+            if distance is not None:
+                score += weights.distance * min(max(1 - distance / scale, 0.0), 1.0)
+            scored.append(Ranked(self.ids[i], score, distance))
+
+        def key(ranked):
+            return (-ranked.score, ranked.provider_id)
+
+        if k is not None and k < len(scored):
+            return heapq.nsmallest(k, scored, key=key)
+        return sorted(scored, key=key)
+
+
+def provider_locations():
+    """
+    Subquery of the address each provider is placed at: their first
+    address with coordinates
+
+    Returns:
+        Subquery with provider_id and address_id columns
+    """
+    return db.session.query(
+        Address.provider_id, db.func.min(Address.id).label('address_id')
+    ).filter(
+        Address.provider_id.isnot(None),
+        Address.latitude.isnot(None),
+        Address.longitude.isnot(None)
+    ).group_by(Address.provider_id).subquery()
+
+
+_cache = GenerationCache()
+
+
+def get_category_columns(category_id):
+    """
+    Get the scoring columns of the verified providers of a category
+
+    Each provider is placed at their first address with coordinates.
+    Built on first use with one query and cached until providers,
+    addresses or provider categories change in this process, or for
+    SCORING_CACHE_TTL seconds.
+
+    Args:
+        category_id: ID of the service category
+
+    Returns:
+        CategoryColumns
+    """
+    category_id = int(category_id)
+    return _cache.get(
+        category_id, lambda: _build_category_columns(category_id),
+        ttl=current_app.config.get('SCORING_CACHE_TTL', DEFAULT_TTL)
+    )
+
+
+def _build_category_columns(category_id):
+    first_address = provider_locations()
+    rows = db.session.query(
+        Provider.id, Address.latitude, Address.longitude, Provider.avg_rating,
+        ProviderCategory.price_rate, Provider.experience_years, Provider.is_available
+    ).join(
+        ProviderCategory, ProviderCategory.provider_id == Provider.id
+    ).outerjoin(
+        first_address, first_address.c.provider_id == Provider.id
+    ).outerjoin(
+        Address, Address.id == first_address.c.address_id
+    ).filter(
+        ProviderCategory.category_id == category_id,
+        Provider.is_verified == True
+    ).order_by(Provider.id).all()
+
+    columns = CategoryColumns(rows)
+    logger.info(f"Built scoring columns for category {category_id} with {columns.size} providers")
+    return columns
+
+
+def rank_providers(category_id, k=None, lat=None, lng=None, radius_km=None, weights=DEFAULT_WEIGHTS,
+                   min_rating=None, max_price=None):
+    """
+    Rank the available, verified providers of a category
+
+    Args:
+        category_id: ID of the service category
+        k: Maximum number of providers to return (all if None)
+        lat, lng: Customer location (optional)
+        radius_km: Only keep providers within this distance (optional)
+        weights: Weights of the signals
+        min_rating: Only keep providers rated at least this (optional)
+        max_price: Only keep providers charging at most this (optional)
+
+    Returns:
+        List of Ranked, best first
+    """
+    return get_category_columns(category_id).rank(
+        k, lat, lng, radius_km, weights, min_rating, max_price
+    )
+
+
+# Provider columns that are scoring inputs
+_SCORED_PROVIDER_COLUMNS = {'is_verified', 'is_available', 'avg_rating', 'experience_years'}
+
+
+def _affects_columns(change):
+    if change.model is not Provider:
+        return True
+    columns = changed_columns(change)
+    return columns is None or bool(columns & _SCORED_PROVIDER_COLUMNS)
+
+
+@on_change(Provider, Address, ProviderCategory)
+def invalidate_columns(changes):
+    """Drop the cached columns after scoring inputs change"""
+    if changes is not None and not any(_affects_columns(change) for change in changes):
+        return
+    _cache.invalidate()
@@ -0,0 +1,387 @@
+"""
+Provider search within a service category.
+
+Every provider listing (the search results page and its JSON stream, the
+service detail page and find_matching_providers) goes through this
+module, which reads verified, available providers in one joined query:
+provider, their price for the category and their location (first address
+with coordinates). Results are immutable SearchResult snapshots, so
+templates never lazy-load a provider's services or addresses.
+
+Filters (minimum rating, maximum price, radius around the customer) and
+the rating, price, experience and distance sorts run in SQL. The default
+'score' sort is the weighted score of scoring.py, which needs every
+candidate: pages of IDs are taken from the scoring engine's cached
+ranking, and only each page's rows are read.
+
+Results are paged with keyset cursors (see pagination.py) rather than
+page numbers: a cursor holds the sort key of the last provider shown, so
+a page is the same indexed read however deep it is, and a provider whose
+rating changes between two pages is neither repeated nor skipped by the
+providers around it. iter_providers() walks every page for streaming,
+ranking a score sort only once.
+
+Pages are cached per (category, location, filters, sort, cursor) in a
+bounded LRU of SEARCH_CACHE_SIZE entries (default 256, 0 disables it),
+dropped whenever a change to a provider, provider address or provider
+category is committed in this process, and expired after
+SEARCH_CACHE_TTL seconds (default 30) so changes made by other processes
+are picked up too.
+"""
+
+import logging
+import math
+from collections import namedtuple
+
+from flask import current_app
+from sqlalchemy import and_
+
+from db_setup import db
+from generation_cache import GenerationCache
+from model_events import changed_columns, on_change
+from models import Address, Provider, ProviderCategory
+from pagination import after_key, decode_cursor, encode_cursor, fetch_page
+from provider_index import EARTH_RADIUS_KM, haversine_km
+from scoring import provider_locations, rank_providers
+
+logger = logging.getLogger(__name__)
+
+SORTS = ('score', 'rating', 'price', 'experience', 'distance')
+DEFAULT_SORT = 'score'
+DEFAULT_PER_PAGE = 12
+DEFAULT_CACHE_SIZE = 256
+DEFAULT_CACHE_TTL = 30
+
+# Providers read per query when streaming every result
+STREAM_BATCH_SIZE = 200
+
+KM_PER_DEGREE = EARTH_RADIUS_KM * math.pi / 180
+
+# Sort key values standing in for NULLs, so every key compares: unrated
+# providers sort after rated ones, providers without an address last
+UNRATED = -1.0
+UNPLACED = 1e12
+
+
+class SearchResult(namedtuple(
+    'SearchResult',
+    'id first_name last_name avg_rating rating_count experience_years price_rate distance_km score'
+)):
+    """Snapshot of a provider in search results (distance_km and score may be None)"""
+
+    __slots__ = ()
+
+    def get_full_name(self):
+        """Return provider's full name"""
+        return f"{self.first_name} {self.last_name}"
+
+    def to_dict(self):
+        """Convert to a JSON-serializable dict"""
+        return {
+            'id': self.id,
+            'name': self.get_full_name(),
+            'avg_rating': self.avg_rating,
+            'rating_count': self.rating_count,
+            'experience_years': self.experience_years,
+            'price_rate': self.price_rate,
+            'distance_km': round(self.distance_km, 2) if self.distance_km is not None else None,
+            'score': round(self.score, 4) if self.score is not None else None
+        }
+
+
+# One page of results, the cursor of the next page (None on the last
+# page), and the number of matching providers (None when only known on
+# the first page)
+SearchPage = namedtuple('SearchPage', 'results next_cursor total')
+
+# A normalized search: everything but the page
+_Search = namedtuple('_Search', 'category_id lat lng radius_km min_rating max_price sort')
+
+_COLUMNS = (
+    Provider.id, Provider.first_name, Provider.last_name, Provider.avg_rating,
+    Provider.rating_count, Provider.experience_years, ProviderCategory.price_rate,
+    Address.latitude, Address.longitude
+)
+
+
+def _distance_squared(lat, lng):
+    """
+    Squared distance in km² from a point to each provider's address
+
+    Equirectangular approximation: plain arithmetic the database can
+    evaluate, within a fraction of a percent of the great-circle distance
+    at city scale. NULL for providers without an address.
+    """
+    x = (Address.longitude - lng) * (KM_PER_DEGREE * math.cos(math.radians(lat)))
+    y = (Address.latitude - lat) * KM_PER_DEGREE
+    return x * x + y * y
+
+
+def _base_query(category_id, lat=None, lng=None, radius_km=None, min_rating=None, max_price=None):
+    placed = provider_locations()
+    query = db.session.query(*_COLUMNS).join(
+        ProviderCategory, and_(
+            ProviderCategory.provider_id == Provider.id,
+            ProviderCategory.category_id == category_id
+        )
+    ).outerjoin(
+        placed, placed.c.provider_id == Provider.id
+    ).outerjoin(
+        Address, Address.id == placed.c.address_id
+    ).filter(
+        Provider.is_verified == True,
+        Provider.is_available == True
+    )
+
+    if min_rating is not None:
+        query = query.filter(Provider.avg_rating >= min_rating)
+    if max_price is not None:
+        query = query.filter(ProviderCategory.price_rate <= max_price)
+    if radius_km is not None and lat is not None:
+        # Providers without an address are dropped (NULL never compares)
+        query = query.filter(_distance_squared(lat, lng) <= radius_km * radius_km)
+    return query
+
+
+def _sort_key(search):
+    """
+    Sort key of a SQL sort
+
+    Returns:
+        List of (expression, descending), most significant first, ending
+        with the provider ID so every key is unique
+    """
+    if search.sort == 'rating':
+        # Best rating first, then the rating backed by the most reviews
+        return [
+            (db.func.coalesce(Provider.avg_rating, UNRATED), True),
+            (Provider.rating_count, True),
+            (Provider.id, False)
+        ]
+    if search.sort == 'price':
+        return [(ProviderCategory.price_rate, False), (Provider.id, False)]
+    if search.sort == 'experience':
+        return [(db.func.coalesce(Provider.experience_years, 0), True), (Provider.id, False)]
+    distance = db.func.coalesce(_distance_squared(search.lat, search.lng), UNPLACED)
+    return [(distance, False), (Provider.id, False)]
+
+
+def _decode(search, cursor, length):
+    """Decode a cursor, checking it was made by the same sort"""
+    values = decode_cursor(cursor, length + 1)
+    if values[0] != search.sort or not all(
+        isinstance(value, (int, float)) and not isinstance(value, bool) for value in values[1:]
+    ):
+        raise ValueError("Invalid cursor")
+    return values[1:]
+
+
+def _result(row, lat, lng, score=None):
+    distance = None
+    if lat is not None and row.latitude is not None and row.longitude is not None:
+        distance = haversine_km(lat, lng, row.latitude, row.longitude)
+    return SearchResult(
+        row.id, row.first_name, row.last_name, row.avg_rating, row.rating_count,
+        row.experience_years, row.price_rate, distance, score
+    )
+
+
+def _after_ranked(ranked, key):
+    """Binary search for the position after a (-score, provider_id) key in a ranking"""
+    low, high = 0, len(ranked)
+    while low < high:
+        middle = (low + high) // 2
+        if (-ranked[middle].score, ranked[middle].provider_id) <= key:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+def _rank(search):
+    return rank_providers(
+        search.category_id, None, search.lat, search.lng, search.radius_km,
+        min_rating=search.min_rating, max_price=search.max_price
+    )
+
+
+def _read_ranked(search, window):
+    """Read the rows of a slice of a ranking, in ranking order"""
+    if not window:
+        return ()
+    # The ranking already applied the filters; read just the window's rows
+    query = _base_query(search.category_id).filter(Provider.id.in_([r.provider_id for r in window]))
+    rows = {row.id: row for row in query}
+    return tuple(
+        _result(rows[r.provider_id], search.lat, search.lng, r.score)
+        for r in window if r.provider_id in rows
+    )
+
+
+def _read_scored(search, cursor, per_page):
+    ranked = _rank(search)
+
+    start = 0
+    if cursor:
+        score, provider_id = _decode(search, cursor, 2)
+        start = _after_ranked(ranked, (-score, provider_id))
+    window = ranked[start:start + per_page]
+    next_cursor = None
+    if window and start + per_page < len(ranked):
+        next_cursor = encode_cursor(['score', window[-1].score, window[-1].provider_id])
+    return SearchPage(_read_ranked(search, window), next_cursor, len(ranked))
+
+
+def _read_sorted(search, cursor, per_page):
+    keys = _sort_key(search)
+    query = _base_query(
+        search.category_id, search.lat, search.lng, search.radius_km,
+        search.min_rating, search.max_price
+    ).add_columns(*[expression.label(f'key_{i}') for i, (expression, _) in enumerate(keys)])
+
+    if cursor:
+        values = _decode(search, cursor, len(keys))
+        query = query.filter(after_key([
+            (expression, value, descending)
+            for (expression, descending), value in zip(keys, values)
+        ]))
+    else:
+        # Count the matches along with the first page
+        query = query.add_columns(db.func.count().over().label('total'))
+
+    query = query.order_by(*[
+        expression.desc() if descending else expression for expression, descending in keys
+    ])
+    page = fetch_page(
+        query, lambda row: [search.sort] + [getattr(row, f'key_{i}') for i in range(len(keys))], per_page
+    )
+
+    total = None
+    if not cursor:
+        total = page.items[0].total if page.items else 0
+    return SearchPage(
+        tuple(_result(row, search.lat, search.lng) for row in page.items), page.next_cursor, total
+    )
+
+
+def _read_page(search, cursor, per_page):
+    if search.sort == 'score':
+        return _read_scored(search, cursor, per_page)
+    return _read_sorted(search, cursor, per_page)
+
+
+def _normalize(category_id, lat, lng, radius_km, min_rating, max_price, sort):
+    if sort not in SORTS:
+        raise ValueError(f"Unknown sort: {sort}")
+    if lat is None or lng is None:
+        lat = lng = None
+        if sort == 'distance':
+            sort = 'score'
+    return _Search(int(category_id), lat, lng, radius_km, min_rating, max_price, sort)
+
+
+_cache = GenerationCache()
+
+
+def _cache_size():
+    return current_app.config.get('SEARCH_CACHE_SIZE', DEFAULT_CACHE_SIZE)
+
+
+def find_providers(category_id, lat=None, lng=None, radius_km=None, min_rating=None,
+                   max_price=None, sort=DEFAULT_SORT, cursor=None, per_page=DEFAULT_PER_PAGE):
+    """
+    Get one page of the verified, available providers of a service category
+
+    Args:
+        category_id: ID of the service category
+        lat, lng: Customer location (optional; needed for distance, the
+            radius and the distance sort)
+        radius_km: Only keep providers within this distance of the
+            customer (optional)
+        min_rating: Only keep providers rated at least this (optional)
+        max_price: Only keep providers charging at most this (optional)
+        sort: One of SORTS; 'distance' without a location sorts by score
+        cursor: Cursor of the page (next_cursor of the previous page), or
+            None for the first page
+        per_page: Results per page
+
+    Returns:
+        SearchPage
+
+    Raises:
+        ValueError: If the sort or cursor is invalid
+    """
+    search = _normalize(category_id, lat, lng, radius_km, min_rating, max_price, sort)
+
+    return _cache.get(
+        (search, cursor, per_page), lambda: _search_page(search, cursor, per_page),
+        ttl=current_app.config.get('SEARCH_CACHE_TTL', DEFAULT_CACHE_TTL), max_size=_cache_size()
+    )
+
+
+def _search_page(search, cursor, per_page):
+    page = _read_page(search, cursor, per_page)
+    logger.info(f"Searched category {search.category_id} ({search.sort}): {len(page.results)} providers")
+    return page
+
+
+def iter_providers(category_id, lat=None, lng=None, radius_km=None, min_rating=None,
+                   max_price=None, sort=DEFAULT_SORT, batch_size=STREAM_BATCH_SIZE):
+    """
+    Iterate over every matching provider, best first
+
+    Providers are read batch_size at a time, without going through the
+    page cache, so only one batch of rows is held in memory. SQL sorts
+    follow the page cursors; the score sort ranks the category once and
+    reads its batches from that ranking.
+
+    Args:
+        Same as find_providers
+
+    Yields:
+        SearchResult
+
+    Raises:
+        ValueError: If the sort is unknown
+    """
+    search = _normalize(category_id, lat, lng, radius_km, min_rating, max_price, sort)
+
+    if search.sort == 'score':
+        ranked = _rank(search)
+        for start in range(0, len(ranked), batch_size):
+            yield from _read_ranked(search, ranked[start:start + batch_size])
+        return
+
+    cursor = None
+    while True:
+        page = _read_page(search, cursor, batch_size)
+        yield from page.results
+        cursor = page.next_cursor
+        if cursor is None:
+            return
+
+
+# Provider columns that filter, sort or are shown in search results
+_SEARCH_PROVIDER_COLUMNS = {
+    'first_name', 'last_name', 'avg_rating', 'rating_count',
+    'experience_years', 'is_verified', 'is_available'
+}
+
+
+def _affects_search(change):
+    if change.model is Address:
+        # Customer addresses never place a provider
+        return change.action == 'bulk_update' or change.values.get('customer_id') is None \
+            or change.values.get('provider_id') is not None
+    if change.model is ProviderCategory:
+        return True
+    columns = changed_columns(change)
+    return columns is None or bool(columns & _SEARCH_PROVIDER_COLUMNS)
+
+
+@on_change(Provider, Address, ProviderCategory)
+def invalidate_search(changes):
+    """Drop the cached pages after a change that can alter search results"""
+    if changes is not None and not any(_affects_search(change) for change in changes):
+        return
+    _cache.invalidate()
@@ -2,71 +2,61 @@
 from datetime import datetime, timedelta
 import os
 import random
-import requests
 from flask import current_app
 import logging
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Distance calculation and provider scoring functions have been removed as they were non-functional
-# and not being used in the application
+# Default search radius for distance-ranked provider matching
+DEFAULT_MATCH_RADIUS_KM = 25
 
-def find_matching_providers(customer_address, service_category_id, limit=5):
+def find_matching_providers(customer_address, service_category_id, limit=5, radius_km=DEFAULT_MATCH_RADIUS_KM):
     """
-    Find providers for a service request based on availability and rating
+    Find providers for a service request based on distance, rating, price
+    and experience
+    
+    Verified and available providers are ranked by the scoring engine (see
+    scoring.py) through the provider search (see search.py). When the
+    customer address has coordinates, only providers within the radius are
+    considered and nearer ones score higher; otherwise distance is left out
+    of the score.
     
     Args:
-        customer_address: Address object for the customer location (not used)
+        customer_address: Address object for the customer location (optional)
         service_category_id: ID of the requested service category
         limit: Maximum number of providers to return
+        radius_km: Maximum distance from the customer in kilometres
         
     Returns:
-        List of Provider objects, sorted by rating
+        Tuple of SearchResult snapshots, best match first
     """
-    from models import Provider, ProviderCategory
+    from search import find_providers
     
     logger.info(f"Finding matching providers for service category {service_category_id}")
     
-    # Get all providers for this service category who are verified and available
-    provider_categories = ProviderCategory.query.filter_by(category_id=service_category_id).all()
-    if not provider_categories:
-        logger.info(f"No providers found for service category {service_category_id}")
-        return []
-    
-    # Get provider IDs
-    provider_ids = [pc.provider_id for pc in provider_categories]
-    
-    # Get providers
-    providers = Provider.query.filter(
-        Provider.id.in_(provider_ids),
-        Provider.is_available == True,
-        Provider.is_verified == True
-    ).all()
-    
-    if not providers:
-        logger.info("No available and verified providers found")
-        return []
-    
-    logger.info(f"Found {len(providers)} potentially matching providers")
-    
-    # Simply sort providers by rating (highest first)
-    sorted_providers = sorted(
-        providers,
-        key=lambda p: p.avg_rating if p.avg_rating is not None else 0,
-        reverse=True
-    )
-    
-    # Return the top matching providers
-    top_providers = sorted_providers[:limit]
-    logger.info(f"Returning top {len(top_providers)} matching providers")
+    if customer_address is not None and customer_address.latitude is not None \
+            and customer_address.longitude is not None:
+        page = find_providers(
+            service_category_id, customer_address.latitude, customer_address.longitude,
+            radius_km, per_page=limit
+        )
+        if not page.results:
+            logger.info(f"No providers within {radius_km} km for service category {service_category_id}")
+    else:
+        page = find_providers(service_category_id, per_page=limit)
+        if not page.results:
+            logger.info(f"No available and verified providers for service category {service_category_id}")
     
-    return top_providers
+    logger.info(f"Returning top {len(page.results)} matching providers")
+    return page.results
 
 def generate_otp(phone_number):
     """
-    Generate and send OTP via Twilio API with enhanced error handling and fallback options
+    Generate an OTP and queue it for delivery by SMS
+    
+    The SMS job is added to the current session and sent by the background
+    delivery queue once the caller commits, so registration never waits on
+    the SMS gateway.
     
     Args:
         phone_number: User's phone number
@@ -76,12 +66,9 @@ def generate_otp(phone_number):
         otp_code: Generated OTP code if successful, None otherwise
         error: Error message if OTP sending failed, None otherwise
     """
-    import os
-    import random
-    import logging
-    from datetime import datetime
+    from sms_queue import enqueue_sms
+    from sms_transport import normalize_phone_number, twilio_available, twilio_credentials
     
-    logger = logging.getLogger(__name__)
     logger.info(f"Generating OTP for phone number {phone_number}")
     
     # Generate 6-digit OTP
@@ -93,82 +80,28 @@ def generate_otp(phone_number):
         # Just return the OTP without sending (for demo/testing)
         return otp_code, None
     
-    # Try to import Twilio
-    try:
-        from twilio.rest import Client
-        from twilio.base.exceptions import TwilioRestException, TwilioException
-    except ImportError:
-        logger.warning("Twilio package not installed. Using test mode.")
-        # If Twilio package is not installed, use test mode
-        return otp_code, None
-    
-    # Get Twilio credentials from environment variables
-    account_sid = os.environ.get('TWILIO_ACCOUNT_SID')
-    auth_token = os.environ.get('TWILIO_AUTH_TOKEN')
-    twilio_number = os.environ.get('TWILIO_PHONE_NUMBER')
-    
-    if not account_sid or not auth_token or not twilio_number:
-        logger.error("Twilio credentials not properly configured")
-        # Instead of failing, use test mode and inform the user
-        logger.info(f"Using test mode instead. OTP code: {otp_code}")
-        return otp_code, "Twilio credentials not properly configured. Using test mode instead."
-    
-    try:
-        # Normalize phone number format (E.164 format)
-        # E.164 format is +[country code][number], e.g., +353861234567
-        if not phone_number.startswith('+'):
-            # Add + if missing
-            phone_number = '+' + phone_number
-            
-        # Remove any spaces, dashes, or parentheses
-        phone_number = ''.join(c for c in phone_number if c.isdigit() or c == '+')
-            
-        # Initialize Twilio client
-        client = Client(account_sid, auth_token)
-        
-        # Send OTP via SMS
-        message = client.messages.create(
-            body=f"Your HIRE Platform verification code is: {otp_code}",
-            from_=twilio_number,
-            to=phone_number
-        )
-        
-        logger.info(f"OTP sent successfully. SID: {message.sid}")
-        return otp_code, None
-    
-    except TwilioRestException as e:
-        error_code = e.code
-        error_message = e.msg
+    if os.environ.get('SMS_TRANSPORT') != 'fake':
+        if not twilio_available():
+            logger.warning("Twilio package not installed. Using test mode.")
+            # If Twilio package is not installed, use test mode
+            return otp_code, None
         
-        # Handle specific Twilio error codes
-        if error_code == 21211:  # Invalid 'To' Phone Number
-            logger.error(f"Invalid phone number format: {phone_number}")
-            return None, "The phone number format is invalid. Please use international format with country code."
-        elif error_code == 21214:  # 'To' phone number cannot be reached
-            logger.error(f"Phone number cannot be reached: {phone_number}")
-            return None, "This phone number cannot receive SMS messages. Please try a different number."
-        elif error_code == 21608:  # Authentication Error
-            logger.error("Twilio authentication error")
-            # Fallback to test mode for development
+        if twilio_credentials() is None:
+            logger.error("Twilio credentials not properly configured")
+            # Instead of failing, use test mode and inform the user
             logger.info(f"Using test mode instead. OTP code: {otp_code}")
-            return otp_code, "SMS service authentication failed. Using test mode."
-        else:
-            logger.error(f"Twilio error: {error_code} - {error_message}")
-            # Fallback to test mode
-            logger.info(f"Using test mode instead. OTP code: {otp_code}")
-            return otp_code, f"SMS service error ({error_code}). Using test mode."
-    
-    except TwilioException as e:
-        logger.error(f"Twilio general exception: {str(e)}")
-        # Fallback to test mode
-        logger.info(f"Using test mode instead. OTP code: {otp_code}")
-        return otp_code, f"SMS service exception. Using test mode."
-    
-    except Exception as e:
-        logger.error(f"Unexpected error: {str(e)}")
-        # Fallback to test mode
-        logger.info(f"Using test mode instead. OTP code: {otp_code}")
-        return otp_code, f"Unexpected error: {str(e)}. Using test mode."
+            return otp_code, "Twilio credentials not properly configured. Using test mode instead."
+    
+    # Normalize phone number format (E.164 format)
+    # E.164 format is +[country code][number], e.g., +353861234567
+    normalized = normalize_phone_number(phone_number)
+    if normalized is None:
+        logger.error(f"Invalid phone number format: {phone_number}")
+        return None, "The phone number format is invalid. Please use international format with country code."
+    
+    enqueue_sms(normalized, f"Your HIRE Platform verification code is: {otp_code}")
+    logger.info(f"OTP queued for delivery to {normalized}")
+    return otp_code, None
 
 def verify_otp(user_id, entered_otp, user_type='customer'):
     """
@@ -220,11 +153,92 @@ def verify_otp(user_id, entered_otp, user_type='customer'):
     logger.info(f"OTP verified successfully for {user_type} {user_id}")
     return True
 
+def purge_expired_otps(batch_size=1000, now=None):
+    """
+    Delete expired OTP records in batches
+    
+    Used codes are kept until they expire too, so every record is removed
+    at most OTP lifetime (10 minutes) after it was created. Each batch is
+    committed on its own, keeping write locks short on a large table.
+    
+    Args:
+        batch_size: Number of records deleted per transaction
+        now: Current time (defaults to datetime.utcnow())
+        
+    Returns:
+        Number of records deleted
+    """
+    from models import OTPVerification
+    from db_setup import db
+    
+    now = now or datetime.utcnow()
+    deleted = 0
+    
+    while True:
+        # Walks the expires_at index; only expired rows are read
+        batch = [otp_id for (otp_id,) in db.session.query(OTPVerification.id).filter(
+            OTPVerification.expires_at < now
+        ).limit(batch_size)]
+        if not batch:
+            break
+        
+        OTPVerification.query.filter(OTPVerification.id.in_(batch)).delete(synchronize_session=False)
+        db.session.commit()
+        deleted += len(batch)
+    
+    logger.info(f"Purged {deleted} expired OTP records")
+    return deleted
+
 
 
+def record_provider_rating(provider_id, rating):
+    """
+    Add a new rating to a provider's running rating aggregates
+    
+    Runs a single UPDATE that increments rating_sum and rating_count and
+    recomputes avg_rating in the database, so concurrent ratings can't
+    overwrite each other. The caller commits, together with the rated
+    booking.
+    
+    Args:
+        provider_id: ID of the provider
+        rating: New rating (1-5)
+        
+    Returns:
+        True if the provider was updated, False if it doesn't exist
+    """
+    from models import Provider
+    from sqlalchemy import Float, cast, func
+    
+    logger.info(f"Recording rating {rating} for provider {provider_id}")
+    
+    new_sum = Provider.rating_sum + rating
+    new_count = Provider.rating_count + 1
+    
+    updated = Provider.query.filter_by(id=provider_id).update({
+        Provider.rating_sum: new_sum,
+        Provider.rating_count: new_count,
+        Provider.avg_rating: func.round(cast(new_sum, Float) / new_count, 2)
+    }, synchronize_session=False)
+    
+    if not updated:
+        logger.error(f"Provider {provider_id} not found")
+        return False
+    
+    # The UPDATE bypassed the session, so reload the provider on next access
+    from db_setup import db
+    provider = db.session.identity_map.get(db.session.identity_key(Provider, provider_id))
+    if provider is not None:
+        db.session.expire(provider, ['rating_sum', 'rating_count', 'avg_rating'])
+    
+    return True
+
 def update_provider_rating(provider_id):
     """
-    Simplified function to update a provider's average rating based on completed bookings
+    Recompute a provider's rating aggregates from its completed bookings
+    
+    New ratings should use record_provider_rating; this full recompute
+    repairs a single provider (see reconcile_provider_ratings for all).
     
     Args:
         provider_id: ID of the provider
@@ -236,6 +250,7 @@ def update_provider_rating(provider_id):
     """
     from models import Provider, Booking
     from db_setup import db
+    from sqlalchemy import func
     
     logger.info(f"Updating average rating for provider {provider_id}")
     
@@ -244,33 +259,111 @@ def update_provider_rating(provider_id):
         logger.error(f"Provider {provider_id} not found")
         return None, 0
     
-    # Get all completed bookings with ratings
-    rated_bookings = Booking.query.filter_by(
-        provider_id=provider_id,
-        status='completed'
-    ).filter(Booking.rating.isnot(None)).all()
+    # Aggregate completed bookings with ratings in the database
+    count, total_rating = db.session.query(
+        func.count(Booking.rating), func.coalesce(func.sum(Booking.rating), 0)
+    ).filter(
+        Booking.provider_id == provider_id,
+        Booking.status == 'completed',
+        Booking.rating.isnot(None)
+    ).one()
     
-    if not rated_bookings:
+    provider.rating_sum = total_rating
+    provider.rating_count = count
+    
+    if not count:
         logger.info(f"No ratings found for provider {provider_id}")
         provider.avg_rating = None
         db.session.commit()
         return None, 0
     
     # Simple average calculation
-    total_rating = sum(booking.rating for booking in rated_bookings)
-    avg_rating = round(total_rating / len(rated_bookings), 2)
+    avg_rating = round(total_rating / count, 2)
     
     # Update provider's average rating
     provider.avg_rating = avg_rating
     db.session.commit()
     
-    logger.info(f"Updated provider {provider_id} rating to {avg_rating} based on {len(rated_bookings)} reviews")
-    return avg_rating, len(rated_bookings)
+    logger.info(f"Updated provider {provider_id} rating to {avg_rating} based on {count} reviews")
+    return avg_rating, count
+
+def reconcile_provider_ratings(repair=True):
+    """
+    Check every provider's rating aggregates against its bookings
+    
+    The true aggregates for all providers come from one GROUP BY over the
+    bookings table. Providers whose stored sum, count or average differ
+    are reported and, if repair is set, fixed with a single UPDATE.
+    Providers without any rated booking are left alone: their rating may
+    come from outside the bookings table (e.g. imported or seeded data).
+    
+    Args:
+        repair: Whether to fix the drifted providers
+        
+    Returns:
+        List of IDs of providers whose aggregates had drifted
+    """
+    from models import Provider, Booking
+    from db_setup import db
+    from sqlalchemy import Float, cast, func
+    
+    logger.info("Reconciling provider rating aggregates")
+    
+    rated = db.session.query(
+        Booking.provider_id,
+        func.count(Booking.rating),
+        func.sum(Booking.rating)
+    ).filter(
+        Booking.status == 'completed',
+        Booking.rating.isnot(None)
+    ).group_by(Booking.provider_id).all()
+    actual = {provider_id: (count, total) for provider_id, count, total in rated}
+    
+    drifted = []
+    stored = db.session.query(
+        Provider.id, Provider.rating_count, Provider.rating_sum, Provider.avg_rating
+    ).all()
+    for provider_id, count, total, avg_rating in stored:
+        if provider_id not in actual:
+            continue
+        true_count, true_total = actual[provider_id]
+        true_avg = round(true_total / true_count, 2)
+        
+        avg_matches = avg_rating is not None and abs(avg_rating - true_avg) < 0.005
+        if count != true_count or total != true_total or not avg_matches:
+            drifted.append(provider_id)
+    
+    if drifted:
+        logger.warning(f"Rating aggregates drifted for {len(drifted)} providers")
+    
+    if drifted and repair:
+        # Recompute the drifted rows in one statement with correlated subqueries
+        rated_bookings = db.session.query(Booking).filter(
+            Booking.provider_id == Provider.id,
+            Booking.status == 'completed',
+            Booking.rating.isnot(None)
+        )
+        count_subquery = rated_bookings.with_entities(func.count(Booking.rating)).scalar_subquery()
+        sum_subquery = rated_bookings.with_entities(func.coalesce(func.sum(Booking.rating), 0)).scalar_subquery()
+        avg_subquery = rated_bookings.with_entities(func.round(cast(func.avg(Booking.rating), Float), 2)).scalar_subquery()
+        
+        Provider.query.filter(Provider.id.in_(drifted)).update({
+            Provider.rating_count: count_subquery,
+            Provider.rating_sum: sum_subquery,
+            Provider.avg_rating: avg_subquery
+        }, synchronize_session=False)
+        db.session.commit()
+        logger.info(f"Repaired rating aggregates for {len(drifted)} providers")
+    
+    return drifted
 
 def get_available_time_slots(provider_id, date):
     """
     Get available time slots for a provider on a specific date
     
+    Answered from the in-memory availability engine; the database is only
+    read the first time a date is asked for.
+    
     Args:
         provider_id: ID of the provider
         date: Date object for availability check
@@ -278,57 +371,78 @@ def get_available_time_slots(provider_id, date):
     Returns:
         List of available time slots
     """
-    from models import Booking, Provider
+    from availability import availability_engine
     
     logger.info(f"Getting available time slots for provider {provider_id} on {date}")
     
-    # Default time slots (9 AM to 6 PM in 1-hour increments)
-    all_time_slots = [
-        '09:00-10:00', '10:00-11:00', '11:00-12:00',
-        '13:00-14:00', '14:00-15:00', '15:00-16:00',
-        '16:00-17:00', '17:00-18:00'
-    ]
-    
     # Check if provider is available on this date
-    provider = Provider.query.get(provider_id)
-    if not provider or not provider.is_available:
+    if not availability_engine.is_provider_available(provider_id):
         logger.warning(f"Provider {provider_id} is not available")
         return []
     
-    # Get bookings for this provider on this date
-    bookings = Booking.query.filter_by(
-        provider_id=provider_id,
-        booking_date=date
-    ).filter(Booking.status.in_(['pending', 'confirmed'])).all()
-    
-    # Get time slots that are already booked
-    booked_slots = [booking.time_slot for booking in bookings]
-    
-    # Return available time slots
-    available_slots = [slot for slot in all_time_slots if slot not in booked_slots]
+    available_slots = availability_engine.free_slots(provider_id, date)
     
     logger.info(f"Found {len(available_slots)} available time slots for provider {provider_id} on {date}")
     return available_slots
 
-def find_top_rated_providers(limit=5):
+def get_availability_matrix(provider_ids, start_date, days=14):
     """
-    Find the top-rated providers on the platform
+    Get available time slots for many providers over a range of dates
+    
+    Replaces calling get_available_time_slots once per provider per day:
+    the whole window is loaded with at most one booking query.
     
     Args:
-        limit: Maximum number of providers to return
+        provider_ids: List of provider IDs
+        start_date: First date of the window
+        days: Number of days in the window
         
     Returns:
-        List of Provider objects, sorted by rating
+        Dict mapping provider ID to a list of (date, available slots) pairs
     """
-    from models import Provider
+    from availability import availability_engine
     
-    logger.info(f"Finding top {limit} rated providers")
+    logger.info(f"Getting availability for {len(provider_ids)} providers from {start_date} for {days} days")
     
-    # Get providers that have ratings and are verified
-    top_providers = Provider.query.filter(
-        Provider.avg_rating.isnot(None),
-        Provider.is_verified == True
-    ).order_by(Provider.avg_rating.desc()).limit(limit).all()
+    return availability_engine.availability_matrix(provider_ids, start_date, days)
+
+def next_available_dates(provider_ids, start_date, days=14):
+    """
+    Find the first date with a free slot for each provider
+    
+    Args:
+        provider_ids: List of provider IDs
+        start_date: First date to consider
+        days: Number of days to look ahead
+        
+    Returns:
+        Dict mapping provider ID to (date, available slots), or None if the
+        provider has no free slot in the window
+    """
+    matrix = get_availability_matrix(provider_ids, start_date, days)
+    
+    next_dates = {}
+    for provider_id, row in matrix.items():
+        next_dates[provider_id] = next(((d, slots) for d, slots in row if slots), None)
+    return next_dates
+
+def find_top_rated_providers(limit=5, category_id=None):
+    """
+    Find the top-rated verified providers on the platform
+    
+    Reads the precomputed leaderboard, so it doesn't sort the providers
+    table on every call.
+    
+    Args:
+        limit: Maximum number of providers to return
+        category_id: Only rank providers offering this category (optional)
+        
+    Returns:
+        List of Leader snapshots, sorted by rating
+    """
+    from leaderboard import get_top_providers
+    
+    top_providers = list(get_top_providers(limit, category_id))
     
     logger.info(f"Found {len(top_providers)} top-rated providers")
     return top_providers
@@ -346,21 +460,78 @@ def check_booking_conflicts(provider_id, date, time_slot):
         Boolean indicating whether there is a conflict
     """
     from models import Booking
+    from availability import canonical_slot
     
     logger.info(f"Checking booking conflicts for provider {provider_id} on {date} at {time_slot}")
+    time_slot = canonical_slot(time_slot) or time_slot
     
     # Check for existing bookings at the same time
     existing_booking = Booking.query.filter_by(
         provider_id=provider_id,
         booking_date=date,
         time_slot=time_slot
-    ).filter(Booking.status.in_(['pending', 'confirmed'])).first()
+    ).filter(Booking.is_active()).first()
     
     conflict = existing_booking is not None
     logger.info(f"Booking conflict: {conflict}")
     
     return conflict
 
+# Bookings per dashboard page
+DASHBOARD_PAGE_SIZE = 20
+
+def get_booking_page(user, cursor=None, per_page=DASHBOARD_PAGE_SIZE):
+    """
+    Get one page of a customer's or provider's bookings, newest first
+    
+    Pages are keyed on (created_at, id) rather than an offset, so any page
+    is read straight from the owner's (owner, created_at) index. The
+    provider or customer, category, address and payment of each booking
+    are loaded in the same query.
+    
+    Args:
+        user: Customer or Provider whose bookings to list
+        cursor: Cursor of the page (next_cursor of the previous page), or
+            None for the first page
+        per_page: Number of bookings per page
+        
+    Returns:
+        Page of bookings with the cursor of the next page
+        
+    Raises:
+        ValueError: If the cursor is invalid
+    """
+    from models import Booking, Customer
+    from sqlalchemy.orm import joinedload
+    from pagination import after_key, decode_cursor, fetch_page
+    
+    if isinstance(user, Customer):
+        query = Booking.query.filter(Booking.customer_id == user.id).options(joinedload(Booking.provider))
+    else:
+        query = Booking.query.filter(Booking.provider_id == user.id).options(joinedload(Booking.customer))
+    
+    query = query.options(
+        joinedload(Booking.category),
+        joinedload(Booking.address),
+        joinedload(Booking.payment)
+    )
+    
+    if cursor:
+        created_at, booking_id = decode_cursor(cursor, 2)
+        if not isinstance(booking_id, int) or isinstance(booking_id, bool):
+            raise ValueError("Invalid cursor")
+        try:
+            created_at = datetime.fromisoformat(created_at)
+        except (TypeError, ValueError):
+            raise ValueError("Invalid cursor")
+        query = query.filter(after_key([
+            (Booking.created_at, created_at, True),
+            (Booking.id, booking_id, True)
+        ]))
+    
+    query = query.order_by(Booking.created_at.desc(), Booking.id.desc())
+    return fetch_page(query, lambda booking: [booking.created_at.isoformat(), booking.id], per_page)
+
 def cancel_booking(booking_id, cancel_reason=None):
     """
     Cancel a booking and handle related operations
@@ -406,12 +577,14 @@ def cancel_booking(booking_id, cancel_reason=None):
     
     return True, None
 
-def validate_booking_data(data):
+def validate_booking_data(data, check_conflicts=True):
     """
     Validate booking data before creating a booking
     
     Args:
         data: Dictionary containing booking data
+        check_conflicts: Whether to look up existing bookings for the slot
+            (not needed when inserting, which the database guards)
         
     Returns:
         (is_valid, errors) tuple
@@ -456,7 +629,7 @@ def validate_booking_data(data):
         errors['time_slot'] = "Invalid time slot format (use HH:MM-HH:MM)"
     
     # Check for booking conflicts
-    if 'provider_id' in data and 'booking_date' in data and 'time_slot' in data:
+    if check_conflicts and 'provider_id' in data and 'booking_date' in data and 'time_slot' in data:
         try:
             if check_booking_conflicts(data['provider_id'], booking_date, data['time_slot']):
                 errors['time_slot'] = "This time slot is already booked"
@@ -470,4 +643,87 @@ def validate_booking_data(data):
     else:
         logger.info("Booking validation successful")
     
-    return is_valid, errors
\ No newline at end of file
+    return is_valid, errors
+
+def _is_active_slot_conflict(error):
+    """
+    Check whether an IntegrityError is a violation of uq_booking_active_slot
+    
+    PostgreSQL reports the name of the violated constraint; SQLite reports a
+    unique violation with the index's columns instead of its name.
+    
+    Args:
+        error: The IntegrityError raised by the insert
+        
+    Returns:
+        True if the slot was already held by an active booking
+    """
+    from models import Booking
+    
+    diag = getattr(error.orig, 'diag', None)
+    if diag is not None:
+        return getattr(diag, 'constraint_name', None) == 'uq_booking_active_slot'
+    
+    index = next(i for i in Booking.__table__.indexes if i.name == 'uq_booking_active_slot')
+    columns = ', '.join(f"{Booking.__tablename__}.{column.name}" for column in index.columns)
+    return str(error.orig) == f"UNIQUE constraint failed: {columns}"
+
+def book_time_slot(data):
+    """
+    Validate booking data and create a pending booking
+    
+    The slot is reserved by the insert itself: a unique index allows one
+    active booking per provider, date and time slot, so of two concurrent
+    requests for the same slot exactly one succeeds, without a conflict
+    check query beforehand.
+    
+    Args:
+        data: Dictionary containing booking data (see validate_booking_data);
+            time_slot may be 'HH:MM' or 'HH:MM-HH:MM'
+        
+    Returns:
+        (booking, errors) tuple
+        booking: The created Booking, None if it could not be created
+        errors: Dictionary of validation errors, empty on success
+    """
+    from models import Booking
+    from db_setup import db
+    from availability import canonical_slot
+    from sqlalchemy.exc import IntegrityError
+    
+    data = dict(data)
+    time_slot = canonical_slot(data.get('time_slot'))
+    if data.get('time_slot') and time_slot is None:
+        return None, {'time_slot': "Invalid time slot"}
+    data['time_slot'] = time_slot
+    
+    is_valid, errors = validate_booking_data(data, check_conflicts=False)
+    if not is_valid:
+        return None, errors
+    
+    booking_date = data['booking_date']
+    if isinstance(booking_date, str):
+        booking_date = datetime.strptime(booking_date, '%Y-%m-%d').date()
+    
+    booking = Booking(
+        customer_id=data['customer_id'],
+        provider_id=data['provider_id'],
+        category_id=data['category_id'],
+        address_id=data['address_id'],
+        booking_date=booking_date,
+        time_slot=time_slot,
+        status='pending'
+    )
+    db.session.add(booking)
+    
+    try:
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        if not _is_active_slot_conflict(e):
+            raise
+        logger.warning(f"Slot {booking_date} {time_slot} of provider {data['provider_id']} is already booked")
+        return None, {'time_slot': "This time slot is already booked"}
+    
+    logger.info(f"Booking {booking.id} created for provider {data['provider_id']} on {booking_date} at {time_slot}")
+    return booking, {}
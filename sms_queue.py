@@ -0,0 +1,268 @@
+"""
+Background SMS delivery queue.
+
+Messages are stored as SMSJob rows in the same transaction as the data
+they belong to (e.g. the OTPVerification row), so a request never waits
+on the SMS gateway. A delivery worker sends due jobs out of band and
+retries transient failures with exponential backoff.
+
+Each job is claimed with a short lease (locked_until) before it is sent,
+so several workers - threads in different web processes, or a separate
+`flask sms-worker` process - can share the table without sending a
+message twice.
+"""
+
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_
+
+from db_setup import db
+from model_events import on_change
+from models import SMSJob
+from sms_transport import SMSError, get_transport
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+BACKOFF_BASE_SECONDS = 5
+BACKOFF_MAX_SECONDS = 300
+
+# How long a claimed job stays locked; a worker that dies mid-send
+# releases its jobs when the lease runs out
+LEASE_SECONDS = 60
+
+# How often an idle worker checks for due retries
+POLL_INTERVAL_SECONDS = 5
+
+# Sent and failed jobs hold the OTP text, so they are kept no longer
+# than the code itself is valid
+RETENTION = timedelta(minutes=10)
+
+
+def enqueue_sms(phone, body):
+    """
+    Queue an SMS for background delivery
+
+    The job is only added to the session; it is sent once the caller
+    commits, together with the rest of its transaction.
+
+    Args:
+        phone: Recipient phone number in E.164 format
+        body: Message text
+
+    Returns:
+        The new SMSJob
+    """
+    job = SMSJob(phone=phone, body=body, status='pending', next_attempt_at=datetime.utcnow())
+    db.session.add(job)
+    return job
+
+
+def retry_delay(attempts):
+    """Get the backoff delay after a given number of failed attempts"""
+    return timedelta(seconds=min(BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), BACKOFF_MAX_SECONDS))
+
+
+def _claim(job_id, now):
+    """Take the lease on a job; returns False if another worker holds it"""
+    claimed = SMSJob.query.filter(
+        SMSJob.id == job_id,
+        SMSJob.status == 'pending',
+        or_(SMSJob.locked_until.is_(None), SMSJob.locked_until < now)
+    ).update({'locked_until': now + timedelta(seconds=LEASE_SECONDS)}, synchronize_session=False)
+    db.session.commit()
+    return claimed == 1
+
+
+def _record(job, result, now):
+    """Record the outcome of one send: a message ID or an exception"""
+    job.attempts += 1
+    job.locked_until = None
+
+    if isinstance(result, Exception):
+        permanent = isinstance(result, SMSError) and result.permanent
+        job.last_error = str(result)[:255]
+
+        if permanent or job.attempts >= MAX_ATTEMPTS:
+            job.status = 'failed'
+            logger.error(f"SMS job {job.id} failed after {job.attempts} attempts: {str(result)}")
+        else:
+            job.next_attempt_at = now + retry_delay(job.attempts)
+            logger.warning(f"SMS job {job.id} attempt {job.attempts} failed, retrying at {job.next_attempt_at}: {str(result)}")
+        return False
+
+    job.status = 'sent'
+    job.sent_at = now
+    job.last_error = None
+    logger.info(f"SMS job {job.id} sent. SID: {result}")
+    return True
+
+
+def process_due_jobs(transport=None, limit=20, now=None):
+    """
+    Send the pending jobs that are due
+
+    The claimed jobs are sent as one batch, so up to the transport's
+    concurrency limit are in flight at once.
+
+    Args:
+        transport: Transport to send with (defaults to get_transport())
+        limit: Maximum number of jobs to handle
+        now: Current time (defaults to datetime.utcnow())
+
+    Returns:
+        Number of jobs handled (sent or failed)
+    """
+    transport = transport or get_transport()
+    if transport is None:
+        logger.warning("No SMS transport configured; pending jobs stay queued")
+        return 0
+
+    now = now or datetime.utcnow()
+    due_ids = [job_id for (job_id,) in db.session.query(SMSJob.id).filter(
+        SMSJob.status == 'pending',
+        SMSJob.next_attempt_at <= now,
+        or_(SMSJob.locked_until.is_(None), SMSJob.locked_until < now)
+    ).order_by(SMSJob.next_attempt_at).limit(limit)]
+
+    claimed = [job_id for job_id in due_ids if _claim(job_id, now)]
+    if not claimed:
+        return 0
+
+    jobs = SMSJob.query.filter(SMSJob.id.in_(claimed)).order_by(SMSJob.next_attempt_at).all()
+    results = transport.send_batch([(job.phone, job.body) for job in jobs])
+
+    for job, result in zip(jobs, results):
+        _record(job, result, now)
+    db.session.commit()
+
+    return len(jobs)
+
+
+def purge_finished_jobs(batch_size=1000, now=None):
+    """
+    Delete sent and failed jobs older than RETENTION in batches
+
+    Pending jobs are kept whatever their age. Each batch is committed on
+    its own, keeping write locks short on a large table.
+
+    Args:
+        batch_size: Number of jobs deleted per transaction
+        now: Current time (defaults to datetime.utcnow())
+
+    Returns:
+        Number of jobs deleted
+    """
+    cutoff = (now or datetime.utcnow()) - RETENTION
+    deleted = 0
+
+    while True:
+        batch = [job_id for (job_id,) in db.session.query(SMSJob.id).filter(
+            SMSJob.status.in_(('sent', 'failed')),
+            SMSJob.created_at < cutoff
+        ).limit(batch_size)]
+        if not batch:
+            break
+
+        SMSJob.query.filter(SMSJob.id.in_(batch)).delete(synchronize_session=False)
+        db.session.commit()
+        deleted += len(batch)
+
+    logger.info(f"Purged {deleted} finished SMS jobs")
+    return deleted
+
+
+def next_due_time():
+    """Get when the earliest pending job is due, or None if there is none"""
+    return db.session.query(db.func.min(SMSJob.next_attempt_at)).filter(
+        SMSJob.status == 'pending'
+    ).scalar()
+
+
+class DeliveryWorker:
+    """Daemon thread that sends queued SMS for one application"""
+
+    def __init__(self, app, transport=None):
+        self.app = app
+        self.transport = transport
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        config = self.app.config
+        return config.get('SMS_WORKER_ENABLED', True) and not config.get('TESTING')
+
+    def notify(self):
+        """Wake the worker (starting it on first use) to look for new jobs"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self.run, name='sms-delivery', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def stop(self, timeout=None):
+        """Ask the worker to exit and wait for it"""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run(self):
+        """Worker loop: send due jobs, then sleep until the next one is due"""
+        transport = self.transport or get_transport()
+        if transport is None:
+            logger.warning("No SMS transport configured; delivery worker not started")
+            return
+
+        with self.app.app_context():
+            while not self._stopping.is_set():
+                self._wakeup.clear()
+                timeout = POLL_INTERVAL_SECONDS
+                try:
+                    while process_due_jobs(transport):
+                        pass
+                    due = next_due_time()
+                    if due is not None:
+                        timeout = min(max((due - datetime.utcnow()).total_seconds(), 0.1), POLL_INTERVAL_SECONDS)
+                except Exception as e:
+                    logger.error(f"SMS delivery worker error: {str(e)}")
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+
+                self._wakeup.wait(timeout)
+
+
+_worker = None
+
+
+def init_app(app):
+    """
+    Set up background delivery for an application
+
+    The worker thread starts on the first queued message. Set
+    SMS_WORKER_ENABLED to False to leave delivery to a separate
+    `flask sms-worker` process; it is also off while TESTING.
+    """
+    global _worker
+
+    _worker = DeliveryWorker(app)
+    app.extensions['sms_queue'] = _worker
+    return _worker
+
+
+@on_change(SMSJob)
+def wake_worker(changes):
+    """Wake the delivery worker when new jobs are committed"""
+    if _worker is None or not changes:
+        return
+    if any(change.action == 'insert' for change in changes):
+        _worker.notify()
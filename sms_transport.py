@@ -0,0 +1,341 @@
+"""
+SMS transports used by the delivery queue.
+
+A transport sends messages with send(to, body), which returns a provider
+message ID or raises SMSError, or with send_batch(messages), which sends
+several messages concurrently. Every transport limits how many sends run
+at once and records timing metrics.
+
+TwilioTransport talks to the Twilio API through one long-lived client
+whose pooled HTTP session keeps connections to the API open between
+messages. FakeTransport keeps messages in memory for tests and offline
+development (SMS_TRANSPORT=fake).
+"""
+
+import importlib.util
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Twilio errors that will fail again however often they are retried
+#   21211: invalid 'To' phone number
+#   21214: 'To' phone number cannot be reached
+#   21608: unverified number on a trial account
+#   21610: recipient has unsubscribed
+PERMANENT_ERROR_CODES = {21211, 21214, 21608, 21610}
+
+# Defaults for SMS_MAX_CONCURRENCY and SMS_TIMEOUT (seconds)
+DEFAULT_MAX_CONCURRENCY = 4
+DEFAULT_TIMEOUT = 10
+
+_E164_PATTERN = re.compile(r'^\+[1-9]\d{7,14}$')
+
+
+class SMSError(Exception):
+    """Sending an SMS failed"""
+
+    def __init__(self, message, permanent=False):
+        super().__init__(message)
+        self.permanent = permanent
+
+
+def normalize_phone_number(phone_number):
+    """
+    Normalize a phone number to E.164 format (+[country code][number])
+
+    Args:
+        phone_number: Phone number as entered by the user
+
+    Returns:
+        Normalized phone number, or None if it is not a valid E.164 number
+    """
+    if not phone_number:
+        return None
+
+    phone_number = phone_number.strip()
+    if not phone_number.startswith('+'):
+        phone_number = '+' + phone_number
+
+    # Remove any spaces, dashes, or parentheses
+    phone_number = ''.join(c for c in phone_number if c.isdigit() or c == '+')
+
+    if not _E164_PATTERN.match(phone_number):
+        return None
+    return phone_number
+
+
+def twilio_available():
+    """Check whether the Twilio package is installed"""
+    return importlib.util.find_spec('twilio') is not None
+
+
+def twilio_credentials():
+    """
+    Get the Twilio credentials from the environment
+
+    Returns:
+        (account_sid, auth_token, from_number) tuple, or None if any is missing
+    """
+    account_sid = os.environ.get('TWILIO_ACCOUNT_SID')
+    auth_token = os.environ.get('TWILIO_AUTH_TOKEN')
+    from_number = os.environ.get('TWILIO_PHONE_NUMBER')
+
+    if not account_sid or not auth_token or not from_number:
+        return None
+    return account_sid, auth_token, from_number
+
+
+class SendMetrics:
+    """Thread-safe counters and timings of the sends of one transport"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.failed = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.in_flight = 0
+
+    def started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def finished(self, seconds, ok):
+        with self._lock:
+            self.in_flight -= 1
+            if ok:
+                self.sent += 1
+            else:
+                self.failed += 1
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+
+    def snapshot(self):
+        """
+        Get the current metrics
+
+        Returns:
+            Dict with sent and failed counts, sends in flight, and the
+            average and maximum send time in milliseconds
+        """
+        with self._lock:
+            count = self.sent + self.failed
+            return {
+                'sent': self.sent,
+                'failed': self.failed,
+                'in_flight': self.in_flight,
+                'avg_ms': round(self.total_seconds * 1000 / count, 2) if count else 0.0,
+                'max_ms': round(self.max_seconds * 1000, 2)
+            }
+
+
+class SMSTransport:
+    """
+    Base class for transports
+
+    Subclasses implement _send(to, body). Sends are limited to
+    max_concurrency at a time across all threads using the transport.
+    """
+
+    def __init__(self, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        self.max_concurrency = max(1, max_concurrency)
+        self.metrics = SendMetrics()
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _send(self, to, body):
+        raise NotImplementedError
+
+    def send(self, to, body):
+        """
+        Send one SMS
+
+        Args:
+            to: Recipient phone number in E.164 format
+            body: Message text
+
+        Returns:
+            Provider message ID
+
+        Raises:
+            SMSError: If the message could not be sent
+        """
+        with self._slots:
+            self.metrics.started()
+            start = time.perf_counter()
+            ok = False
+            try:
+                sid = self._send(to, body)
+                ok = True
+                return sid
+            finally:
+                self.metrics.finished(time.perf_counter() - start, ok)
+
+    def send_batch(self, messages):
+        """
+        Send several SMS concurrently (up to max_concurrency at a time)
+
+        Args:
+            messages: List of (to, body) tuples
+
+        Returns:
+            List with, for each message in order, its message ID or the
+            exception that made it fail
+        """
+        if len(messages) <= 1 or self.max_concurrency == 1:
+            return [self._send_or_error(to, body) for to, body in messages]
+
+        futures = [self._get_executor().submit(self._send_or_error, to, body) for to, body in messages]
+        return [future.result() for future in futures]
+
+    def _send_or_error(self, to, body):
+        try:
+            return self.send(to, body)
+        except Exception as e:
+            return e
+
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_concurrency, thread_name_prefix='sms-send'
+                )
+            return self._executor
+
+    def close(self):
+        """Release the worker threads and connections of the transport"""
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+
+class TwilioTransport(SMSTransport):
+    """Send SMS through the Twilio REST API over a pooled HTTP session"""
+
+    def __init__(self, account_sid, auth_token, from_number,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY, timeout=DEFAULT_TIMEOUT):
+        super().__init__(max_concurrency)
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self.from_number = from_number
+        self.timeout = timeout
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    def _get_client(self):
+        # Built on first use so importing this module never loads twilio
+        with self._client_lock:
+            if self._client is None:
+                from requests.adapters import HTTPAdapter
+                from twilio.http.http_client import TwilioHttpClient
+                from twilio.rest import Client
+
+                http_client = TwilioHttpClient(pool_connections=True, timeout=self.timeout)
+                # One keep-alive connection per concurrent send
+                http_client.session.mount('https://', HTTPAdapter(
+                    pool_connections=1, pool_maxsize=self.max_concurrency
+                ))
+                self._client = Client(self.account_sid, self.auth_token, http_client=http_client)
+            return self._client
+
+    def _send(self, to, body):
+        from twilio.base.exceptions import TwilioRestException, TwilioException
+
+        try:
+            message = self._get_client().messages.create(body=body, from_=self.from_number, to=to)
+        except TwilioRestException as e:
+            raise SMSError(f"Twilio error {e.code}: {e.msg}", permanent=e.code in PERMANENT_ERROR_CODES)
+        except TwilioException as e:
+            raise SMSError(f"Twilio exception: {str(e)}")
+        except Exception as e:
+            # Connection errors and timeouts from the HTTP session
+            raise SMSError(f"SMS request failed: {str(e)}")
+
+        return message.sid
+
+    def close(self):
+        super().close()
+        with self._client_lock:
+            if self._client is not None:
+                self._client.http_client.session.close()
+                self._client = None
+
+
+class FakeTransport(SMSTransport):
+    """
+    In-memory transport for tests and offline development
+
+    Sent messages are kept in `sent` as (to, body) tuples. Queue errors
+    with fail_next() to make the next sends raise SMSError, and set
+    `latency` (seconds) to simulate a slow gateway.
+    """
+
+    def __init__(self, max_concurrency=DEFAULT_MAX_CONCURRENCY, latency=0):
+        super().__init__(max_concurrency)
+        self.latency = latency
+        self.sent = []
+        self._failures = []
+        self._lock = threading.Lock()
+
+    def fail_next(self, message='Simulated failure', permanent=False, times=1):
+        """Make the next `times` sends fail"""
+        with self._lock:
+            self._failures.extend([SMSError(message, permanent=permanent)] * times)
+
+    def _send(self, to, body):
+        if self.latency:
+            time.sleep(self.latency)
+
+        with self._lock:
+            if self._failures:
+                raise self._failures.pop(0)
+            self.sent.append((to, body))
+            sid = f"FAKE{len(self.sent)}"
+
+        logger.info(f"Fake SMS to {to}: {body}")
+        return sid
+
+
+_transport = None
+_transport_config = None
+_transport_lock = threading.Lock()
+
+
+def get_transport():
+    """
+    Get the shared transport configured in the environment
+
+    SMS_TRANSPORT=fake selects an in-memory FakeTransport; otherwise Twilio
+    is used when it is installed and configured. SMS_MAX_CONCURRENCY and
+    SMS_TIMEOUT tune the transport. The transport is created on first use
+    and reused by every caller until the configuration changes.
+
+    Returns:
+        Transport instance, or None if no transport is configured
+    """
+    global _transport, _transport_config
+
+    fake = os.environ.get('SMS_TRANSPORT') == 'fake'
+    credentials = None if fake else twilio_credentials()
+    max_concurrency = int(os.environ.get('SMS_MAX_CONCURRENCY', DEFAULT_MAX_CONCURRENCY))
+    timeout = float(os.environ.get('SMS_TIMEOUT', DEFAULT_TIMEOUT))
+    config = (fake, credentials, max_concurrency, timeout)
+
+    with _transport_lock:
+        if config != _transport_config:
+            # The old transport is left to finish any sends in flight
+            _transport = None
+            _transport_config = config
+
+            if fake:
+                _transport = FakeTransport(max_concurrency)
+            elif credentials is not None and twilio_available():
+                _transport = TwilioTransport(*credentials, max_concurrency=max_concurrency, timeout=timeout)
+        return _transport
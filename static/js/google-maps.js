@@ -5,6 +5,8 @@ let map;
 let marker;
 let geocoder;
 let autocomplete;
+let providerMarkers = [];
+let providerRequestId = 0;
 
 // Initialize the Google Maps functionality
 function initGoogleMaps() {
@@ -205,6 +207,82 @@ function initMap() {
         placeMarker(event.latLng);
         geocodeLatLng(event.latLng);
     });
+    
+    // Show nearby providers if the page asks for them
+    if (map.getDiv().dataset.showProviders !== undefined) {
+        map.addListener('idle', loadProviderMarkers);
+    }
+}
+
+// Load the providers (or clusters) inside the visible viewport
+function loadProviderMarkers() {
+    const bounds = map.getBounds();
+    if (!bounds) {
+        return;
+    }
+    
+    const sw = bounds.getSouthWest();
+    const ne = bounds.getNorthEast();
+    const params = new URLSearchParams({
+        bounds: [sw.lat(), sw.lng(), ne.lat(), ne.lng()].map(v => v.toFixed(5)).join(','),
+        zoom: map.getZoom()
+    });
+    
+    // Ignore responses to viewports the user has already moved away from
+    const requestId = ++providerRequestId;
+    
+    fetch('/get-providers?' + params.toString())
+        .then(response => response.json())
+        .then(function(data) {
+            if (requestId === providerRequestId) {
+                renderProviderMarkers(data);
+            }
+        })
+        .catch(error => console.error('Error loading providers:', error));
+}
+
+// Replace the provider markers with the given providers and clusters
+function renderProviderMarkers(data) {
+    providerMarkers.forEach(m => m.setMap(null));
+    providerMarkers = [];
+    
+    (data.clusters || []).forEach(function(cluster) {
+        const clusterMarker = new google.maps.Marker({
+            position: { lat: cluster.lat, lng: cluster.lng },
+            map: map,
+            label: { text: String(cluster.count), color: '#ffffff' },
+            icon: {
+                path: google.maps.SymbolPath.CIRCLE,
+                scale: 14 + Math.min(cluster.count, 50) / 5,
+                fillColor: '#0d6efd',
+                fillOpacity: 0.85,
+                strokeWeight: 0
+            }
+        });
+        
+        // Zoom in on a cluster when it is clicked
+        clusterMarker.addListener('click', function() {
+            map.setCenter(clusterMarker.getPosition());
+            map.setZoom(map.getZoom() + 2);
+        });
+        providerMarkers.push(clusterMarker);
+    });
+    
+    (data.providers || []).forEach(function(provider) {
+        providerMarkers.push(new google.maps.Marker({
+            position: { lat: provider.lat, lng: provider.lng },
+            map: map,
+            title: provider.name,
+            icon: {
+                path: google.maps.SymbolPath.CIRCLE,
+                scale: 6,
+                fillColor: '#d59563',
+                fillOpacity: 1,
+                strokeColor: '#242f3e',
+                strokeWeight: 1
+            }
+        }));
+    });
 }
 
 // Initialize the autocomplete functionality
@@ -0,0 +1,33 @@
+"""Helpers for counting the SQL statements issued by the code under test."""
+
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from db_setup import db
+
+@contextmanager
+def recorded_statements():
+    """
+    Record the SQL statements run on the current app's engine
+
+    Yields:
+        List the statements are appended to as they run
+    """
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = db.get_engine()
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+def count_queries(func):
+    """Run func and return the number of SQL statements it issued"""
+    with recorded_statements() as statements:
+        func()
+    return len(statements)
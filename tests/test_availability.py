@@ -0,0 +1,250 @@
+import unittest
+import os
+import sys
+from datetime import datetime, timedelta
+
+# Add the parent directory to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from wsgi import app
+from models import Customer, Provider, ServiceCategory, Address, Booking
+from availability import availability_engine, slot_index, slots_from_mask, TIME_SLOTS
+from services import get_availability_matrix, next_available_dates
+from tests.queries import count_queries
+
+class TestAvailability(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self._create_test_data()
+
+    def tearDown(self):
+        """Clean up after tests"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _create_test_data(self):
+        """Create two providers and a customer who can book them"""
+        plumbing = ServiceCategory(name="Plumbing", description="Plumbing services")
+        customer = Customer(
+            email="customer@example.com",
+            phone="+353100000001",
+            password_hash="hash",
+            first_name="Test",
+            last_name="Customer",
+            is_verified=True
+        )
+        providers = [
+            Provider(
+                email=f"provider{i}@example.com",
+                phone=f"+35320000000{i}",
+                password_hash="hash",
+                first_name="Test",
+                last_name=f"Provider{i}",
+                verification_document="doc.pdf",
+                is_available=True,
+                is_verified=True
+            )
+            for i in range(2)
+        ]
+        db.session.add_all([plumbing, customer] + providers)
+        db.session.commit()
+
+        address = Address(
+            customer_id=customer.id,
+            address_line="1 Test Street",
+            city="Dublin",
+            state="Dublin",
+            postal_code="D01 AB12"
+        )
+        db.session.add(address)
+        db.session.commit()
+
+        self.category_id = plumbing.id
+        self.customer_id = customer.id
+        self.address_id = address.id
+        self.provider1_id = providers[0].id
+        self.provider2_id = providers[1].id
+        self.tomorrow = datetime.utcnow().date() + timedelta(days=1)
+
+    def _book(self, provider_id, time_slot, status='pending'):
+        booking = Booking(
+            customer_id=self.customer_id,
+            provider_id=provider_id,
+            category_id=self.category_id,
+            address_id=self.address_id,
+            booking_date=self.tomorrow,
+            time_slot=time_slot,
+            status=status
+        )
+        db.session.add(booking)
+        db.session.commit()
+        return booking
+
+    def test_slot_helpers(self):
+        """Test slot index lookup and mask decoding"""
+        self.assertEqual(slot_index('09:00-10:00'), 0)
+        self.assertEqual(slot_index('10:00'), 1)
+        self.assertIsNone(slot_index('12:00'))
+        self.assertEqual(slots_from_mask(0b101), ['09:00-10:00', '11:00-12:00'])
+
+    def test_booking_lifecycle_updates_masks(self):
+        """Test that creating, cancelling and completing bookings update the masks"""
+        self.assertEqual(availability_engine.free_slots(self.provider1_id, self.tomorrow), TIME_SLOTS)
+
+        booking = self._book(self.provider1_id, '10:00-11:00')
+        self.assertNotIn('10:00-11:00', availability_engine.free_slots(self.provider1_id, self.tomorrow))
+        self.assertEqual(availability_engine.booked_mask(self.provider1_id, self.tomorrow), 0b10)
+
+        booking.status = 'cancelled'
+        db.session.commit()
+        self.assertEqual(availability_engine.free_slots(self.provider1_id, self.tomorrow), TIME_SLOTS)
+
+        booking = self._book(self.provider1_id, '14:00', status='confirmed')
+        self.assertNotIn('14:00-15:00', availability_engine.free_slots(self.provider1_id, self.tomorrow))
+
+        booking.status = 'completed'
+        db.session.commit()
+        self.assertEqual(availability_engine.free_slots(self.provider1_id, self.tomorrow), TIME_SLOTS)
+
+    def test_free_providers(self):
+        """Test listing the providers free at a date and slot"""
+        self._book(self.provider1_id, '09:00-10:00')
+
+        free = availability_engine.free_providers(self.tomorrow, '09:00-10:00')
+        self.assertEqual(free, [self.provider2_id])
+
+        free = availability_engine.free_providers(self.tomorrow, '10:00-11:00')
+        self.assertEqual(free, [self.provider1_id, self.provider2_id])
+
+        # Unavailable providers are never free
+        provider = Provider.query.get(self.provider2_id)
+        provider.is_available = False
+        db.session.commit()
+
+        self.assertEqual(availability_engine.free_providers(self.tomorrow, '10:00-11:00'), [self.provider1_id])
+        self.assertEqual(availability_engine.free_slots(self.provider2_id, self.tomorrow), [])
+
+    def test_large_provider_ids_keep_bitsets_narrow(self):
+        """Test that provider bitsets grow with the number of providers, not their IDs"""
+        availability_engine.reset()
+        provider = Provider(
+            id=10 ** 9,
+            email="provider-large@example.com",
+            phone="+353200000099",
+            password_hash="hash",
+            first_name="Test",
+            last_name="ProviderLarge",
+            verification_document="doc.pdf",
+            is_available=True,
+            is_verified=True
+        )
+        db.session.add(provider)
+        db.session.commit()
+        self._book(provider.id, '09:00-10:00')
+
+        free = availability_engine.free_providers(self.tomorrow, '09:00-10:00')
+        self.assertEqual(free, [self.provider1_id, self.provider2_id])
+        free = availability_engine.free_providers(self.tomorrow, '10:00-11:00')
+        self.assertEqual(free, [self.provider1_id, self.provider2_id, provider.id])
+        self.assertTrue(availability_engine.is_provider_available(provider.id))
+
+        self.assertLessEqual(availability_engine._available_providers().bit_length(), 3)
+        for bitset in availability_engine._slot_providers.values():
+            self.assertLessEqual(bitset.bit_length(), 3)
+
+    def test_rejected_double_booking_keeps_masks(self):
+        """Test that a booking rejected by the slot constraint leaves the masks alone"""
+        availability_engine.ensure_loaded(self.tomorrow)
+        first = self._book(self.provider1_id, '13:00-14:00')
+        
+        with self.assertRaises(IntegrityError):
+            self._book(self.provider1_id, '13:00-14:00')
+        db.session.rollback()
+        self.assertNotIn('13:00-14:00', availability_engine.free_slots(self.provider1_id, self.tomorrow))
+
+        first = Booking.query.get(first.id)
+        first.status = 'cancelled'
+        db.session.commit()
+        self.assertIn('13:00-14:00', availability_engine.free_slots(self.provider1_id, self.tomorrow))
+
+    def test_lookups_do_not_query_database(self):
+        """Test that warm lookups are answered from memory"""
+        availability_engine.ensure_loaded(self.tomorrow)
+        self._book(self.provider1_id, '15:00-16:00')
+
+        def lookups():
+            availability_engine.free_slots(self.provider1_id, self.tomorrow)
+            availability_engine.free_providers(self.tomorrow, '15:00-16:00')
+
+        self.assertEqual(count_queries(lookups), 0)
+
+    def test_other_processes_bookings_seen_after_ttl(self):
+        """Test that bookings the commit hooks don't see are picked up when a date expires"""
+        availability_engine.ensure_loaded(self.tomorrow)
+
+        # Written the way another worker's commit looks to this process
+        db.session.execute(text(
+            "INSERT INTO bookings (customer_id, provider_id, category_id, address_id, booking_date, "
+            "time_slot, status, created_at) VALUES (:customer, :provider, :category, :address, :date, "
+            "'09:00-10:00', 'pending', :now)"
+        ), {'customer': self.customer_id, 'provider': self.provider1_id, 'category': self.category_id,
+            'address': self.address_id, 'date': self.tomorrow, 'now': datetime.utcnow()})
+        db.session.execute(text("UPDATE providers SET is_available = 0 WHERE id = :id"),
+                           {'id': self.provider2_id})
+        db.session.commit()
+        self.assertIn('09:00-10:00', availability_engine.free_slots(self.provider1_id, self.tomorrow))
+
+        app.config['AVAILABILITY_CACHE_TTL'] = 0
+        try:
+            self.assertNotIn('09:00-10:00', availability_engine.free_slots(self.provider1_id, self.tomorrow))
+            self.assertEqual(availability_engine.free_providers(self.tomorrow, '10:00-11:00'),
+                             [self.provider1_id])
+        finally:
+            del app.config['AVAILABILITY_CACHE_TTL']
+
+    def test_availability_matrix(self):
+        """Test the batch availability lookup over a date window"""
+        self._book(self.provider1_id, '09:00-10:00')
+        availability_engine.reset()
+
+        provider_ids = [self.provider1_id, self.provider2_id]
+        matrix = {}
+
+        def lookup():
+            matrix.update(get_availability_matrix(provider_ids, self.tomorrow, days=14))
+
+        # One query for provider availability and one for the whole window
+        self.assertLessEqual(count_queries(lookup), 2)
+
+        self.assertEqual(len(matrix[self.provider1_id]), 14)
+        first_date, first_slots = matrix[self.provider1_id][0]
+        self.assertEqual(first_date, self.tomorrow)
+        self.assertNotIn('09:00-10:00', first_slots)
+        self.assertEqual(matrix[self.provider2_id][0][1], TIME_SLOTS)
+
+    def test_next_available_dates(self):
+        """Test finding each provider's first free day"""
+        for time_slot in TIME_SLOTS:
+            self._book(self.provider1_id, time_slot)
+
+        next_dates = next_available_dates([self.provider1_id, self.provider2_id], self.tomorrow, days=2)
+        self.assertEqual(next_dates[self.provider1_id], (self.tomorrow + timedelta(days=1), TIME_SLOTS))
+        self.assertEqual(next_dates[self.provider2_id], (self.tomorrow, TIME_SLOTS))
+
+        next_dates = next_available_dates([self.provider1_id], self.tomorrow, days=1)
+        self.assertIsNone(next_dates[self.provider1_id])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+import os
+import sys
+
+# Add the parent directory to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import text
+
+from app import db
+from wsgi import app
+from models import ServiceCategory
+from catalog import get_categories, get_category, get_category_by_name
+from tests.queries import count_queries
+
+class TestCatalog(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.client = app.test_client()
+
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        plumbing = ServiceCategory(name="Plumbing", description="Plumbing services")
+        electrical = ServiceCategory(name="Electrical", description="Electrical services")
+        db.session.add_all([plumbing, electrical])
+        db.session.commit()
+        self.plumbing_id = plumbing.id
+
+    def tearDown(self):
+        """Clean up after tests"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_lookups(self):
+        """Test listing and looking up categories"""
+        self.assertEqual([c.name for c in get_categories()], ['Plumbing', 'Electrical'])
+        self.assertEqual(get_category(self.plumbing_id).name, 'Plumbing')
+        self.assertEqual(get_category(str(self.plumbing_id)).description, 'Plumbing services')
+        self.assertEqual(get_category_by_name(' electrical ').name, 'Electrical')
+        self.assertIsNone(get_category(999))
+        self.assertIsNone(get_category('abc'))
+        self.assertIsNone(get_category_by_name('Roofing'))
+
+    def test_warm_catalog_does_not_query(self):
+        """Test that category pages render without category queries"""
+        get_categories()
+        self.assertEqual(count_queries(lambda: (
+            get_categories(), get_category(self.plumbing_id), get_category_by_name('Plumbing')
+        )), 0)
+
+        response = self.client.get('/services/')
+        self.assertIn(b'Electrical', response.data)
+        self.assertEqual(count_queries(lambda: self.client.get('/services/')), 0)
+
+    def test_writes_invalidate_catalog(self):
+        """Test that committed category changes are visible at once"""
+        get_categories()
+
+        db.session.add(ServiceCategory(name="Roofing", description="Roof repairs"))
+        db.session.commit()
+        self.assertEqual(get_category_by_name('roofing').description, 'Roof repairs')
+
+        category = ServiceCategory.query.get(self.plumbing_id)
+        category.name = "Plumbing & Heating"
+        db.session.commit()
+        self.assertEqual(get_category(self.plumbing_id).name, 'Plumbing & Heating')
+        self.assertIsNone(get_category_by_name('Plumbing'))
+
+    def test_other_processes_writes_seen_after_ttl(self):
+        """Test that changes the commit hooks don't see are picked up when the catalog expires"""
+        get_categories()
+        db.session.execute(text("INSERT INTO service_categories (name, description) VALUES ('Roofing', 'Roofs')"))
+        db.session.commit()
+        self.assertIsNone(get_category_by_name('Roofing'))
+
+        app.config['CATALOG_CACHE_TTL'] = 0
+        try:
+            self.assertEqual(get_category_by_name('Roofing').description, 'Roofs')
+        finally:
+            del app.config['CATALOG_CACHE_TTL']
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,12 +2,14 @@ import unittest
 import os
 import sys
 import sqlite3
+import tempfile
 from datetime import datetime, timedelta
 
 # Add the parent directory to the path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from app import app, db, init_db
+from app import db, init_db, create_app
+from wsgi import app
 from models import Customer, Provider, ServiceCategory, ProviderCategory, Address, Booking, Payment, OTPVerification
 
 class TestDatabaseOperations(unittest.TestCase):
@@ -339,5 +341,151 @@ class TestDatabaseOperations(unittest.TestCase):
         addresses = Address.query.all()
         self.assertEqual(len(addresses), 0)
 
+    def _query_plan(self, query):
+        """Get the SQLite query plan of an ORM query as one string"""
+        sql = str(query.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+        plan = db.session.execute(db.text(f"EXPLAIN QUERY PLAN {sql}")).fetchall()
+        return ' '.join(row[-1] for row in plan)
+
+    def test_booking_query_plans(self):
+        """Test that the booking hot paths are served by their indexes"""
+        tomorrow = datetime.utcnow().date() + timedelta(days=1)
+        
+        # Conflict check uses the partial index on active bookings
+        plan = self._query_plan(Booking.query.filter_by(
+            provider_id=1, booking_date=tomorrow, time_slot='09:00-10:00'
+        ).filter(Booking.is_active()))
+        self.assertIn('uq_booking_active_slot', plan)
+        
+        # So does the availability engine's date range load
+        plan = self._query_plan(db.session.query(Booking.id, Booking.provider_id, Booking.time_slot).filter(
+            Booking.booking_date >= tomorrow,
+            Booking.booking_date <= tomorrow + timedelta(days=13),
+            Booking.is_active()
+        ))
+        self.assertIn('uq_booking_active_slot', plan)
+        
+        # Dashboards read in index order, without a separate sort
+        plan = self._query_plan(Booking.query.filter_by(customer_id=1).order_by(Booking.created_at.desc(), Booking.id.desc()))
+        self.assertIn('ix_booking_customer_created', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+        
+        plan = self._query_plan(Booking.query.filter_by(provider_id=1).order_by(Booking.created_at.desc(), Booking.id.desc()))
+        self.assertIn('ix_booking_provider_created', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+        
+        # Rating aggregates never touch the table rows
+        plan = self._query_plan(db.session.query(db.func.sum(Booking.rating)).filter(
+            Booking.provider_id == 1, Booking.status == 'completed', Booking.rating.isnot(None)
+        ))
+        self.assertIn('COVERING INDEX ix_booking_provider_rating', plan)
+
+    def test_upgrade_schema_adds_missing_indexes(self):
+        """Test that indexes missing from an existing database are created"""
+        from migrations import upgrade_schema
+        
+        db.session.execute(db.text("DROP INDEX uq_booking_active_slot"))
+        db.session.execute(db.text("DROP INDEX ix_booking_customer_created"))
+        db.session.commit()
+        
+        added = upgrade_schema()
+        self.assertEqual(sorted(added), ['ix_booking_customer_created', 'uq_booking_active_slot'])
+        
+        indexes = {index['name'] for index in db.inspect(db.engine).get_indexes('bookings')}
+        self.assertIn('uq_booking_active_slot', indexes)
+        self.assertEqual(upgrade_schema(), [])
+
+    def test_upgrade_schema_adds_active_slot_index(self):
+        """Test that the unique active slot index waits for conflicting bookings to be fixed"""
+        from migrations import upgrade_schema
+        
+        tomorrow = (datetime.utcnow().date() + timedelta(days=1)).isoformat()
+        db.session.execute(db.text("DROP INDEX uq_booking_active_slot"))
+        insert = db.text(
+            "INSERT INTO bookings (customer_id, provider_id, category_id, address_id, booking_date, time_slot, status) "
+            "VALUES (1, 1, 1, 1, :date, :slot, :status)"
+        )
+        db.session.execute(insert, {'date': tomorrow, 'slot': '10:00', 'status': 'pending'})
+        db.session.execute(insert, {'date': tomorrow, 'slot': '10:00-11:00', 'status': 'pending'})
+        db.session.commit()
+        
+        # Two active bookings in one slot: the unique index is skipped
+        self.assertEqual(upgrade_schema(), [])
+        indexes = {index['name'] for index in db.inspect(db.engine).get_indexes('bookings')}
+        self.assertNotIn('uq_booking_active_slot', indexes)
+        
+        # Once the duplicate is resolved the index is created
+        db.session.execute(db.text("UPDATE bookings SET status = 'cancelled' WHERE time_slot = '10:00'"))
+        db.session.commit()
+        self.assertEqual(upgrade_schema(), ['uq_booking_active_slot'])
+        
+        slots = {row[0] for row in db.session.execute(db.text("SELECT time_slot FROM bookings"))}
+        self.assertEqual(slots, {'10:00-11:00'})
+
+    def test_upgrade_schema_backfills_rating_aggregates(self):
+        """Test that new rating aggregate columns start from the existing ratings"""
+        from migrations import upgrade_schema
+        from services import record_provider_rating, reconcile_provider_ratings
+        
+        # A database from before the running aggregates
+        db.session.execute(db.text("DROP INDEX ix_provider_top_rated"))
+        db.session.execute(db.text("ALTER TABLE providers DROP COLUMN rating_sum"))
+        db.session.execute(db.text("ALTER TABLE providers DROP COLUMN rating_count"))
+        insert_provider = db.text(
+            "INSERT INTO providers (id, email, phone, password_hash, first_name, last_name, "
+            "verification_document, avg_rating) VALUES (:id, :email, :phone, 'hash', 'Test', 'Provider', "
+            "'doc.pdf', :avg_rating)"
+        )
+        db.session.execute(insert_provider, {'id': 1, 'email': 'rated@example.com', 'phone': '+353871', 'avg_rating': 5.0})
+        db.session.execute(insert_provider, {'id': 2, 'email': 'seeded@example.com', 'phone': '+353872', 'avg_rating': 4.2})
+        insert_booking = db.text(
+            "INSERT INTO bookings (customer_id, provider_id, category_id, address_id, booking_date, time_slot, "
+            "status, rating) VALUES (1, 1, 1, 1, :date, :slot, :status, :rating)"
+        )
+        for slot, status, rating in [('09:00-10:00', 'completed', 5), ('10:00-11:00', 'completed', 5),
+                                     ('11:00-12:00', 'completed', 5), ('13:00-14:00', 'cancelled', 1)]:
+            db.session.execute(insert_booking, {'date': '2024-01-01', 'slot': slot, 'status': status, 'rating': rating})
+        db.session.commit()
+        
+        added = upgrade_schema()
+        self.assertIn('providers.rating_sum', added)
+        self.assertIn('ix_provider_top_rated', added)
+        
+        rows = db.session.execute(db.text(
+            "SELECT id, rating_sum, rating_count, avg_rating FROM providers ORDER BY id"
+        )).fetchall()
+        self.assertEqual([tuple(row) for row in rows], [(1, 15, 3, 5.0), (2, 0, 0, 4.2)])
+        self.assertEqual(reconcile_provider_ratings(repair=False), [])
+        
+        # The next rating adds to the history
+        record_provider_rating(1, 1)
+        db.session.commit()
+        self.assertEqual(Provider.query.get(1).avg_rating, 4.0)
+
+    def test_create_app_does_no_database_work(self):
+        """Test that creating an app leaves the database alone until init-db runs"""
+        db_path = os.path.join(tempfile.mkdtemp(), 'hire.db')
+        new_app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}'})
+        self.assertFalse(os.path.exists(db_path))
+        
+        runner = new_app.test_cli_runner()
+        with new_app.app_context():
+            result = runner.invoke(args=['init-db'])
+            self.assertEqual(result.exit_code, 0, result.output)
+            self.assertIn('Added 7 service categories', result.output)
+            
+            # Both commands are safe to run again
+            result = runner.invoke(args=['init-db'])
+            self.assertIn('Database schema is up to date', result.output)
+            result = runner.invoke(args=['seed-db'])
+            self.assertIn('Service categories already exist', result.output)
+            db.session.remove()
+        
+        conn = sqlite3.connect(db_path)
+        try:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM service_categories").fetchone()[0], 7)
+        finally:
+            conn.close()
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,69 @@
+import unittest
+import os
+import sys
+import time
+
+# Add the parent directory to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from generation_cache import GenerationCache
+
+class TestGenerationCache(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        self.cache = GenerationCache()
+        self.builds = 0
+
+    def build(self, value='value'):
+        self.builds += 1
+        return value
+
+    def test_built_once_until_invalidated(self):
+        """Test that a value is built once and rebuilt after invalidation"""
+        self.assertEqual(self.cache.get('key', self.build), 'value')
+        self.assertEqual(self.cache.get('key', self.build), 'value')
+        self.assertEqual(self.builds, 1)
+
+        self.cache.invalidate()
+        self.cache.get('key', self.build)
+        self.assertEqual(self.builds, 2)
+
+    def test_value_invalidated_while_built_is_not_stored(self):
+        """Test that a build overtaken by an invalidation is returned but not cached"""
+        def build():
+            self.cache.invalidate()
+            return self.build('stale')
+
+        self.assertEqual(self.cache.get('key', build), 'stale')
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self.cache.get('key', self.build), 'value')
+
+    def test_ttl(self):
+        """Test that values expire after their TTL"""
+        self.cache.get('key', self.build, ttl=0.05)
+        self.cache.get('key', self.build, ttl=0.05)
+        self.assertEqual(self.builds, 1)
+        time.sleep(0.06)
+        self.cache.get('key', self.build, ttl=0.05)
+        self.assertEqual(self.builds, 2)
+
+        self.cache.get('always', self.build, ttl=0)
+        self.cache.get('always', self.build, ttl=0)
+        self.assertEqual(self.builds, 4)
+
+    def test_max_size(self):
+        """Test that the least recently used values are dropped first"""
+        for key in ('a', 'b', 'c'):
+            self.cache.get(key, self.build, max_size=2)
+        self.cache.get('b', self.build, max_size=2)
+        self.assertEqual(self.builds, 3)
+        self.cache.get('d', self.build, max_size=2)
+        self.cache.get('b', self.build, max_size=2)
+        self.assertEqual(self.builds, 4)
+
+        self.cache.get('e', self.build, max_size=0)
+        self.cache.get('e', self.build, max_size=0)
+        self.assertEqual(self.builds, 6)
+
+if __name__ == '__main__':
+    unittest.main()
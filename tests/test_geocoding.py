@@ -0,0 +1,286 @@
+import unittest
+import os
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+# Add the parent directory to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from werkzeug.security import generate_password_hash
+
+from app import db
+from wsgi import app
+from models import Customer, Address, GeocodeCache
+from geocoding import (
+    POSTAL_DISTRICTS, GeocodeError, NominatimGeocoder, Point, PostalCodeGeocoder,
+    GeocodeWorker, RateLimiter, cache_key, fill_pending_addresses, lookup_postal_code
+)
+from geocode_backfill import _insert_cache_entries, backfill_addresses, load_checkpoint
+
+class StubGeocoder:
+    """Geocoder answering from a dict and counting its calls"""
+
+    def __init__(self, answers=None, error=None, failing=()):
+        self.answers = answers or {}
+        self.error = error
+        self.failing = set(failing)
+        self.queries = []
+
+    def geocode(self, query):
+        if self.error:
+            raise self.error
+        if query in self.failing:
+            raise GeocodeError(f"Failed: {query}")
+        self.queries.append(query)
+        return self.answers.get(query)
+
+class SlowHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(1)
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(b'[]')
+
+    def log_message(self, *args):
+        pass
+
+class TestGeocoding(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.client = app.test_client()
+
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        customer = Customer(
+            email="customer@example.com", phone="+353871234567", first_name="Test",
+            last_name="Customer", password_hash=generate_password_hash("password"), is_verified=True
+        )
+        db.session.add(customer)
+        db.session.commit()
+        self.customer_id = customer.id
+
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = self.customer_id
+            sess['user_type'] = 'customer'
+
+    def tearDown(self):
+        """Clean up after tests"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _add_address(self, address_line, postal_code):
+        response = self.client.post('/customer/address/add', data={
+            'address_line': address_line,
+            'city': 'Dublin',
+            'state': 'Dublin',
+            'postal_code': postal_code
+        })
+        self.assertEqual(response.status_code, 302)
+        return Address.query.filter_by(address_line=address_line).order_by(Address.id.desc()).first()
+
+    def test_lookup_postal_code(self):
+        """Test resolving Eircodes and Dublin postal districts offline"""
+        self.assertEqual(lookup_postal_code('D02 X285'), POSTAL_DISTRICTS['D02'])
+        self.assertEqual(lookup_postal_code('d02'), POSTAL_DISTRICTS['D02'])
+        self.assertEqual(lookup_postal_code('Dublin 8'), POSTAL_DISTRICTS['D08'])
+        self.assertEqual(lookup_postal_code('Dublin 6W'), POSTAL_DISTRICTS['D6W'])
+        self.assertEqual(lookup_postal_code('K67 AB12'), POSTAL_DISTRICTS['K67'])
+        self.assertIsNone(lookup_postal_code('T12 AB34'))
+        self.assertIsNotNone(lookup_postal_code('T12 AB34', city=' dublin '))
+        self.assertEqual(
+            cache_key('1 Main St.', 'DUBLIN', 'd02 x285'),
+            cache_key('1  main st', 'Dublin', 'D02X285')
+        )
+
+    def test_address_saved_without_geocoding(self):
+        """Test that addresses get approximate coordinates, then exact ones in the background"""
+        address = self._add_address('1 Main St', 'D02 X285')
+        self.assertEqual(address.geocode_status, 'pending')
+        self.assertEqual((address.latitude, address.longitude), POSTAL_DISTRICTS['D02'])
+
+        geocoder = StubGeocoder({address.get_full_address(): Point(53.34, -6.25)})
+        self.assertEqual(fill_pending_addresses(geocoder), 1)
+        self.assertEqual(fill_pending_addresses(geocoder), 0)
+
+        address = Address.query.get(address.id)
+        self.assertEqual((address.geocode_status, address.latitude), ('exact', 53.34))
+        self.assertEqual(GeocodeCache.query.count(), 1)
+
+        # The same address again is resolved from the cache
+        address = self._add_address('1 main st.', 'd02x285')
+        self.assertEqual((address.geocode_status, address.latitude), ('exact', 53.34))
+        self.assertEqual(len(geocoder.queries), 1)
+
+    def test_geocoder_failures(self):
+        """Test that failures are retried later and misses are cached"""
+        address = self._add_address('2 Unknown Rd', 'Dublin 8')
+
+        with self.assertRaises(GeocodeError):
+            fill_pending_addresses(StubGeocoder(error=GeocodeError("timed out")))
+        self.assertEqual(Address.query.get(address.id).geocode_status, 'pending')
+
+        geocoder = StubGeocoder()
+        self.assertEqual(fill_pending_addresses(geocoder), 1)
+        address = Address.query.get(address.id)
+        self.assertEqual(address.geocode_status, 'approximate')
+        self.assertEqual((address.latitude, address.longitude), POSTAL_DISTRICTS['D08'])
+
+        # A known miss isn't looked up again
+        self.assertEqual(self._add_address('2 Unknown Rd', 'Dublin 8').geocode_status, 'approximate')
+        self.assertEqual(fill_pending_addresses(geocoder), 0)
+        self.assertEqual(len(geocoder.queries), 1)
+
+    def test_nominatim_timeout(self):
+        """Test that a slow geocoding service fails fast"""
+        server = HTTPServer(('127.0.0.1', 0), SlowHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            geocoder = NominatimGeocoder(
+                timeout=0.2, min_interval=0, url=f"http://127.0.0.1:{server.server_port}/search"
+            )
+            start = time.perf_counter()
+            with self.assertRaises(GeocodeError):
+                geocoder.geocode('1 Main St, Dublin')
+            self.assertLess(time.perf_counter() - start, 0.9)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def _add_legacy_addresses(self, rows):
+        """Insert addresses saved before geocoding, without coordinates"""
+        addresses = [
+            Address(customer_id=self.customer_id, address_line=line, city='Dublin',
+                    state='Dublin', postal_code=postal_code)
+            for line, postal_code in rows
+        ]
+        db.session.add_all(addresses)
+        db.session.commit()
+        return [address.id for address in addresses]
+
+    def test_backfill(self):
+        """Test that the backfill deduplicates, uses the cache and writes back every address"""
+        ids = self._add_legacy_addresses([
+            ('1 Main St', 'D02 X285'), ('1 MAIN ST.', 'd02x285'), ('2 Side Rd', 'Dublin 8'),
+            ('1 Main St', 'D02 X285'), ('3 Cached Ave', 'D04'), ('4 Nowhere Ln', 'T12 AB34')
+        ])
+        db.session.add(GeocodeCache(query_key=cache_key('3 Cached Ave', 'Dublin', 'D04'), latitude=53.33, longitude=-6.23))
+        db.session.commit()
+
+        geocoder = StubGeocoder({
+            '1 Main St, Dublin, Dublin D02 X285': Point(53.34, -6.25),
+            '2 Side Rd, Dublin, Dublin Dublin 8': Point(53.341, -6.29)
+        })
+        checkpoint = os.path.join(tempfile.mkdtemp(), 'backfill.json')
+        stats = backfill_addresses(geocoder, chunk_size=4, workers=3, rate=0, checkpoint=checkpoint)
+
+        self.assertEqual(stats.scanned, 6)
+        self.assertEqual((stats.unique, stats.cached, stats.requested), (4, 1, 3))
+        self.assertEqual((stats.exact, stats.approximate), (5, 1))
+        self.assertEqual(load_checkpoint(checkpoint).last_id, ids[-1])
+
+        # Duplicates were looked up once, the cached address not at all
+        self.assertEqual(sorted(geocoder.queries), [
+            '1 Main St, Dublin, Dublin D02 X285', '2 Side Rd, Dublin, Dublin Dublin 8',
+            '4 Nowhere Ln, Dublin, Dublin T12 AB34'
+        ])
+
+        addresses = {a.id: a for a in Address.query.all()}
+        self.assertEqual([addresses[i].latitude for i in ids[:5]], [53.34, 53.34, 53.341, 53.34, 53.33])
+        self.assertEqual(addresses[ids[5]].geocode_status, 'approximate')
+        self.assertEqual(addresses[ids[5]].latitude, lookup_postal_code('T12 AB34', 'Dublin').latitude)
+
+        # Nothing is left to do
+        self.assertEqual(backfill_addresses(geocoder, checkpoint=None, rate=0).scanned, 0)
+
+    def test_backfill_skips_keys_cached_concurrently(self):
+        """Test that answers cached by the background geocoder meanwhile don't fail the chunk"""
+        key = cache_key('1 Main St', 'Dublin', 'D02')
+        db.session.add(GeocodeCache(query_key=key, latitude=53.34, longitude=-6.25))
+        db.session.commit()
+
+        entry = {'query_key': key, 'latitude': 53.0, 'longitude': -6.0}
+        other = {'query_key': cache_key('2 Main St', 'Dublin', 'D02'), 'latitude': 53.1, 'longitude': -6.1}
+        self.assertEqual(_insert_cache_entries([entry, other]), 1)
+
+        # A key cached between the check and the insert is dropped, not raised
+        third = {'query_key': cache_key('3 Main St', 'Dublin', 'D02'), 'latitude': 53.2, 'longitude': -6.2}
+        with self.assertLogs('geocode_backfill', 'WARNING'):
+            self.assertEqual(_insert_cache_entries([third, dict(third)]), 0)
+        db.session.commit()
+
+        self.assertEqual(GeocodeCache.query.filter_by(query_key=key).one().latitude, 53.34)
+        self.assertEqual(GeocodeCache.query.count(), 2)
+
+    def test_backfill_resumes_after_failure(self):
+        """Test that a failed run resumes from its checkpoint"""
+        ids = self._add_legacy_addresses([(f'{i} Main St', 'D02') for i in range(1, 6)])
+        checkpoint = os.path.join(tempfile.mkdtemp(), 'backfill.json')
+
+        geocoder = StubGeocoder(failing={'4 Main St, Dublin, Dublin D02'})
+        with self.assertRaises(GeocodeError):
+            backfill_addresses(geocoder, chunk_size=2, rate=0, checkpoint=checkpoint)
+        self.assertEqual(load_checkpoint(checkpoint).last_id, ids[1])
+        self.assertEqual(Address.query.get(ids[3]).latitude, None)
+        self.assertEqual(Address.query.get(ids[2]).geocode_status, 'approximate')
+
+        geocoder.failing.clear()
+        stats = backfill_addresses(geocoder, chunk_size=2, rate=0, checkpoint=checkpoint)
+        self.assertEqual(stats.last_id, ids[-1])
+        self.assertEqual(len(geocoder.queries), 5)
+        self.assertEqual(Address.query.filter(Address.latitude.is_(None)).count(), 0)
+
+    def test_backfill_with_postal_codes(self):
+        """Test the offline geocoder gives approximate coordinates without caching them"""
+        ids = self._add_legacy_addresses([('1 Main St', 'D02 X285'), ('2 Side Rd', 'Dublin 6W')])
+
+        stats = backfill_addresses(PostalCodeGeocoder(), rate=0)
+        self.assertEqual((stats.exact, stats.approximate), (0, 2))
+        self.assertEqual(Address.query.get(ids[1]).latitude, POSTAL_DISTRICTS['D6W'].latitude)
+        self.assertEqual(GeocodeCache.query.count(), 0)
+
+    def test_background_worker_is_opt_in(self):
+        """Test that a process geocodes in the background only when configured to"""
+        config = {'GEOCODER': 'nominatim'}
+        worker = GeocodeWorker(SimpleNamespace(config=config))
+        self.assertFalse(worker.enabled)
+
+        config['GEOCODE_IN_BACKGROUND'] = True
+        self.assertTrue(worker.enabled)
+
+        config['GEOCODER'] = 'offline'
+        self.assertFalse(worker.enabled)
+
+    def test_worker_command_once(self):
+        """Test that `flask geocode-worker --once` geocodes pending addresses and exits"""
+        geocoder = app.config['GEOCODER']
+        app.config['GEOCODER'] = 'offline'
+        try:
+            result = app.test_cli_runner().invoke(args=['geocode-worker', '--once'])
+        finally:
+            app.config['GEOCODER'] = geocoder
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('Geocoded 0 pending addresses', result.output)
+
+    def test_rate_limiter(self):
+        """Test that calls are spaced across threads"""
+        limiter = RateLimiter(20)
+        start = time.perf_counter()
+        threads = [threading.Thread(target=limiter.wait) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertGreaterEqual(time.perf_counter() - start, 0.19)
+
+if __name__ == '__main__':
+    unittest.main()
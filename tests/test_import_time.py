@@ -0,0 +1,87 @@
+"""Import-time benchmark of the application module.
+
+Each measurement imports `wsgi` (the application module, which builds
+the app) in a fresh interpreter with
+`python -X importtime` and reads the cumulative time of the import. The
+tests fail when the fastest of a few runs goes over the budget
+(IMPORT_TIME_BUDGET_MS, default 1500 ms) or when one of the optional
+dependencies that only some features need is imported at startup.
+
+Run this file directly to print the slowest modules:
+
+    python tests/test_import_time.py [--runs N] [--top N]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+DEFAULT_BUDGET_MS = 1500
+RUNS = 3
+
+# Loaded by the features that use them, never by importing the app
+DEFERRED_MODULES = ('requests', 'twilio', 'numpy')
+
+def measure_import(module='wsgi'):
+    """
+    Import a module in a fresh interpreter with -X importtime
+
+    Returns:
+        List of (module name, self ms, cumulative ms), in import order
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+
+    timings = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        timings.append((name.strip(), int(self_us) / 1000, int(cumulative_us) / 1000))
+    return timings
+
+def total_ms(timings, module='wsgi'):
+    """Get the cumulative import time of a module from its timings"""
+    return next(cumulative for name, _, cumulative in timings if name == module)
+
+class TestImportTime(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.runs = [measure_import() for _ in range(RUNS)]
+
+    def test_import_within_budget(self):
+        """Test that importing the app stays within the time budget"""
+        budget = float(os.getenv('IMPORT_TIME_BUDGET_MS', DEFAULT_BUDGET_MS))
+        fastest = min(total_ms(timings) for timings in self.runs)
+        self.assertLess(fastest, budget, f"Importing wsgi took {fastest:.0f} ms (budget {budget:.0f} ms)")
+
+    def test_optional_dependencies_deferred(self):
+        """Test that importing the app doesn't load requests, twilio or numpy"""
+        imported = {name.split('.')[0] for name, _, _ in self.runs[0]}
+        for module in DEFERRED_MODULES:
+            self.assertNotIn(module, imported)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters to measure')
+    parser.add_argument('--top', type=int, default=15, help='Slowest modules to list')
+    args = parser.parse_args()
+
+    runs = [measure_import() for _ in range(args.runs)]
+    totals = sorted(total_ms(timings) for timings in runs)
+    print(f"import wsgi: fastest {totals[0]:.0f} ms, median {totals[len(totals) // 2]:.0f} ms "
+          f"over {args.runs} runs (budget {DEFAULT_BUDGET_MS} ms)")
+
+    fastest = min(runs, key=total_ms)
+    print("\nSlowest modules (self time) in the fastest run:")
+    for name, self_ms, cumulative_ms in sorted(fastest, key=lambda t: t[1], reverse=True)[:args.top]:
+        print(f"  {name:<45} {self_ms:8.1f} ms   cumulative {cumulative_ms:8.1f} ms")
+
+if __name__ == '__main__':
+    main()
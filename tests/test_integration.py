@@ -7,7 +7,8 @@ from datetime import datetime, timedelta
 # Add the parent directory to the path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from app import app, db
+from app import db
+from wsgi import app
 from models import Customer, Provider, ServiceCategory, ProviderCategory, Address, Booking, Payment
 from services import find_matching_providers, update_provider_rating
 from werkzeug.security import generate_password_hash
@@ -0,0 +1,101 @@
+import unittest
+import os
+import sys
+
+# Add the parent directory to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import db
+from wsgi import app
+from models import Provider, ServiceCategory, ProviderCategory
+from leaderboard import get_top_providers
+from services import find_top_rated_providers, record_provider_rating
+from tests.queries import count_queries
+
+class TestLeaderboard(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.client = app.test_client()
+
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        plumbing = ServiceCategory(name="Plumbing", description="Plumbing services")
+        electrical = ServiceCategory(name="Electrical", description="Electrical services")
+        db.session.add_all([plumbing, electrical])
+
+        self.providers = []
+        for i, (rating, verified) in enumerate([(4.5, True), (4.9, False), (3.8, True), (None, True)]):
+            provider = Provider(
+                email=f"provider{i}@example.com", phone=f"+35387000000{i}",
+                password_hash="hash", first_name=f"Provider{i}", last_name="Test",
+                verification_document="doc.pdf", experience_years=i,
+                avg_rating=rating, is_verified=verified
+            )
+            self.providers.append(provider)
+        db.session.add_all(self.providers)
+        db.session.flush()
+
+        db.session.add_all([
+            ProviderCategory(provider_id=self.providers[0].id, category_id=plumbing.id, price_rate=50),
+            ProviderCategory(provider_id=self.providers[1].id, category_id=plumbing.id, price_rate=50),
+            ProviderCategory(provider_id=self.providers[2].id, category_id=electrical.id, price_rate=40),
+        ])
+        db.session.commit()
+        self.plumbing_id = plumbing.id
+        self.electrical_id = electrical.id
+
+    def tearDown(self):
+        """Clean up after tests"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _names(self, leaders):
+        return [leader.first_name for leader in leaders]
+
+    def test_rankings(self):
+        """Test the overall and per-category rankings"""
+        # Only verified, rated providers are ranked
+        self.assertEqual(self._names(get_top_providers()), ['Provider0', 'Provider2'])
+        self.assertEqual(self._names(get_top_providers(1)), ['Provider0'])
+        self.assertEqual(self._names(get_top_providers(category_id=self.plumbing_id)), ['Provider0'])
+        self.assertEqual(self._names(get_top_providers(category_id=self.electrical_id)), ['Provider2'])
+        self.assertEqual(get_top_providers(category_id=999), ())
+        self.assertEqual(self._names(find_top_rated_providers(5)), ['Provider0', 'Provider2'])
+
+    def test_home_page_reads_from_memory(self):
+        """Test that the home page doesn't rank providers once the leaderboard is built"""
+        response = self.client.get('/')
+        self.assertIn(b'Provider0 Test', response.data)
+        self.assertNotIn(b'Provider1 Test', response.data)
+
+        self.assertEqual(count_queries(lambda: get_top_providers()), 0)
+        self.assertEqual(count_queries(lambda: self.client.get('/')), 0)
+
+    def test_updates_maintain_leaderboard(self):
+        """Test that committed changes are reflected in the rankings"""
+        get_top_providers()
+
+        # A run of new ratings lifts a provider to the top
+        for _ in range(3):
+            record_provider_rating(self.providers[2].id, 5)
+        db.session.commit()
+        self.assertEqual(self._names(get_top_providers()), ['Provider2', 'Provider0'])
+
+        # Verifying a provider puts them on the board
+        self.providers[1].is_verified = True
+        db.session.commit()
+        self.assertEqual(self._names(get_top_providers(category_id=self.plumbing_id)), ['Provider1', 'Provider0'])
+
+        # Changes that can't reorder the board keep it cached
+        get_top_providers()
+        self.providers[0].phone = "+353879999999"
+        db.session.commit()
+        self.assertEqual(count_queries(lambda: get_top_providers()), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import unittest
+import os
+import sys
+import logging
+import tempfile
+import threading
+import time
+
+# Add the parent directory to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from wsgi import app
+import log_setup
+from log_setup import LogPipeline, parse_levels
+
+class BlockingHandler(logging.Handler):
+    """Handler that holds the writer thread until released"""
+
+    def __init__(self):
+        super().__init__()
+        self.unblocked = threading.Event()
+        self.messages = []
+
+    def emit(self, record):
+        self.unblocked.wait(5)
+        self.messages.append(record.getMessage())
+
+class TestLogSetup(unittest.TestCase):
+    def tearDown(self):
+        """Put the application's pipeline back"""
+        log_setup.configure_logging(app.config)
+
+    def test_parse_levels(self):
+        """Test parsing per-module levels"""
+        self.assertEqual(parse_levels(''), {})
+        self.assertEqual(parse_levels(None), {})
+        self.assertEqual(parse_levels('services=warning, sqlalchemy.engine=INFO,'),
+                         {'services': logging.WARNING, 'sqlalchemy.engine': logging.INFO})
+        for spec in ('services', 'services=LOUD', '=INFO'):
+            with self.assertRaises(ValueError):
+                parse_levels(spec)
+
+    def test_logging_never_waits_for_the_writer(self):
+        """Test that a stuck writer neither blocks log calls nor grows the queue"""
+        handler = BlockingHandler()
+        pipeline = LogPipeline([handler], queue_size=5)
+        pipeline.start()
+
+        logger = logging.getLogger('tests.log_setup.blocking')
+        logger.propagate = False
+        logger.addHandler(pipeline.handler)
+        try:
+            start = time.perf_counter()
+            for i in range(50):
+                logger.warning('record %d', i)
+            self.assertLess(time.perf_counter() - start, 1)
+
+            stats = pipeline.stats()
+            self.assertLessEqual(stats['queued'], 5)
+            self.assertGreaterEqual(stats['dropped'], 44)
+
+            handler.unblocked.set()
+            pipeline.stop()
+            self.assertEqual(handler.messages[0], 'record 0')
+            self.assertEqual(len(handler.messages) + pipeline.stats()['dropped'], 50)
+        finally:
+            handler.unblocked.set()
+            logger.removeHandler(pipeline.handler)
+            logger.propagate = True
+
+    def test_configure_logging(self):
+        """Test that module loggers reach the file at their configured levels"""
+        with tempfile.TemporaryDirectory() as directory:
+            log_file = os.path.join(directory, 'logs', 'test.log')
+            pipeline = log_setup.configure_logging({
+                'LOG_FILE': log_file,
+                'LOG_LEVEL': 'INFO',
+                'LOG_LEVELS': 'tests.log_setup.quiet=WARNING'
+            })
+            self.assertIs(log_setup.get_pipeline(), pipeline)
+            self.assertIn(pipeline.handler, logging.getLogger().handlers)
+
+            logging.getLogger('tests.log_setup.loud').info('loud info')
+            logging.getLogger('tests.log_setup.quiet').info('quiet info')
+            logging.getLogger('tests.log_setup.quiet').warning('quiet warning')
+            try:
+                raise RuntimeError('boom')
+            except RuntimeError:
+                logging.getLogger('tests.log_setup.loud').exception('failed')
+            pipeline.stop()
+
+            with open(log_file) as f:
+                contents = f.read()
+            self.assertIn('INFO: loud info', contents)
+            self.assertNotIn('quiet info', contents)
+            self.assertIn('WARNING: quiet warning', contents)
+            self.assertIn('RuntimeError: boom', contents)
+
+            # Replacing the pipeline leaves one queue handler on the root logger
+            log_setup.configure_logging(app.config)
+            self.assertNotIn(pipeline.handler, logging.getLogger().handlers)
+
+        logging.getLogger('tests.log_setup.quiet').setLevel(logging.NOTSET)
+
+        with self.assertRaises(ValueError):
+            log_setup.configure_logging({'LOG_LEVEL': 'LOUD'})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,7 +6,8 @@ from datetime import datetime, timedelta
 # Add the parent directory to the path .......
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from app import app, db
+from app import db
+from wsgi import app
 from models import Customer, Provider, ServiceCategory, ProviderCategory, Address, Booking, Payment, OTPVerification
 
 class TestModels(unittest.TestCase):
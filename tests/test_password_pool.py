@@ -0,0 +1,110 @@
+import unittest
+import os
+import runpy
+import sys
+import threading
+import time
+
+# Add the parent directory to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from werkzeug.security import generate_password_hash
+
+from app import db
+from wsgi import app
+from models import Customer
+from password_pool import PasswordPool, PoolBusy, check_password, get_pool, hash_password
+
+class TestPasswordPool(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['PASSWORD_HASH_ITERATIONS'] = 1000
+        self.pool_config = (app.config['PASSWORD_POOL_WORKERS'], app.config['PASSWORD_POOL_QUEUE'])
+        self.client = app.test_client()
+
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        """Clean up after tests"""
+        app.config.pop('PASSWORD_HASH_ITERATIONS')
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_hash_and_check(self):
+        """Test hashing and checking passwords in worker processes"""
+        password_hash = hash_password('secret')
+        self.assertTrue(password_hash.startswith('pbkdf2:sha256:1000$'))
+        self.assertTrue(check_password(password_hash, 'secret'))
+        self.assertFalse(check_password(password_hash, 'wrong'))
+
+        # Hashes made with another cost still verify
+        self.assertTrue(check_password(generate_password_hash('secret', 'pbkdf2:sha256:2000'), 'secret'))
+
+        metrics = get_pool().metrics.snapshot()
+        self.assertGreaterEqual(metrics['completed'], 4)
+        self.assertEqual(metrics['in_flight'], 0)
+
+    def test_spawned_workers_build_no_app(self):
+        """Test that a worker re-importing app.py as its main module builds no application"""
+        path = os.path.join(os.path.dirname(__file__), '..', 'app.py')
+        self.assertNotIn('app', runpy.run_path(path, run_name='__mp_main__'))
+
+    def test_saturated_pool_rejects_fast(self):
+        """Test that calls beyond the queue bound fail at once"""
+        pool = PasswordPool(workers=1, max_queue=1)
+        try:
+            threads = [threading.Thread(target=pool.call, args=(time.sleep, 0.5)) for _ in range(2)]
+            for thread in threads:
+                thread.start()
+            while pool.metrics.snapshot()['in_flight'] < 2:
+                time.sleep(0.01)
+
+            self.assertEqual(pool.metrics.snapshot()['queued'], 1)
+            start = time.perf_counter()
+            with self.assertRaises(PoolBusy):
+                pool.call(time.sleep, 0.5)
+            self.assertLess(time.perf_counter() - start, 0.1)
+
+            for thread in threads:
+                thread.join()
+            metrics = pool.metrics.snapshot()
+            self.assertEqual((metrics['completed'], metrics['rejected'], metrics['max_in_flight']), (2, 1, 2))
+        finally:
+            pool.close()
+
+    def test_login_returns_503_when_saturated(self):
+        """Test that a login storm gets 503 instead of waiting"""
+        customer = Customer(
+            email="customer@example.com", phone="+353871234567", first_name="Test",
+            last_name="Customer", password_hash=hash_password('secret'), is_verified=True
+        )
+        db.session.add(customer)
+        db.session.commit()
+
+        # A single slot, held by a slow operation
+        app.config['PASSWORD_POOL_WORKERS'] = 0
+        app.config['PASSWORD_POOL_QUEUE'] = 0
+        try:
+            pool = get_pool()
+            thread = threading.Thread(target=pool.call, args=(time.sleep, 0.5))
+            thread.start()
+            while pool.metrics.snapshot()['in_flight'] < 1:
+                time.sleep(0.01)
+
+            response = self.client.post('/customer/login', data={'email': 'customer@example.com', 'password': 'secret'})
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.headers['Retry-After'], '2')
+            thread.join()
+        finally:
+            app.config['PASSWORD_POOL_WORKERS'], app.config['PASSWORD_POOL_QUEUE'] = self.pool_config
+
+        response = self.client.post('/customer/login', data={'email': 'customer@example.com', 'password': 'secret'})
+        self.assertEqual(response.status_code, 302)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+import unittest
+import os
+import sys
+import random
+
+# Add the parent directory to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import db
+from wsgi import app
+from models import Customer, Provider, ServiceCategory, ProviderCategory, Address
+from provider_index import GridIndex, haversine_km
+from services import find_matching_providers
+
+class TestGridIndex(unittest.TestCase):
+    def test_haversine_km(self):
+        """Test the great-circle distance helper"""
+        self.assertEqual(haversine_km(53.35, -6.26, 53.35, -6.26), 0)
+        # One degree of latitude is roughly 111 km
+        self.assertAlmostEqual(haversine_km(53.0, -6.26, 54.0, -6.26), 111.2, delta=0.5)
+
+    def test_candidates_within_radius(self):
+        """Test that a radius query returns nearby points and skips far cells"""
+        index = GridIndex()
+        index.add(1, 53.3498, -6.2603)   # Dublin city centre
+        index.add(2, 53.2900, -6.1300)   # Dun Laoghaire, ~10 km away
+        index.add(3, 53.2707, -9.0568)   # Galway, ~190 km away
+
+        self.assertEqual(sorted(index.candidates(53.3500, -6.2600, 25)), [1, 2])
+        self.assertEqual(index.candidates(51.9, -8.47, 25), [])   # Cork
+        self.assertEqual(GridIndex().candidates(53.35, -6.26, 25), [])
+
+        # None when every point is in range, or more than the limit
+        self.assertIsNone(index.candidates(53.3500, -6.2600, 500))
+        self.assertIsNone(index.candidates(53.3500, -6.2600, 25, limit=1))
+
+    def test_candidates_include_every_point_in_radius(self):
+        """Test that no point within the radius is missed, near poles and the antimeridian too"""
+        rng = random.Random(3)
+        for center in [(53.35, -6.26), (89.5, 10.0), (-20.0, 179.9)]:
+            points = [
+                (i, max(-90.0, min(90.0, center[0] + rng.uniform(-2, 2))),
+                 (center[1] + rng.uniform(-4, 4) + 180) % 360 - 180)
+                for i in range(500)
+            ]
+            index = GridIndex.build(points)
+            for radius in (1, 20, 150):
+                expected = {key for key, lat, lng in points if haversine_km(*center, lat, lng) <= radius}
+                found = index.candidates(*center, radius)
+                if found is not None:
+                    self.assertLessEqual(expected, set(found))
+                    self.assertLess(len(found), len(points))
+
+class TestProviderIndex(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self._create_test_data()
+
+    def tearDown(self):
+        """Clean up after tests"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _create_provider(self, email, phone, rating, lat, lng):
+        provider = Provider(
+            email=email,
+            phone=phone,
+            password_hash="hash",
+            first_name="Test",
+            last_name="Provider",
+            verification_document="doc.pdf",
+            is_available=True,
+            avg_rating=rating,
+            is_verified=True
+        )
+        db.session.add(provider)
+        db.session.commit()
+
+        db.session.add_all([
+            ProviderCategory(provider_id=provider.id, category_id=self.plumbing_id, price_rate=50.0),
+            Address(
+                provider_id=provider.id,
+                address_line="1 Test Street",
+                city="Dublin",
+                state="Dublin",
+                postal_code="D01 AB12",
+                latitude=lat,
+                longitude=lng
+            )
+        ])
+        db.session.commit()
+        return provider.id
+
+    def _create_test_data(self):
+        """Create providers at known distances from a customer"""
+        plumbing = ServiceCategory(name="Plumbing", description="Plumbing services")
+        db.session.add(plumbing)
+        db.session.commit()
+        self.plumbing_id = plumbing.id
+
+        # The far provider has the best rating but is outside the radius
+        self.near_id = self._create_provider("near@example.com", "+353100000001", 3.5, 53.3500, -6.2600)
+        self.mid_id = self._create_provider("mid@example.com", "+353100000002", 4.0, 53.2900, -6.1300)
+        self.far_id = self._create_provider("far@example.com", "+353100000003", 5.0, 53.2707, -9.0568)
+
+        customer = Customer(
+            email="customer@example.com",
+            phone="+353100000004",
+            password_hash="hash",
+            first_name="Test",
+            last_name="Customer",
+            is_verified=True
+        )
+        db.session.add(customer)
+        db.session.commit()
+
+        self.customer_address = Address(
+            customer_id=customer.id,
+            address_line="2 Test Street",
+            city="Dublin",
+            state="Dublin",
+            postal_code="D01 AB12",
+            latitude=53.3498,
+            longitude=-6.2603
+        )
+        db.session.add(self.customer_address)
+        db.session.commit()
+
+    def test_find_matching_providers_by_distance(self):
+        """Test that matching returns the nearest providers within the radius"""
+        providers = find_matching_providers(self.customer_address, self.plumbing_id, radius_km=25)
+        self.assertEqual([p.id for p in providers], [self.near_id, self.mid_id])
+
+        providers = find_matching_providers(self.customer_address, self.plumbing_id, limit=1)
+        self.assertEqual([p.id for p in providers], [self.near_id])
+
+    def test_find_matching_providers_without_coordinates(self):
+        """Test that an address without coordinates falls back to rating order"""
+        self.customer_address.latitude = None
+        self.customer_address.longitude = None
+
+        providers = find_matching_providers(self.customer_address, self.plumbing_id)
+        self.assertEqual([p.id for p in providers], [self.far_id, self.mid_id, self.near_id])
+
+    def test_unavailable_provider_not_matched(self):
+        """Test that a provider who becomes unavailable drops out of matching"""
+        provider = Provider.query.get(self.near_id)
+        provider.is_available = False
+        db.session.commit()
+
+        providers = find_matching_providers(self.customer_address, self.plumbing_id)
+        self.assertEqual([p.id for p in providers], [self.mid_id])
+
+if __name__ == '__main__':
+    unittest.main()
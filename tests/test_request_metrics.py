@@ -0,0 +1,135 @@
+import unittest
+import os
+import sys
+
+# Add the parent directory to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app import create_app, db
+from wsgi import app
+from models import ServiceCategory
+from request_metrics import RequestTiming, get_metrics, percentile
+from tests.queries import recorded_statements
+
+class TestRequestMetrics(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.client = app.test_client()
+
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        plumbing = ServiceCategory(name="Plumbing", description="Plumbing services")
+        db.session.add(plumbing)
+        db.session.commit()
+        self.plumbing_id = plumbing.id
+        self.slow_request_ms = app.config['SLOW_REQUEST_MS']
+        get_metrics().reset()
+
+    def tearDown(self):
+        """Clean up after tests"""
+        app.config['SLOW_REQUEST_MS'] = self.slow_request_ms
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_percentile(self):
+        """Test nearest-rank percentiles"""
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile(values, 100), 100)
+        self.assertEqual(percentile([7], 90), 7)
+        self.assertEqual(percentile([1, 2, 3], 0), 1)
+
+    def test_records_sql_and_template_time(self):
+        """Test that a request's queries and template rendering are measured"""
+        with recorded_statements() as statements:
+            response = self.client.get(f'/services/{self.plumbing_id}')
+        self.assertEqual(response.status_code, 200)
+
+        self.client.get('/services/9999')
+
+        endpoints = get_metrics().snapshot()
+        detail = endpoints['service.service_detail']
+        self.assertEqual((detail['count'], detail['errors'], detail['slow']), (2, 0, 0))
+        self.assertEqual(detail['sql_queries']['max'], len(statements))
+        self.assertGreater(detail['template_ms']['max'], 0)
+        self.assertGreaterEqual(detail['wall_ms']['max'],
+                                detail['sql_ms']['max'] + detail['template_ms']['max'])
+        self.assertEqual(set(detail['wall_ms']), {'p50', 'p90', 'p99', 'max'})
+
+    def test_failed_statements_leave_nothing_on_the_connection(self):
+        """Test that a statement that raises does not leave its start time behind"""
+        connection = db.session.connection()
+        for _ in range(3):
+            with self.assertRaises(OperationalError):
+                connection.execute(text("SELECT * FROM no_such_table"))
+        connection.execute(text("SELECT 1"))
+        self.assertFalse(connection.info.get('query_start_time'))
+
+    def test_streamed_response_measured_to_the_end(self):
+        """Test that a streamed response's queries are counted after its body is sent"""
+        response = self.client.get(f'/search/stream?category_id={self.plumbing_id}')
+        response.get_data()
+        response.close()
+        stream = get_metrics().snapshot()['main.stream_search_results']
+        self.assertEqual(stream['count'], 1)
+        self.assertGreater(stream['sql_queries']['max'], 0)
+
+    def test_slow_requests_logged_with_queries(self):
+        """Test that slow requests are logged with their statements"""
+        app.config['SLOW_REQUEST_MS'] = 0
+        with self.assertLogs('request_metrics', 'WARNING') as logs:
+            self.client.get(f'/services/{self.plumbing_id}')
+        message = logs.output[0]
+        self.assertIn('Slow request GET /services/', message)
+        self.assertIn('FROM service_categories', message)
+        self.assertEqual(get_metrics().snapshot()['service.service_detail']['slow'], 1)
+
+        # Repeats of a statement are collapsed, so N+1 patterns stand out
+        timing = RequestTiming()
+        for _ in range(3):
+            timing.add_query('SELECT * FROM address WHERE provider_id = ?', 0.001)
+        timing.add_query('SELECT * FROM provider', 0.002)
+        self.assertEqual(timing.query_count, 4)
+        self.assertEqual([count for count, _ in timing.statements.values()], [3, 1])
+
+    def test_metrics_endpoint(self):
+        """Test that /metrics is only served when enabled, with its token"""
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+        metrics_app = create_app({
+            'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'METRICS_ENABLED': True, 'METRICS_TOKEN': 'secret'
+        })
+        client = metrics_app.test_client()
+        with metrics_app.app_context():
+            db.create_all()
+            try:
+                client.get('/services/')
+                response = client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+                self.assertEqual(response.status_code, 200)
+                data = response.get_json()
+                self.assertEqual(data['window'], metrics_app.config['METRICS_WINDOW'])
+                self.assertEqual(data['endpoints']['service.service_list']['count'], 1)
+                self.assertIn('completed', data['password_pool'])
+                self.assertIn('dropped', data['logging'])
+
+                # The peer address doesn't matter, only the token
+                self.assertEqual(client.get('/metrics').status_code, 404)
+                response = client.get('/metrics', headers={'Authorization': 'Bearer wrong'},
+                                      environ_base={'REMOTE_ADDR': '127.0.0.1'})
+                self.assertEqual(response.status_code, 404)
+            finally:
+                db.session.remove()
+                db.drop_all()
+
+if __name__ == '__main__':
+    unittest.main()
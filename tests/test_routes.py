@@ -7,7 +7,10 @@ from datetime import datetime, timedelta
 # Add the parent directory to the path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from app import app, db
+from sqlalchemy import text
+
+from app import db
+from wsgi import app
 from models import Customer, Provider, ServiceCategory, ProviderCategory, Address, Booking, Payment, OTPVerification
 from werkzeug.security import generate_password_hash
 
@@ -105,6 +108,150 @@ class TestRoutes(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn(b'Welcome to HIRE', response.data)
         
+    def test_current_user_caching(self):
+        """Test the per-request user cache and the cross-request identity cache"""
+        from flask import session
+        from sqlalchemy import event
+        from routes import get_current_user, get_current_identity
+        
+        statements = []
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        
+        def in_request(func):
+            with app.test_request_context():
+                session['user_id'] = self.customer_id
+                session['user_type'] = 'customer'
+                app.preprocess_request()
+                del statements[:]
+                event.listen(db.engine, 'before_cursor_execute', count)
+                try:
+                    result = func()
+                finally:
+                    event.remove(db.engine, 'before_cursor_execute', count)
+                db.session.remove()
+                return result, len(statements)
+        
+        # The user is loaded once per request
+        (first, second), queries = in_request(lambda: (get_current_user(), get_current_user()))
+        self.assertIs(first, second)
+        self.assertEqual(queries, 1)
+        
+        # Later requests get the name and role without a query
+        identity, queries = in_request(get_current_identity)
+        self.assertEqual(queries, 0)
+        self.assertEqual((identity.user_type, identity.get_full_name()), ('customer', 'Test Customer'))
+        
+        # Renaming the user evicts the cached identity
+        customer = Customer.query.get(self.customer_id)
+        customer.first_name = 'Renamed'
+        db.session.commit()
+        
+        identity, queries = in_request(get_current_identity)
+        self.assertEqual(queries, 1)
+        self.assertEqual(identity.get_full_name(), 'Renamed Customer')
+
+    def test_get_providers_route(self):
+        """Test the provider map feed and its ETag revalidation"""
+        provider_address = Address(
+            provider_id=self.provider_id,
+            address_line="456 Oak Ave",
+            city="Dublin",
+            state="Dublin",
+            postal_code="D02 CD34",
+            latitude=53.350140,
+            longitude=-6.266155
+        )
+        db.session.add(provider_address)
+        db.session.commit()
+
+        response = self.app.get('/get-providers')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(len(data['providers']), 1)
+        self.assertEqual(data['providers'][0]['id'], self.provider_id)
+        self.assertEqual(data['providers'][0]['categories'], [self.plumbing_id])
+        self.assertEqual(data['providers'][0]['lat'], 53.350140)
+
+        # Unchanged feed revalidates to a 304
+        etag = response.headers['ETag']
+        response = self.app.get('/get-providers', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        # A provider change invalidates the cached feed
+        provider = Provider.query.get(self.provider_id)
+        provider.is_available = False
+        db.session.commit()
+
+        response = self.app.get('/get-providers', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertEqual(json.loads(response.data)['providers'], [])
+        etag = response.headers['ETag']
+
+        # Writes the commit hooks don't see (another process) show up once the feed expires
+        db.session.execute(text("UPDATE providers SET is_available = 1"))
+        db.session.commit()
+        response = self.app.get('/get-providers', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        app.config['PROVIDER_MAP_TTL'] = 0
+        try:
+            response = self.app.get('/get-providers', headers={'If-None-Match': etag})
+        finally:
+            del app.config['PROVIDER_MAP_TTL']
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.data)['providers']), 1)
+
+    def test_get_providers_viewport_route(self):
+        """Test the viewport-bounded and clustered provider map feed"""
+        locations = [(53.3498, -6.2603), (53.3502, -6.2610), (53.2707, -9.0568)]
+        for i, (lat, lng) in enumerate(locations):
+            provider = Provider(
+                email=f"map{i}@example.com",
+                phone=f"+35310000000{i}",
+                password_hash="hash",
+                first_name="Map",
+                last_name=f"Provider{i}",
+                verification_document="doc.pdf",
+                is_available=True,
+                is_verified=True
+            )
+            db.session.add(provider)
+            db.session.commit()
+            db.session.add(Address(
+                provider_id=provider.id,
+                address_line=f"{i} Map Street",
+                city="Dublin",
+                state="Dublin",
+                postal_code="D01 AB12",
+                latitude=lat,
+                longitude=lng
+            ))
+        db.session.commit()
+
+        # Zoomed in on Dublin: individual providers only, Galway is outside
+        response = self.app.get('/get-providers?bounds=53.30,-6.35,53.40,-6.20&zoom=15')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(len(data['providers']), 2)
+        self.assertEqual(data['clusters'], [])
+
+        # Whole country at low zoom: the two Dublin providers form one cluster
+        response = self.app.get('/get-providers?bounds=51.0,-11.0,55.5,-5.0&zoom=7')
+        data = json.loads(response.data)
+        self.assertEqual(len(data['clusters']), 1)
+        self.assertEqual(data['clusters'][0]['count'], 2)
+        self.assertAlmostEqual(data['clusters'][0]['lat'], 53.35, places=3)
+        self.assertEqual(len(data['providers']), 1)
+        self.assertEqual(data['providers'][0]['lat'], 53.2707)
+
+        response = self.app.get('/get-providers?bounds=53.30,-6.35')
+        self.assertEqual(response.status_code, 400)
+        for zoom in ('-2000', '23', 'x'):
+            response = self.app.get(f'/get-providers?bounds=51.0,-11.0,55.5,-5.0&zoom={zoom}')
+            self.assertEqual(response.status_code, 400)
+
     def test_customer_login_route(self):
         """Test the customer login route"""
         # Test GET request
@@ -176,6 +323,7 @@ class TestRoutes(unittest.TestCase):
         response = self.app.get(f'/services/{self.plumbing_id}')
         self.assertEqual(response.status_code, 200)
         self.assertIn(b'Plumbing', response.data)
+        self.assertIn(b'Next available', response.data)
         
         # Test with non-existent service
         response = self.app.get('/services/9999')
@@ -193,6 +341,11 @@ class TestRoutes(unittest.TestCase):
         self.assertIn(b'Welcome', response.data)
         self.assertIn(b'My Bookings', response.data)
         
+        # A malformed page cursor falls back to the first page
+        response = self.app.get('/customer/dashboard?cursor=bogus')
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.location.endswith('/customer/dashboard'))
+        
         # Test unauthorized access
         with self.app.session_transaction() as sess:
             sess.clear()
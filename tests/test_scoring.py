@@ -0,0 +1,187 @@
+import unittest
+import os
+import sys
+import random
+
+# Add the parent directory to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import text
+from werkzeug.security import generate_password_hash
+
+from app import db
+from wsgi import app
+from models import Customer, Provider, ServiceCategory, ProviderCategory, Address
+from provider_index import haversine_km
+from scoring import CategoryColumns, Weights, get_category_columns, rank_providers
+
+DUBLIN = (53.3498, -6.2603)
+
+# (provider_id, lat, lng, rating, price, experience_years, is_available)
+ROWS = [
+    (1, 53.3500, -6.2600, 3.5, 50.0, 2, True),    # next door, average
+    (2, 53.2900, -6.1300, 4.8, 45.0, 20, True),   # ~10 km, excellent and cheap
+    (3, 53.2707, -9.0568, 5.0, 40.0, 20, True),   # Galway, ~190 km
+    (4, 53.3510, -6.2610, 5.0, 30.0, 20, False),  # unavailable
+    (5, None, None, None, 60.0, 0, True),         # no address, unrated
+]
+
+class TestCategoryColumns(unittest.TestCase):
+    def _rank(self, use_numpy, *args, **kwargs):
+        return CategoryColumns(ROWS, use_numpy=use_numpy).rank(*args, **kwargs)
+
+    def _check_rankings(self, use_numpy):
+        ranked = self._rank(use_numpy)
+        self.assertEqual([r.provider_id for r in ranked], [3, 2, 1, 5])
+        self.assertTrue(all(r.distance_km is None for r in ranked))
+
+        # Within 25 km, distance counts and the far provider drops out
+        ranked = self._rank(use_numpy, None, *DUBLIN, radius_km=25)
+        self.assertEqual([r.provider_id for r in ranked], [2, 1])
+        self.assertAlmostEqual(ranked[1].distance_km, 0.03, places=2)
+
+        # Distance dominating the weights puts the nearest first
+        ranked = self._rank(use_numpy, 2, *DUBLIN, radius_km=25, weights=Weights(1, 0, 0, 0))
+        self.assertEqual([r.provider_id for r in ranked], [1, 2])
+
+        # Without a radius nobody is dropped; no address means no distance score
+        ranked = self._rank(use_numpy, 2, *DUBLIN)
+        self.assertEqual([r.provider_id for r in ranked], [2, 1])
+        self.assertEqual(len(self._rank(use_numpy, None, *DUBLIN)), 4)
+
+        self.assertEqual(self._rank(use_numpy, 0), [])
+        self.assertEqual(CategoryColumns([], use_numpy=use_numpy).rank(5, *DUBLIN), [])
+
+    def test_rank_python(self):
+        """Test rankings computed in plain Python"""
+        self._check_rankings(use_numpy=False)
+
+    def test_rank_numpy(self):
+        """Test vectorized rankings"""
+        self._check_rankings(use_numpy=True)
+
+    def test_numpy_matches_python(self):
+        """Test that both engines give the same top k on random data"""
+        rng = random.Random(7)
+        rows = [
+            (i, 53.35 + rng.uniform(-0.2, 0.2), -6.26 + rng.uniform(-0.3, 0.3),
+             rng.choice([None, 3.0, 4.0, 4.5, 5.0]), rng.uniform(20, 90),
+             rng.randint(0, 30), rng.random() > 0.1)
+            for i in range(1, 2001)
+        ]
+        for k, radius in [(10, None), (10, 15), (None, 5)]:
+            expected = CategoryColumns(rows, use_numpy=False).rank(k, *DUBLIN, radius_km=radius)
+            actual = CategoryColumns(rows, use_numpy=True).rank(k, *DUBLIN, radius_km=radius)
+            self.assertEqual([r.provider_id for r in actual], [r.provider_id for r in expected])
+            for a, e in zip(actual, expected):
+                self.assertAlmostEqual(a.score, e.score)
+
+    def test_radius_keeps_every_provider_within(self):
+        """Test that the grid prefilter keeps exactly the providers within the radius"""
+        rng = random.Random(11)
+        rows = [
+            (i, 53.35 + rng.uniform(-0.5, 0.5), -6.26 + rng.uniform(-0.8, 0.8),
+             4.0, 50.0, 5, True)
+            for i in range(1, 1001)
+        ]
+        for use_numpy in (False, True):
+            columns = CategoryColumns(rows, use_numpy=use_numpy)
+            for radius in (0.5, 3, 20, 100):
+                expected = {row[0] for row in rows if haversine_km(*DUBLIN, row[1], row[2]) <= radius}
+                ranked = columns.rank(None, *DUBLIN, radius_km=radius)
+                self.assertEqual({r.provider_id for r in ranked}, expected)
+
+class TestRankProviders(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.client = app.test_client()
+
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        plumbing = ServiceCategory(name="Plumbing", description="Plumbing services")
+        customer = Customer(
+            email="customer@example.com", phone="+353870000000", first_name="Test",
+            last_name="Customer", password_hash=generate_password_hash("password"), is_verified=True
+        )
+        db.session.add_all([plumbing, customer])
+        db.session.commit()
+        self.plumbing_id = plumbing.id
+
+        self.address = Address(
+            customer_id=customer.id, address_line="1 Home St", city="Dublin", state="Dublin",
+            postal_code="D01", latitude=DUBLIN[0], longitude=DUBLIN[1]
+        )
+        db.session.add(self.address)
+
+        self.ids = {}
+        for name, lat, lng, rating, price, experience in [
+            ('Near', 53.3500, -6.2600, 3.0, 50.0, 1),
+            ('Top', 53.2900, -6.1300, 5.0, 50.0, 10),
+        ]:
+            provider = Provider(
+                email=f"{name.lower()}@example.com", phone=f"+35387{len(self.ids)}000000",
+                password_hash="hash", first_name=name, last_name="Provider",
+                verification_document="doc.pdf", avg_rating=rating, experience_years=experience,
+                is_verified=True, is_available=True
+            )
+            db.session.add(provider)
+            db.session.flush()
+            db.session.add_all([
+                ProviderCategory(provider_id=provider.id, category_id=plumbing.id, price_rate=price),
+                Address(provider_id=provider.id, address_line="2 Work St", city="Dublin",
+                        state="Dublin", postal_code="D01", latitude=lat, longitude=lng)
+            ])
+            self.ids[name] = provider.id
+        db.session.commit()
+
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = customer.id
+            sess['user_type'] = 'customer'
+
+    def tearDown(self):
+        """Clean up after tests"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_columns_follow_changes(self):
+        """Test that cached columns are rebuilt after scoring inputs change"""
+        columns = get_category_columns(self.plumbing_id)
+        self.assertIs(get_category_columns(self.plumbing_id), columns)
+        self.assertEqual([r.provider_id for r in rank_providers(self.plumbing_id)],
+                         [self.ids['Top'], self.ids['Near']])
+
+        provider = Provider.query.get(self.ids['Top'])
+        provider.is_available = False
+        db.session.commit()
+        self.assertEqual([r.provider_id for r in rank_providers(self.plumbing_id)], [self.ids['Near']])
+
+    def test_other_processes_writes_seen_after_ttl(self):
+        """Test that changes the commit hooks don't see are picked up when the columns expire"""
+        rank_providers(self.plumbing_id)
+        db.session.execute(text("UPDATE providers SET avg_rating = 1.0 WHERE first_name = 'Top'"))
+        db.session.commit()
+        self.assertEqual(rank_providers(self.plumbing_id)[0].provider_id, self.ids['Top'])
+
+        app.config['SCORING_CACHE_TTL'] = 0
+        try:
+            self.assertEqual(rank_providers(self.plumbing_id)[0].provider_id, self.ids['Near'])
+        finally:
+            del app.config['SCORING_CACHE_TTL']
+
+    def test_search_ranks_by_score(self):
+        """Test that search results are ordered by score from the chosen address"""
+        response = self.client.get(f'/search?category_id={self.plumbing_id}&address_id={self.address.id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(response.data.index(b'Top Provider'), response.data.index(b'Near Provider'))
+
+        # Only distance counting puts the nearest provider first
+        ranked = rank_providers(self.plumbing_id, None, *DUBLIN, weights=Weights(1, 0, 0, 0))
+        self.assertEqual(ranked[0].provider_id, self.ids['Near'])
+
+if __name__ == '__main__':
+    unittest.main()
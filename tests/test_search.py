@@ -0,0 +1,264 @@
+import unittest
+import os
+import sys
+import json
+
+# Add the parent directory to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import text
+
+from app import db
+from wsgi import app
+from models import Customer, Provider, ServiceCategory, ProviderCategory, Address
+from scoring import get_category_columns, invalidate_columns, rank_providers
+from search import find_providers, invalidate_search, iter_providers
+from tests.queries import recorded_statements
+
+DUBLIN = (53.3498, -6.2603)
+
+class TestSearch(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.client = app.test_client()
+
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        plumbing = ServiceCategory(name="Plumbing", description="Plumbing services")
+        customer = Customer(
+            email="customer@example.com", phone="+353870000000", first_name="Test",
+            last_name="Customer", password_hash="hash", is_verified=True
+        )
+        db.session.add_all([plumbing, customer])
+        db.session.commit()
+        self.plumbing_id = plumbing.id
+        self.customer_id = customer.id
+
+        self.ids = {}
+        for name, lat, lng, rating, price, experience, verified in [
+            ('Near', 53.3500, -6.2600, 3.0, 60.0, 1, True),
+            ('Top', 53.2900, -6.1300, 5.0, 50.0, 10, True),
+            ('Cheap', 53.4000, -6.3000, 4.0, 30.0, 4, True),
+            ('Far', 53.2707, -9.0568, None, 40.0, 25, True),
+            ('Unverified', 53.3500, -6.2600, 5.0, 10.0, 30, False),
+        ]:
+            provider = Provider(
+                email=f"{name.lower()}@example.com", phone=f"+35387{len(self.ids)}000000",
+                password_hash="hash", first_name=name, last_name="Provider",
+                verification_document="doc.pdf", avg_rating=rating, experience_years=experience,
+                is_verified=verified, is_available=True
+            )
+            db.session.add(provider)
+            db.session.flush()
+            db.session.add_all([
+                ProviderCategory(provider_id=provider.id, category_id=plumbing.id, price_rate=price),
+                Address(provider_id=provider.id, address_line="2 Work St", city="Dublin",
+                        state="Dublin", postal_code="D01", latitude=lat, longitude=lng)
+            ])
+            self.ids[name] = provider.id
+        db.session.commit()
+
+    def tearDown(self):
+        """Clean up after tests"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _get_uncached(self, url):
+        """Get a page with the search and scoring caches emptied first"""
+        invalidate_search(None)
+        invalidate_columns(None)
+        with recorded_statements() as statements:
+            response = self.client.get(url)
+        return response, len(statements)
+
+    def _names(self, page):
+        return [result.first_name for result in page.results]
+
+    def test_sorts_and_filters(self):
+        """Test the SQL sorts and filters"""
+        self.assertEqual(self._names(find_providers(self.plumbing_id, sort='rating')),
+                         ['Top', 'Cheap', 'Near', 'Far'])
+        self.assertEqual(self._names(find_providers(self.plumbing_id, sort='price')),
+                         ['Cheap', 'Far', 'Top', 'Near'])
+        self.assertEqual(self._names(find_providers(self.plumbing_id, sort='experience')),
+                         ['Far', 'Top', 'Cheap', 'Near'])
+        self.assertEqual(self._names(find_providers(self.plumbing_id, *DUBLIN, sort='distance')),
+                         ['Near', 'Cheap', 'Top', 'Far'])
+
+        page = find_providers(self.plumbing_id, min_rating=4, max_price=55, sort='price')
+        self.assertEqual(self._names(page), ['Cheap', 'Top'])
+        self.assertEqual(page.total, 2)
+
+        page = find_providers(self.plumbing_id, *DUBLIN, radius_km=25, sort='rating')
+        self.assertEqual(self._names(page), ['Top', 'Cheap', 'Near'])
+        self.assertAlmostEqual(page.results[2].distance_km, 0.03, places=2)
+        self.assertEqual(page.results[0].price_rate, 50.0)
+
+        with self.assertRaises(ValueError):
+            find_providers(self.plumbing_id, sort='name')
+
+    def test_score_sort_follows_ranking(self):
+        """Test that the default sort pages through the scoring engine's ranking"""
+        ranked = [r.provider_id for r in rank_providers(self.plumbing_id, None, *DUBLIN, 25)]
+        page = find_providers(self.plumbing_id, *DUBLIN, radius_km=25, per_page=2)
+        self.assertEqual([result.id for result in page.results], ranked[:2])
+        self.assertEqual(page.total, 3)
+        self.assertIsNotNone(page.next_cursor)
+        self.assertIsNotNone(page.results[0].score)
+
+        page = find_providers(self.plumbing_id, *DUBLIN, radius_km=25, cursor=page.next_cursor, per_page=2)
+        self.assertEqual([result.id for result in page.results], ranked[2:])
+        self.assertIsNone(page.next_cursor)
+
+    def test_cursor_pagination(self):
+        """Test following cursors through every sort"""
+        for sort in ('score', 'rating', 'price', 'experience', 'distance'):
+            expected = self._names(find_providers(self.plumbing_id, *DUBLIN, sort=sort))
+            names, cursor = [], None
+            while True:
+                page = find_providers(self.plumbing_id, *DUBLIN, sort=sort, cursor=cursor, per_page=1)
+                names.extend(self._names(page))
+                cursor = page.next_cursor
+                if cursor is None:
+                    break
+            self.assertEqual(names, expected, sort)
+
+        page = find_providers(self.plumbing_id, sort='rating', per_page=3)
+        self.assertEqual(page.total, 4)
+        page = find_providers(self.plumbing_id, sort='rating', cursor=page.next_cursor, per_page=3)
+        self.assertEqual((self._names(page), page.next_cursor), (['Far'], None))
+
+        # Cursors only work with the sort that made them
+        rating_cursor = find_providers(self.plumbing_id, sort='rating', per_page=1).next_cursor
+        with self.assertRaises(ValueError):
+            find_providers(self.plumbing_id, sort='price', cursor=rating_cursor)
+        with self.assertRaises(ValueError):
+            find_providers(self.plumbing_id, sort='rating', cursor='not-a-cursor')
+
+    def test_rating_cursor_is_stable(self):
+        """Test that a rating change between pages neither repeats nor skips others"""
+        page = find_providers(self.plumbing_id, sort='rating', per_page=2)
+        self.assertEqual(self._names(page), ['Top', 'Cheap'])
+
+        # Near jumps above the providers already shown
+        provider = Provider.query.get(self.ids['Near'])
+        provider.avg_rating = 5.0
+        provider.rating_count = 3
+        db.session.commit()
+
+        page = find_providers(self.plumbing_id, sort='rating', cursor=page.next_cursor, per_page=2)
+        self.assertEqual(self._names(page), ['Far'])
+
+    def test_cached_until_providers_change(self):
+        """Test that pages are served from the cache until a relevant write"""
+        with recorded_statements() as statements:
+            page = find_providers(self.plumbing_id, sort='rating')
+        self.assertEqual(len(statements), 1)
+
+        with recorded_statements() as statements:
+            cached = find_providers(self.plumbing_id, sort='rating')
+        self.assertIs(cached, page)
+        self.assertEqual(statements, [])
+
+        # A customer's new address doesn't move any provider
+        db.session.add(Address(customer_id=self.customer_id, address_line="1 Home St", city="Dublin",
+                               state="Dublin", postal_code="D01"))
+        db.session.commit()
+        self.assertIs(find_providers(self.plumbing_id, sort='rating'), page)
+
+        provider = Provider.query.get(self.ids['Near'])
+        provider.avg_rating = 4.5
+        db.session.commit()
+        self.assertEqual(self._names(find_providers(self.plumbing_id, sort='rating')),
+                         ['Top', 'Near', 'Cheap', 'Far'])
+
+        pc = ProviderCategory.query.filter_by(provider_id=self.ids['Cheap']).first()
+        pc.price_rate = 70.0
+        db.session.commit()
+        self.assertEqual(find_providers(self.plumbing_id, sort='rating').results[2].price_rate, 70.0)
+
+    def test_other_processes_writes_seen_after_ttl(self):
+        """Test that changes the commit hooks don't see are picked up when pages expire"""
+        app.config['SCORING_CACHE_TTL'] = 0
+        try:
+            self.assertIn('Top', self._names(find_providers(self.plumbing_id)))
+            db.session.execute(text("UPDATE providers SET is_available = 0 WHERE first_name = 'Top'"))
+            db.session.commit()
+            self.assertIn('Top', self._names(find_providers(self.plumbing_id)))
+
+            app.config['SEARCH_CACHE_TTL'] = 0
+            self.assertNotIn('Top', self._names(find_providers(self.plumbing_id)))
+            self.assertNotIn('Top', self._names(find_providers(self.plumbing_id, sort='rating')))
+        finally:
+            del app.config['SCORING_CACHE_TTL']
+            app.config.pop('SEARCH_CACHE_TTL', None)
+
+    def test_listing_pages_have_no_n_plus_one(self):
+        """Test that the service and search pages read providers without per-row queries"""
+        self.client.get(f'/services/{self.plumbing_id}')
+        response, first = self._get_uncached(f'/services/{self.plumbing_id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Cheap Provider', response.data)
+        self.assertIn('€30.0'.encode(), response.data)
+        self.assertNotIn(b'Unverified Provider', response.data)
+
+        # More providers in the category don't add queries
+        for i in range(5):
+            provider = Provider(
+                email=f"extra{i}@example.com", phone=f"+35386{i}000000", password_hash="hash",
+                first_name=f"Extra{i}", last_name="Provider", verification_document="doc.pdf",
+                is_verified=True, is_available=True
+            )
+            db.session.add(provider)
+            db.session.flush()
+            db.session.add(ProviderCategory(provider_id=provider.id, category_id=self.plumbing_id, price_rate=45))
+        db.session.commit()
+
+        self.client.get(f'/services/{self.plumbing_id}')
+        response, second = self._get_uncached(f'/services/{self.plumbing_id}')
+        self.assertIn(b'Extra4 Provider', response.data)
+        self.assertEqual(second, first)
+
+        response = self.client.get(f'/search?category_id={self.plumbing_id}&sort=price&max_price=40')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Found 2 service providers', response.data)
+        self.assertLess(response.data.index(b'Cheap Provider'), response.data.index(b'Far Provider'))
+
+    def test_stream_search_results(self):
+        """Test streaming every matching provider as JSON"""
+        response = self.client.get(f'/search/stream?category_id={self.plumbing_id}&sort=price')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed)
+        data = json.loads(response.get_data())
+        self.assertEqual(data['category']['name'], 'Plumbing')
+        self.assertEqual([p['name'] for p in data['providers']],
+                         ['Cheap Provider', 'Far Provider', 'Top Provider', 'Near Provider'])
+        self.assertEqual(data['providers'][0]['price_rate'], 30.0)
+
+        # Batches are followed by cursor
+        self.assertEqual([r.first_name for r in iter_providers(self.plumbing_id, sort='rating', batch_size=1)],
+                         ['Top', 'Cheap', 'Near', 'Far'])
+
+        # The score sort is ranked once, not once per batch
+        columns = get_category_columns(self.plumbing_id)
+        rankings = []
+        rank = columns.rank
+        columns.rank = lambda *args, **kwargs: rankings.append(args) or rank(*args, **kwargs)
+        try:
+            streamed = [r.id for r in iter_providers(self.plumbing_id, batch_size=1)]
+        finally:
+            del columns.rank
+        self.assertEqual(len(rankings), 1)
+        self.assertEqual(streamed, [r.id for r in find_providers(self.plumbing_id, per_page=10).results])
+        self.assertEqual(len(streamed), 4)
+
+        response = self.client.get('/search/stream?category_id=9999')
+        self.assertEqual(response.status_code, 404)
+
+if __name__ == '__main__':
+    unittest.main()
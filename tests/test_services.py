@@ -6,12 +6,20 @@ from datetime import datetime, timedelta
 # Add the parent directory to the path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from app import app, db
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from wsgi import app
 from models import Customer, Provider, ServiceCategory, ProviderCategory, Address, Booking, Payment, OTPVerification
 from services import (
     find_matching_providers, generate_otp, verify_otp, update_provider_rating,
-    check_booking_conflicts, cancel_booking, validate_booking_data, get_available_time_slots
+    check_booking_conflicts, cancel_booking, validate_booking_data, get_available_time_slots,
+    record_provider_rating, reconcile_provider_ratings, purge_expired_otps, book_time_slot,
+    get_booking_page
 )
+from pagination import encode_cursor
+from tests.queries import recorded_statements
 
 class TestServices(unittest.TestCase):
     def setUp(self):
@@ -210,6 +218,43 @@ class TestServices(unittest.TestCase):
         db.session.commit()
         self.assertFalse(verify_otp(self.customer_id, '345678', 'customer'))
 
+    def test_verify_otp_uses_index(self):
+        """Test that the verify lookup is answered from the composite index"""
+        plan = db.session.execute(db.text(
+            "EXPLAIN QUERY PLAN SELECT * FROM otp_verifications "
+            "WHERE user_id = 1 AND user_type = 'customer' AND is_used = 0 "
+            "ORDER BY created_at DESC LIMIT 1"
+        )).fetchall()
+        details = ' '.join(row[-1] for row in plan)
+        self.assertIn('ix_otp_user_active', details)
+        self.assertNotIn('TEMP B-TREE', details)
+
+    def test_purge_expired_otps(self):
+        """Test batched deletion of expired OTP records"""
+        now = datetime.utcnow()
+        for i in range(5):
+            db.session.add(OTPVerification(
+                user_id=self.customer_id,
+                user_type='customer',
+                otp_code='123456',
+                expires_at=now - timedelta(minutes=i + 1),
+                is_used=i % 2 == 0
+            ))
+        db.session.add(OTPVerification(
+            user_id=self.customer_id,
+            user_type='customer',
+            otp_code='654321',
+            expires_at=now + timedelta(minutes=10)
+        ))
+        db.session.commit()
+        
+        self.assertEqual(purge_expired_otps(batch_size=2, now=now), 5)
+        remaining = OTPVerification.query.all()
+        self.assertEqual([otp.otp_code for otp in remaining], ['654321'])
+        
+        # The active code still verifies
+        self.assertTrue(verify_otp(self.customer_id, '654321', 'customer'))
+
     def test_update_provider_rating(self):
         """Test updating a provider's average rating"""
         # Create bookings with different ratings
@@ -271,6 +316,60 @@ class TestServices(unittest.TestCase):
         provider = Provider.query.get(provider.id)
         self.assertEqual(provider.avg_rating, 4.0)
 
+    def test_record_provider_rating(self):
+        """Test adding ratings to a provider's running aggregates"""
+        self.assertTrue(record_provider_rating(self.provider2_id, 5))
+        db.session.commit()
+        self.assertTrue(record_provider_rating(self.provider2_id, 2))
+        db.session.commit()
+        
+        provider = Provider.query.get(self.provider2_id)
+        self.assertEqual(provider.rating_sum, 7)
+        self.assertEqual(provider.rating_count, 2)
+        self.assertEqual(provider.avg_rating, 3.5)
+        
+        # Unknown provider
+        self.assertFalse(record_provider_rating(9999, 5))
+
+    def test_reconcile_provider_ratings(self):
+        """Test detecting and repairing drifted rating aggregates"""
+        address = Address.query.filter_by(customer_id=self.customer_id).first()
+        for time_slot, rating in [("10:00", 5), ("11:00", 2)]:
+            db.session.add(Booking(
+                customer_id=self.customer_id,
+                provider_id=self.provider1_id,
+                category_id=self.plumbing_id,
+                address_id=address.id,
+                booking_date=datetime.utcnow().date() - timedelta(days=1),
+                time_slot=time_slot,
+                status="completed",
+                rating=rating
+            ))
+        db.session.commit()
+        
+        # Provider 1 has bookings but no aggregates; provider 2 has a
+        # rating without any rated bookings, which is left alone
+        drifted = reconcile_provider_ratings(repair=False)
+        self.assertEqual(drifted, [self.provider1_id])
+        self.assertEqual(Provider.query.get(self.provider1_id).rating_count, 0)
+        avg_rating = Provider.query.get(self.provider2_id).avg_rating
+        self.assertIsNotNone(avg_rating)
+        
+        drifted = reconcile_provider_ratings()
+        self.assertEqual(drifted, [self.provider1_id])
+        
+        provider1 = Provider.query.get(self.provider1_id)
+        self.assertEqual(provider1.rating_count, 2)
+        self.assertEqual(provider1.rating_sum, 7)
+        self.assertEqual(provider1.avg_rating, 3.5)
+        
+        provider2 = Provider.query.get(self.provider2_id)
+        self.assertEqual(provider2.rating_count, 0)
+        self.assertEqual(provider2.avg_rating, avg_rating)
+        
+        # Nothing left to repair
+        self.assertEqual(reconcile_provider_ratings(), [])
+
     def test_check_booking_conflicts(self):
         """Test checking for booking conflicts"""
         # Create a booking
@@ -427,6 +526,110 @@ class TestServices(unittest.TestCase):
         self.assertFalse(is_valid)
         self.assertIn('time_slot', errors)
 
+    def test_book_time_slot(self):
+        """Test that a slot can only be held by one active booking"""
+        tomorrow = datetime.utcnow().date() + timedelta(days=1)
+        data = {
+            'customer_id': self.customer_id,
+            'provider_id': self.provider1_id,
+            'category_id': self.plumbing_id,
+            'address_id': self.customer_address_id,
+            'booking_date': tomorrow.strftime('%Y-%m-%d'),
+            'time_slot': '10:00'
+        }
+        
+        booking, errors = book_time_slot(data)
+        self.assertEqual(errors, {})
+        self.assertEqual(booking.time_slot, '10:00-11:00')
+        self.assertEqual(booking.status, 'pending')
+        
+        # Same slot, either spelling, is rejected by the database
+        for time_slot in ('10:00', '10:00-11:00'):
+            booking, errors = book_time_slot(dict(data, time_slot=time_slot))
+            self.assertIsNone(booking)
+            self.assertIn('time_slot', errors)
+        self.assertEqual(Booking.query.count(), 1)
+        
+        # Another provider, or the slot after cancellation, is free
+        booking, errors = book_time_slot(dict(data, provider_id=self.provider2_id))
+        self.assertEqual(errors, {})
+        
+        cancel_booking(Booking.query.filter_by(provider_id=self.provider1_id).first().id)
+        booking, errors = book_time_slot(data)
+        self.assertEqual(errors, {})
+        
+        booking, errors = book_time_slot(dict(data, time_slot='12:00'))
+        self.assertIsNone(booking)
+        self.assertIn('time_slot', errors)
+
+    def test_book_time_slot_reraises_other_integrity_errors(self):
+        """Test that only slot conflicts are reported as an already booked slot"""
+        db.session.execute(text(
+            "CREATE TRIGGER reject_bookings BEFORE INSERT ON bookings "
+            "BEGIN SELECT RAISE(ABORT, 'booking_date is a holiday'); END"
+        ))
+        db.session.commit()
+        tomorrow = datetime.utcnow().date() + timedelta(days=1)
+        data = {
+            'customer_id': self.customer_id,
+            'provider_id': self.provider1_id,
+            'category_id': self.plumbing_id,
+            'address_id': self.customer_address_id,
+            'booking_date': tomorrow.strftime('%Y-%m-%d'),
+            'time_slot': '10:00'
+        }
+        
+        with self.assertRaises(IntegrityError):
+            book_time_slot(data)
+        self.assertEqual(Booking.query.count(), 0)
+
+    def test_get_booking_page(self):
+        """Test keyset pagination of a customer's bookings"""
+        # Several bookings share a creation time; id breaks the tie
+        created = datetime(2024, 1, 1, 12, 0)
+        tomorrow = datetime.utcnow().date() + timedelta(days=1)
+        for i in range(5):
+            db.session.add(Booking(
+                customer_id=self.customer_id,
+                provider_id=self.provider1_id,
+                category_id=self.plumbing_id,
+                address_id=self.customer_address_id,
+                booking_date=tomorrow + timedelta(days=i),
+                time_slot='10:00-11:00',
+                created_at=created if i < 3 else created + timedelta(hours=i)
+            ))
+        db.session.commit()
+        db.session.expunge_all()
+        
+        customer = Customer.query.get(self.customer_id)
+        expected = [b.id for b in Booking.query.order_by(Booking.created_at.desc(), Booking.id.desc())]
+        db.session.expunge_all()
+        
+        with recorded_statements() as statements:
+            seen = []
+            cursor = None
+            while True:
+                page = get_booking_page(customer, cursor, per_page=2)
+                for booking in page.items:
+                    # Related rows come with the page
+                    booking.provider.get_full_name(), booking.category.name, booking.address.city, booking.payment
+                    seen.append(booking.id)
+                cursor = page.next_cursor
+                if cursor is None:
+                    break
+        
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(statements), 3)
+        
+        for bad_cursor in ('not-a-cursor',
+                           encode_cursor(['2024-01-01T00:00:00', [1]]),
+                           encode_cursor(['2024-01-01T00:00:00', '1']),
+                           encode_cursor(['2024-01-01T00:00:00', True]),
+                           encode_cursor(['yesterday', 1]),
+                           encode_cursor([20240101, 1])):
+            with self.assertRaises(ValueError):
+                get_booking_page(customer, bad_cursor)
+
     def test_get_available_time_slots(self):
         """Test getting available time slots for a provider"""
         provider = Provider.query.get(self.provider1_id)
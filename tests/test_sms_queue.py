@@ -0,0 +1,195 @@
+import unittest
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+# Add the parent directory to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import db
+from wsgi import app
+from models import SMSJob
+from services import generate_otp
+from sms_queue import enqueue_sms, process_due_jobs, purge_finished_jobs, retry_delay, MAX_ATTEMPTS, RETENTION
+from sms_transport import FakeTransport, get_transport, normalize_phone_number
+
+class TestSMSQueue(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.transport = FakeTransport()
+
+    def tearDown(self):
+        """Clean up after tests"""
+        os.environ.pop('SMS_TRANSPORT', None)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_normalize_phone_number(self):
+        """Test E.164 normalization of phone numbers"""
+        self.assertEqual(normalize_phone_number('353 86-123 4567'), '+353861234567')
+        self.assertEqual(normalize_phone_number('+353 (86) 1234567'), '+353861234567')
+        self.assertIsNone(normalize_phone_number('12345'))
+        self.assertIsNone(normalize_phone_number(''))
+
+    def test_generate_otp_queues_sms(self):
+        """Test that generate_otp queues the SMS instead of sending it"""
+        os.environ['SMS_TRANSPORT'] = 'fake'
+
+        otp_code, error = generate_otp('+353 86 123 4567')
+        self.assertIsNone(error)
+        db.session.commit()
+
+        job = SMSJob.query.one()
+        self.assertEqual(job.phone, '+353861234567')
+        self.assertIn(otp_code, job.body)
+        self.assertEqual(job.status, 'pending')
+
+        otp_code, error = generate_otp('123')
+        self.assertIsNone(otp_code)
+        self.assertIn('invalid', error)
+
+    def test_process_due_jobs(self):
+        """Test sending queued jobs"""
+        enqueue_sms('+353861234567', 'Hello')
+        enqueue_sms('+353861234568', 'World')
+        db.session.commit()
+
+        self.assertEqual(process_due_jobs(self.transport), 2)
+        self.assertEqual(sorted(self.transport.sent), [('+353861234567', 'Hello'), ('+353861234568', 'World')])
+        self.assertEqual({job.status for job in SMSJob.query.all()}, {'sent'})
+
+        # Sent jobs are not sent again
+        self.assertEqual(process_due_jobs(self.transport), 0)
+
+    def test_retry_with_backoff(self):
+        """Test that transient failures are retried later"""
+        job = enqueue_sms('+353861234567', 'Hello')
+        db.session.commit()
+
+        now = datetime.utcnow()
+        self.transport.fail_next(times=2)
+        self.assertEqual(process_due_jobs(self.transport, now=now), 1)
+
+        job = SMSJob.query.get(job.id)
+        self.assertEqual(job.status, 'pending')
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(job.next_attempt_at, now + retry_delay(1))
+
+        # Not due yet
+        self.assertEqual(process_due_jobs(self.transport, now=now), 0)
+
+        now += retry_delay(1)
+        process_due_jobs(self.transport, now=now)
+        self.assertEqual(SMSJob.query.get(job.id).next_attempt_at, now + retry_delay(2))
+        self.assertGreater(retry_delay(2), retry_delay(1))
+
+        now += retry_delay(2)
+        process_due_jobs(self.transport, now=now)
+        job = SMSJob.query.get(job.id)
+        self.assertEqual(job.status, 'sent')
+        self.assertEqual(job.attempts, 3)
+        self.assertEqual(len(self.transport.sent), 1)
+
+    def test_failed_jobs(self):
+        """Test that permanent failures and exhausted retries fail the job"""
+        permanent = enqueue_sms('+353861234567', 'Hello')
+        exhausted = enqueue_sms('+353861234568', 'World')
+        db.session.commit()
+
+        self.transport.fail_next(permanent=True)
+        process_due_jobs(self.transport, limit=1)
+        self.assertEqual(SMSJob.query.get(permanent.id).status, 'failed')
+        self.assertEqual(SMSJob.query.get(permanent.id).attempts, 1)
+
+        now = datetime.utcnow()
+        self.transport.fail_next(times=MAX_ATTEMPTS)
+        for attempt in range(MAX_ATTEMPTS):
+            process_due_jobs(self.transport, now=now)
+            now += retry_delay(attempt + 1)
+
+        job = SMSJob.query.get(exhausted.id)
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.attempts, MAX_ATTEMPTS)
+        self.assertEqual(self.transport.sent, [])
+
+    def test_purge_finished_jobs(self):
+        """Test that sent and failed jobs are deleted once past retention"""
+        now = datetime.utcnow()
+        old = now - RETENTION - timedelta(minutes=1)
+        for i, status in enumerate(['sent', 'failed', 'sent', 'pending']):
+            db.session.add(SMSJob(phone='+353861234567', body=f'Code {i}', status=status, created_at=old))
+        db.session.add(SMSJob(phone='+353861234567', body='Recent', status='sent', created_at=now))
+        db.session.commit()
+
+        self.assertEqual(purge_finished_jobs(batch_size=2, now=now), 3)
+        self.assertEqual(sorted(job.body for job in SMSJob.query), ['Code 3', 'Recent'])
+
+        result = app.test_cli_runner().invoke(args=['purge-otps'])
+        self.assertIn('Deleted 0 sent or failed SMS jobs', result.output)
+
+    def test_leased_job_is_skipped(self):
+        """Test that a job claimed by another worker is not sent twice"""
+        job = enqueue_sms('+353861234567', 'Hello')
+        job.locked_until = datetime.utcnow() + timedelta(seconds=30)
+        db.session.commit()
+
+        self.assertEqual(process_due_jobs(self.transport), 0)
+
+        # Once the lease runs out the job is picked up again
+        later = datetime.utcnow() + timedelta(seconds=60)
+        self.assertEqual(process_due_jobs(self.transport, now=later), 1)
+        self.assertEqual(len(self.transport.sent), 1)
+
+    def test_send_batch_concurrency_limit(self):
+        """Test that batch sends overlap but stay within the concurrency limit"""
+        transport = FakeTransport(max_concurrency=3, latency=0.05)
+        peak = []
+        original_send = transport._send
+
+        def tracking_send(to, body):
+            peak.append(transport.metrics.snapshot()['in_flight'])
+            return original_send(to, body)
+
+        transport._send = tracking_send
+        transport.fail_next(permanent=True)
+
+        start = time.perf_counter()
+        results = transport.send_batch([(f'+35386123456{i}', 'Hello') for i in range(6)])
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(sum(isinstance(r, Exception) for r in results), 1)
+        self.assertLessEqual(max(peak), 3)
+        self.assertGreater(max(peak), 1)
+        self.assertLess(elapsed, 6 * 0.05)
+
+        metrics = transport.metrics.snapshot()
+        self.assertEqual((metrics['sent'], metrics['failed'], metrics['in_flight']), (5, 1, 0))
+        self.assertGreaterEqual(metrics['max_ms'], 50)
+        transport.close()
+
+    def test_shared_transport(self):
+        """Test that the configured transport is created once and reused"""
+        os.environ['SMS_TRANSPORT'] = 'fake'
+        transport = get_transport()
+        self.assertIsInstance(transport, FakeTransport)
+
+        seen = []
+        threads = [threading.Thread(target=lambda: seen.append(get_transport())) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertTrue(all(t is transport for t in seen))
+
+if __name__ == '__main__':
+    unittest.main()
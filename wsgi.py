@@ -0,0 +1,5 @@
+"""The application served by `flask run` and WSGI servers (wsgi:app)."""
+
+from app import create_app
+
+app = create_app()